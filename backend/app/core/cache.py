@@ -0,0 +1,114 @@
+"""
+In-process result caches for the read endpoints.
+
+Callers key entries on the ingestion generation of the data a result was
+computed from (app.core.database.current_generation) plus the request
+parameters. New data committed by ingestion therefore makes older entries
+unreachable at once; they age out of the LRU. The TTL bounds how long any
+entry is served, as a backstop for writes made outside ingestion (e.g. a
+manage.py command run in another process).
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+from app.core.config import settings
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache of at most `maxsize` results, each served for at
+    most `ttl` seconds, with hit / miss / eviction counters.
+    Cached values are shared between callers and must not be mutated.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Cached value for key, computing and storing it on a miss. Concurrent
+        misses on one key may each compute it; the last result is kept.
+        """
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.put(key, value)
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._entries),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+_caches: Dict[str, ResultCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(name: str, maxsize: Optional[int] = None) -> ResultCache:
+    """
+    The named cache, created on first use with maxsize entries (default
+    settings.RESULT_CACHE_SIZE) and settings.RESULT_CACHE_TTL.
+    """
+    with _caches_lock:
+        cache = _caches.get(name)
+        if cache is None:
+            cache = ResultCache(
+                name,
+                maxsize or settings.RESULT_CACHE_SIZE,
+                settings.RESULT_CACHE_TTL
+            )
+            _caches[name] = cache
+        return cache
+
+
+def cache_stats() -> List[Dict[str, Any]]:
+    """
+    Counters of every cache, by name.
+    """
+    with _caches_lock:
+        caches = sorted(_caches.values(), key=lambda cache: cache.name)
+    return [cache.stats() for cache in caches]
@@ -1,3 +1,4 @@
+import os
 from pathlib import Path
 
 
@@ -19,16 +20,88 @@ class Settings:
     # Report output directory
     REPORTS_DIR = BASE_DIR / "reports"
 
+    # Spooled uploads for background ingest jobs
+    JOBS_DIR = DATA_DIR / "jobs"
+
+    # Background job state, in its own file: an ingest job holds the main
+    # database's write lock for the whole upload, and job status writes
+    # must not wait for it
+    JOBS_DATABASE_PATH = DATA_DIR / "jobs.db"
+    JOB_WRITE_ATTEMPTS = 5      # tries per job status write, with backoff
+
+    # Per-case storage (app.core.database): when enabled, each case_id gets
+    # its own SQLite file in CASES_DIR; events without a case stay in
+    # DATABASE_PATH. `python manage.py archive-case <case_id>` moves a
+    # closed case to ARCHIVE_DIR; `split-cases` moves existing cases out
+    # of the main database.
+    CASE_SHARDS = False
+    CASES_DIR = DATA_DIR / "cases"
+    ARCHIVE_DIR = DATA_DIR / "archive"
+
+    # SQLite connection pool and per-connection PRAGMAs
+    DB_POOL_SIZE = 8
+    DB_POOL_TIMEOUT = 30                # seconds to wait for a free connection
+    SQLITE_BUSY_TIMEOUT_MS = 5000       # wait on a locked database before failing
+    SQLITE_MMAP_SIZE = 268435456        # 256 MiB memory-mapped I/O
+    SQLITE_CACHE_SIZE = -65536          # negative = KiB, i.e. 64 MiB page cache
+
+    # Executors for blocking work (see app.core.executors)
+    IO_WORKERS = 8                                      # threads: SQLite, parsing, PDFs
+    CPU_WORKERS = max(1, (os.cpu_count() or 2) - 1)     # processes: graph centrality
+    JOB_WORKERS = 2                                     # threads: background jobs
+    SHARD_WORKERS = 8                                   # threads: per-case fan-out queries
+
     # Risk scoring weights (Behavioral Model)
     LATE_NIGHT_WEIGHT = 40
     DELETED_WEIGHT = 40
     FINANCIAL_WEIGHT = 20
 
+    # Financial keyword detection (app.services.keyword_matcher).
+    # Terms under "*" apply to every language; other keys add terms for
+    # events whose language matches (case-insensitive), e.g. "Hinglish".
+    # Run `python manage.py rebuild-risk-stats` after changing these.
+    FINANCIAL_KEYWORDS = {
+        "*": ["transfer", "amount", "payment", "cash", "wire", "deposit"],
+    }
+    FINANCIAL_KEYWORDS_WORD_BOUNDARY = False    # True: match whole words only
+
     # Risk thresholds
     MIN_MESSAGES_THRESHOLD = 20
     HIGH_RISK_THRESHOLD = 40
     MEDIUM_RISK_THRESHOLD = 25
 
+    # Ingestion batching
+    INSERT_BATCH_SIZE = 5000    # rows per executemany call
+    LOOKUP_BATCH_SIZE = 500     # event_ids per duplicate lookup query
+    STREAM_CHUNK_SIZE = 50000   # rows held in memory per chunk in streaming mode
+    INGEST_MAX_IN_FLIGHT = 2 * CPU_WORKERS  # files/chunks being parsed at once
+    TIMESTAMP_SAMPLE_SIZE = 1000    # rows sampled to detect the timestamp format
+
+    # Rows per fetchmany call when streaming NDJSON exports
+    STREAM_FETCH_SIZE = 1000
+
+    # In-process result caches (app.core.cache), invalidated by the
+    # ingestion generation: entries per cache and seconds an entry is served
+    RESULT_CACHE_SIZE = 64      # /stats and /suspicious-users results
+    GRAPH_CACHE_SIZE = 32       # /graph results, which are larger
+    RESULT_CACHE_TTL = 300
+
+    # Betweenness centrality: graphs above either limit are sampled in "auto" mode
+    BETWEENNESS_EXACT_MAX_NODES = 2000
+    BETWEENNESS_EXACT_MAX_EDGES = 20000
+    BETWEENNESS_SAMPLE_SIZE = 100   # k pivot nodes for sampled estimation
+    BETWEENNESS_SEED = 42           # fixed seed so sampled results are repeatable
+
+    # In-memory graphs kept up to date by edge deltas (one per case and
+    # min_edge_weight; see app.services.graph_engine.GraphSnapshot)
+    GRAPH_SNAPSHOTS = 8
+
+    # /graph backend: "networkx" (the snapshots above) or "csr"
+    # (app.services.csr_graph: integer node ids and sparse adjacency
+    # arrays for very large cases; requires scipy)
+    GRAPH_BACKEND = "networkx"
+    CSR_BATCH_CELLS = 1 << 20   # nodes x sources per betweenness batch: 8 MiB per array
+
 
 # Create a single settings instance
 settings = Settings()
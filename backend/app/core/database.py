@@ -1,46 +1,411 @@
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, TypeVar
+from urllib.parse import quote, unquote
 from app.core.config import settings
+from app.core.executors import shard_executor
 
 
-def get_connection():
+T = TypeVar("T")
+
+
+def _connect(path: Path) -> sqlite3.Connection:
     """
-    Returns a SQLite connection with row factory enabled.
+    Opens a SQLite connection with row factory enabled and the
+    per-connection PRAGMAs applied.
     """
-    # Ensure data directory exists
-    settings.DATA_DIR.mkdir(exist_ok=True)
-
-    conn = sqlite3.connect(settings.DATABASE_PATH)
+    # Not bound to the creating thread: pooled connections are checked
+    # out by whichever worker thread serves the request, one at a time
+    conn = sqlite3.connect(path, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+
+    # WAL lets readers proceed while an ingestion transaction is open
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA busy_timeout = {int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+    conn.execute(f"PRAGMA mmap_size = {int(settings.SQLITE_MMAP_SIZE)}")
+    conn.execute(f"PRAGMA cache_size = {int(settings.SQLITE_CACHE_SIZE)}")
+    conn.execute("PRAGMA temp_store = MEMORY")
     return conn
 
 
-def create_tables():
+class ConnectionPool:
+    """
+    Fixed-size, thread-safe pool of SQLite connections to one database file.
+    Connections are opened lazily up to `size`; when all are checked out,
+    acquire() waits up to `timeout` seconds for one to be released.
+    """
+
+    def __init__(self, path: Path, size: int, timeout: float):
+        self.path = path
+        self.size = size
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._opened = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> sqlite3.Connection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            if self._opened < self.size:
+                self._opened += 1
+                try:
+                    return _connect(self.path)
+                except Exception:
+                    self._opened -= 1
+                    raise
+
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(
+                f"No database connection available within {self.timeout}s "
+                f"(pool size {self.size})"
+            )
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        # Never hand out a connection with a half-finished transaction
+        if conn.in_transaction:
+            conn.rollback()
+        conn.row_factory = sqlite3.Row
+        self._idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._lock:
+            self._opened = 0
+
+
+_pools: Dict[Path, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(path: Optional[Path] = None) -> ConnectionPool:
+    """
+    Returns the connection pool for a database file (the main database
+    by default), creating it on first use.
+    """
+    path = Path(path or settings.DATABASE_PATH)
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            pool = ConnectionPool(
+                path, settings.DB_POOL_SIZE, settings.DB_POOL_TIMEOUT
+            )
+            _pools[path] = pool
+        return pool
+
+
+def close_pools() -> None:
     """
-    Creates the unified events table if it does not exist.
+    Closes every idle pooled connection (application shutdown).
     """
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.close()
+        _pools.clear()
+    with _schema_lock:
+        _schema_ready.clear()
 
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    cursor.execute("""
-        CREATE TABLE IF NOT EXISTS events (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            event_id TEXT UNIQUE,
-            case_id TEXT,
-            source_type TEXT,
-            event_type TEXT,
-            timestamp TEXT,
-            actor_id TEXT,
-            target_id TEXT,
-            message_text TEXT,
-            deleted_flag INTEGER DEFAULT 0,
-            language TEXT,
-            device_id TEXT,
-            ip_address TEXT,
-            metadata TEXT
-        )
-    """)
+@contextmanager
+def pooled_connection(path: Optional[Path] = None) -> Iterator[sqlite3.Connection]:
+    """
+    Checks a connection out of the pool for the duration of the block.
+    """
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        yield conn
+    finally:
+        pool.release(conn)
+
+
+def get_db() -> Iterator[sqlite3.Connection]:
+    """
+    FastAPI dependency providing a pooled connection for one request.
+    """
+    with pooled_connection() as conn:
+        yield conn
 
-    conn.commit()
-    conn.close()
+
+def iter_rows(cursor: sqlite3.Cursor, size: Optional[int] = None) -> Iterator[sqlite3.Row]:
+    """
+    Yields the rows of an executed cursor in fetchmany batches of
+    settings.STREAM_FETCH_SIZE, closing the cursor when exhausted or when
+    the consumer stops early. Select only the columns the caller reads:
+    memory then scales with the batch, not with the result.
+    """
+    try:
+        while True:
+            batch = cursor.fetchmany(size or settings.STREAM_FETCH_SIZE)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        cursor.close()
+
+
+def create_tables(path: Optional[Path] = None):
+    """
+    Creates the unified events table if it does not exist, then applies
+    pending schema migrations (aggregate tables, indexes), in the main
+    database or in the database file at path (a case shard).
+    """
+    # Imported here: migrations use the engines, which import this module
+    from app.core.migrations import apply_migrations
+
+    with pooled_connection(path) as conn:
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT UNIQUE,
+                case_id TEXT,
+                source_type TEXT,
+                event_type TEXT,
+                timestamp TEXT,
+                actor_id TEXT,
+                target_id TEXT,
+                message_text TEXT,
+                deleted_flag INTEGER DEFAULT 0,
+                language TEXT,
+                device_id TEXT,
+                ip_address TEXT,
+                metadata TEXT
+            )
+        """)
+
+        conn.commit()
+
+        apply_migrations(conn)
+
+    with _schema_lock:
+        _schema_ready.add(Path(path or settings.DATABASE_PATH))
+
+
+# ---- Per-case shards (settings.CASE_SHARDS) ----
+# Each case's events, aggregates and generations live in their own file
+# under CASES_DIR with the full schema; events without a case_id stay in
+# the main database. A shard is created by the first ingestion of its
+# case and migrated the first time this process opens it.
+_schema_ready: Set[Path] = set()
+_schema_lock = threading.Lock()
+
+
+def case_db_path(case_id: Optional[str] = None) -> Path:
+    """
+    Database file that stores case_id's events: its shard in sharded mode,
+    otherwise (or without a case_id) the main database.
+    """
+    if settings.CASE_SHARDS and case_id:
+        return Path(settings.CASES_DIR) / f"{quote(case_id, safe='')}.db"
+    return Path(settings.DATABASE_PATH)
+
+
+def shard_paths() -> Dict[str, Path]:
+    """
+    Every active database keyed by shard name: "" for the main database,
+    then each case shard in CASES_DIR by case_id. Archived cases are not
+    included. Without sharding, only the main database.
+    """
+    shards = {"": Path(settings.DATABASE_PATH)}
+    directory = Path(settings.CASES_DIR)
+    if settings.CASE_SHARDS and directory.is_dir():
+        for path in sorted(directory.glob("*.db")):
+            shards[unquote(path.stem)] = path
+    return shards
+
+
+def spans_shards(case_id: Optional[str] = None) -> bool:
+    """
+    True when a query over case_id (None = all cases) has to fan out
+    across shards rather than read the connection it was given.
+    """
+    return bool(settings.CASE_SHARDS) and not case_id
+
+
+def ensure_schema(path: Path) -> None:
+    """
+    Creates or migrates the schema of the database at path, once per process.
+    """
+    with _schema_lock:
+        ready = path in _schema_ready
+    if not ready:
+        create_tables(path)
+
+
+def resolve_case_db(case_id: Optional[str] = None, create: bool = False) -> Path:
+    """
+    Database file to use for case_id, with its schema up to date. Reads of
+    a case that has no shard yet (create=False) go to the main database,
+    which still holds any events ingested before sharding was enabled.
+    """
+    path = case_db_path(case_id)
+    if not create and not path.exists():
+        path = Path(settings.DATABASE_PATH)
+    ensure_schema(path)
+    return path
+
+
+@contextmanager
+def case_connection(
+    case_id: Optional[str] = None,
+    create: bool = False
+) -> Iterator[sqlite3.Connection]:
+    """
+    Checks out a connection to the database holding case_id's events.
+    """
+    with pooled_connection(resolve_case_db(case_id, create)) as conn:
+        yield conn
+
+
+def get_case_db(case_id: Optional[str] = None) -> Iterator[sqlite3.Connection]:
+    """
+    FastAPI dependency like get_db, reading the request's case_id query
+    parameter: in sharded mode the connection is to that case's shard.
+    """
+    with case_connection(case_id) as conn:
+        yield conn
+
+
+def map_shards(
+    fn: Callable[[sqlite3.Connection, str], T],
+    conn: Optional[sqlite3.Connection] = None
+) -> List[T]:
+    """
+    Calls fn(conn, shard_name) once per active database (see shard_paths)
+    in parallel on the shard executor and returns the results in shard
+    order. Callers merge them; without sharding this is a single call.
+    A caller already holding a connection to the main database passes it
+    as conn: it serves the main shard, so the caller does not wait on its
+    own pool for a second one.
+    """
+    def run(shard):
+        name, path = shard
+        if name == "" and conn is not None:
+            return fn(conn, name)
+        ensure_schema(path)
+        with pooled_connection(path) as shard_conn:
+            return fn(shard_conn, name)
+
+    shards = list(shard_paths().items())
+    if len(shards) == 1:
+        return [run(shards[0])]
+    return list(shard_executor().map(run, shards))
+
+
+def close_pool(path: Path) -> None:
+    """
+    Closes the pool of the database at path, e.g. before the file is
+    moved or deleted; its schema is checked again on next use.
+    """
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+    with _schema_lock:
+        _schema_ready.discard(path)
+
+
+def _move_database(source: Path, target: Path) -> None:
+    if target.exists():
+        raise FileExistsError(f"{target} already exists")
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Fold the WAL into the database file so the .db alone is complete
+    with pooled_connection(source) as conn:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    close_pool(source)
+    source.rename(target)
+    for suffix in ("-wal", "-shm"):
+        sidecar = Path(f"{source}{suffix}")
+        if sidecar.exists():
+            sidecar.unlink()
+
+
+def archive_case(case_id: str) -> Path:
+    """
+    Moves a closed case's shard out of CASES_DIR into ARCHIVE_DIR, which
+    removes it from every query. Run it while the case is not being
+    ingested or read. Returns the archived file's path.
+    """
+    if not settings.CASE_SHARDS:
+        raise ValueError("Case archiving requires settings.CASE_SHARDS")
+    source = case_db_path(case_id)
+    if not source.exists():
+        raise FileNotFoundError(f"No shard for case {case_id!r} at {source}")
+    target = Path(settings.ARCHIVE_DIR) / source.name
+    _move_database(source, target)
+    return target
+
+
+def restore_case(case_id: str) -> Path:
+    """
+    Moves an archived case back into CASES_DIR. Returns its shard path.
+    """
+    if not settings.CASE_SHARDS:
+        raise ValueError("Case archiving requires settings.CASE_SHARDS")
+    target = case_db_path(case_id)
+    source = Path(settings.ARCHIVE_DIR) / target.name
+    if not source.exists():
+        raise FileNotFoundError(f"No archived case {case_id!r} at {source}")
+    _move_database(source, target)
+    return target
+
+
+def _generation_key(case_id: Optional[str] = None) -> str:
+    return f"ingestion_generation:{case_id}" if case_id else "ingestion_generation"
+
+
+def get_ingestion_generation(cursor, case_id: Optional[str] = None) -> int:
+    """
+    Returns the ingestion generation: a counter bumped in the same
+    transaction as every batch of inserted events. Cached results keyed
+    on it become stale as soon as new data is committed.
+    With case_id, returns that case's own generation, which only moves
+    when events of that case are inserted.
+    """
+    row = cursor.execute(
+        "SELECT value FROM app_meta WHERE key = ?", (_generation_key(case_id),)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def current_generation(conn: sqlite3.Connection, case_id: Optional[str] = None):
+    """
+    Cache validator for results over case_id (None = all cases): its
+    ingestion generation, or in sharded mode across all cases, the
+    generation of every shard, which also changes when one is archived.
+    """
+    if spans_shards(case_id):
+        return tuple(map_shards(
+            lambda shard_conn, shard: (shard, get_ingestion_generation(shard_conn.cursor())),
+            conn
+        ))
+    return get_ingestion_generation(conn.cursor(), case_id)
+
+
+def bump_ingestion_generation(cursor, case_ids: Iterable[str] = ()) -> None:
+    """
+    Bumps the global generation and those of the given cases.
+    """
+    cursor.execute(
+        "UPDATE app_meta SET value = value + 1 WHERE key = 'ingestion_generation'"
+    )
+    cursor.executemany("""
+        INSERT INTO app_meta (key, value) VALUES (?, 1)
+        ON CONFLICT (key) DO UPDATE SET value = value + 1
+    """, [(_generation_key(case_id),) for case_id in case_ids])
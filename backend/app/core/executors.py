@@ -0,0 +1,115 @@
+"""
+Bounded executors for blocking work.
+
+Request handlers are async and hand blocking work to one of these pools,
+each with its own concurrency limit, so the event loop (and the health
+check) stays responsive however busy the pools are:
+
+    io  : threads for SQLite, file parsing and PDF rendering
+    cpu : processes for CPU-bound graph centrality, which would otherwise
+          hold the GIL and starve the I/O threads
+    job : threads for background jobs (app.services.job_service), kept
+          separate so long reports and uploads never occupy the io pool
+    shard : threads running one query per case database in sharded mode
+          (app.core.database.map_shards); the io threads waiting on them
+          would deadlock if both shared one pool
+"""
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from app.core.config import settings
+
+
+_io_executor: Optional[ThreadPoolExecutor] = None
+_cpu_executor: Optional[ProcessPoolExecutor] = None
+_job_executor: Optional[ThreadPoolExecutor] = None
+_shard_executor: Optional[ThreadPoolExecutor] = None
+_lock = threading.Lock()
+
+
+def io_executor() -> ThreadPoolExecutor:
+    global _io_executor
+    with _lock:
+        if _io_executor is None:
+            _io_executor = ThreadPoolExecutor(
+                max_workers=settings.IO_WORKERS,
+                thread_name_prefix="sentinelx-io"
+            )
+        return _io_executor
+
+
+def cpu_executor() -> ProcessPoolExecutor:
+    global _cpu_executor
+    with _lock:
+        if _cpu_executor is None:
+            # spawn: forking a process that already runs threads is unsafe
+            _cpu_executor = ProcessPoolExecutor(
+                max_workers=settings.CPU_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _cpu_executor
+
+
+def job_executor() -> ThreadPoolExecutor:
+    global _job_executor
+    with _lock:
+        if _job_executor is None:
+            _job_executor = ThreadPoolExecutor(
+                max_workers=settings.JOB_WORKERS,
+                thread_name_prefix="sentinelx-job"
+            )
+        return _job_executor
+
+
+def shard_executor() -> ThreadPoolExecutor:
+    global _shard_executor
+    with _lock:
+        if _shard_executor is None:
+            _shard_executor = ThreadPoolExecutor(
+                max_workers=settings.SHARD_WORKERS,
+                thread_name_prefix="sentinelx-shard"
+            )
+        return _shard_executor
+
+
+async def _run(executor: Executor, fn: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, partial(fn, *args, **kwargs))
+
+
+async def run_io(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Awaits fn(*args, **kwargs) on the I/O thread pool.
+    """
+    return await _run(io_executor(), fn, *args, **kwargs)
+
+
+def run_cpu(fn: Callable, *args, **kwargs) -> Any:
+    """
+    Runs fn(*args, **kwargs) on the CPU process pool and blocks for the
+    result. Called from I/O threads; fn and its arguments must be picklable.
+    """
+    return cpu_executor().submit(fn, *args, **kwargs).result()
+
+
+def shutdown_executors() -> None:
+    global _io_executor, _cpu_executor, _job_executor, _shard_executor
+    with _lock:
+        if _job_executor is not None:
+            # Jobs still queued stay 'queued' in the jobs table and are
+            # resumed by recover_jobs() on the next startup
+            _job_executor.shutdown(wait=True, cancel_futures=True)
+            _job_executor = None
+        if _io_executor is not None:
+            _io_executor.shutdown(wait=True)
+            _io_executor = None
+        if _shard_executor is not None:
+            _shard_executor.shutdown(wait=True)
+            _shard_executor = None
+        if _cpu_executor is not None:
+            _cpu_executor.shutdown(wait=True, cancel_futures=True)
+            _cpu_executor = None
@@ -0,0 +1,346 @@
+"""
+Schema migrations for the SentinelX database.
+
+Each migration is a function taking a cursor. They run in list order,
+once per database; SQLite's PRAGMA user_version tracks how many have
+been applied. A migration that adds a derived table returns its name,
+and the table is rebuilt from events once the schema is fully current
+(rebuilds run today's code, which may rely on later columns). All
+pending work commits as one transaction. Append new migrations to the
+end of MIGRATIONS, never reorder or edit applied ones.
+"""
+from app.services.risk_engine import rebuild_user_risk_stats
+from app.services.graph_engine import rebuild_edge_weights
+from app.services.timeline_service import rebuild_event_rollups, rebuild_events_fts
+from app.services.stats_service import rebuild_stats_counters
+from app.services.ingestion_service import SOURCE_MAPPINGS, mapped_fields
+from app.utils.helpers import decode_metadata, encode_metadata
+
+
+# Derived tables that migrations may ask to have rebuilt
+REBUILDERS = {
+    "user_risk_stats": rebuild_user_risk_stats,
+    "edge_weights": rebuild_edge_weights,
+    "events_fts": rebuild_events_fts,
+    "stats_counters": rebuild_stats_counters,
+    "rollup_hourly": rebuild_event_rollups,
+}
+
+
+def _add_user_risk_stats(cursor):
+    """Per-actor risk counters, maintained by ingestion."""
+    # case_id is '' for events without a case so it can be part of the key
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS user_risk_stats (
+            case_id TEXT NOT NULL DEFAULT '',
+            actor_id TEXT NOT NULL,
+            late_night INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            financial INTEGER NOT NULL DEFAULT 0,
+            total_messages INTEGER NOT NULL DEFAULT 0,
+            first_event_id INTEGER,
+            PRIMARY KEY (case_id, actor_id)
+        )
+    """)
+    return ["user_risk_stats"]
+
+
+def _add_edge_weights(cursor):
+    """Undirected communication edge weights and the ingestion generation."""
+    # Each pair is stored once with node_a <= node_b
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS edge_weights (
+            case_id TEXT NOT NULL DEFAULT '',
+            node_a TEXT NOT NULL,
+            node_b TEXT NOT NULL,
+            weight INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (case_id, node_a, node_b)
+        )
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_edge_weights_node_a ON edge_weights (node_a)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_edge_weights_node_b ON edge_weights (node_b)"
+    )
+
+    # Bumped whenever events are added (see database.bump_ingestion_generation)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+    """)
+    cursor.execute(
+        "INSERT OR IGNORE INTO app_meta (key, value) VALUES ('ingestion_generation', 0)"
+    )
+    return ["edge_weights"]
+
+
+def _add_event_indexes(cursor):
+    """Indexes matching the timeline, stats and graph query shapes."""
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_case_timestamp "
+        "ON events (case_id, timestamp)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_actor ON events (actor_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_target ON events (target_id)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_source_timestamp "
+        "ON events (source_type, timestamp)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_deleted "
+        "ON events (timestamp) WHERE deleted_flag = 1"
+    )
+    cursor.execute("ANALYZE events")
+
+
+def _add_epoch_columns(cursor):
+    """
+    Integer epoch seconds and hour of day next to the text timestamp, so
+    timeline ranges, ordering and late-night filters are sargable.
+    Timestamp-keyed indexes from migration 3 are replaced by epoch ones.
+    """
+    cursor.execute("ALTER TABLE events ADD COLUMN ts_epoch INTEGER")
+    cursor.execute("ALTER TABLE events ADD COLUMN hour INTEGER")
+    cursor.execute("""
+        UPDATE events SET
+            ts_epoch = CAST(strftime('%s', timestamp) AS INTEGER),
+            hour = CAST(strftime('%H', timestamp) AS INTEGER)
+    """)
+
+    cursor.execute("DROP INDEX IF EXISTS idx_events_case_timestamp")
+    cursor.execute("DROP INDEX IF EXISTS idx_events_source_timestamp")
+    cursor.execute("DROP INDEX IF EXISTS idx_events_deleted")
+
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_epoch ON events (ts_epoch)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_case_epoch "
+        "ON events (case_id, ts_epoch)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_source_epoch "
+        "ON events (source_type, ts_epoch)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_events_deleted_epoch "
+        "ON events (ts_epoch) WHERE deleted_flag = 1"
+    )
+    cursor.execute("ANALYZE events")
+
+
+def _add_events_fts(cursor):
+    """
+    FTS5 index over events.message_text for timeline keyword search.
+    External-content table: the text lives only in events, the index is
+    kept in sync by ingestion.
+    """
+    cursor.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS events_fts USING fts5(
+            message_text,
+            content = 'events',
+            content_rowid = 'id',
+            tokenize = 'unicode61 remove_diacritics 2',
+            prefix = '2 3'
+        )
+    """)
+    return ["events_fts"]
+
+
+def _add_jobs(cursor):
+    """
+    Background jobs (app.services.job_service): status, progress and result
+    survive a restart so clients can keep polling.
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            phase TEXT,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            params TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+
+def _compact_metadata(cursor):
+    """
+    Re-encodes events.metadata from the full raw record as JSON text to
+    only the fields without a column of their own, as a compact (and,
+    when long, zlib-compressed) BLOB. Run VACUUM afterwards to return the
+    freed pages to the filesystem; until then new rows reuse them.
+    """
+    mapped = {source: mapped_fields(source) for source in SOURCE_MAPPINGS}
+
+    def compact(source_type, metadata):
+        record = decode_metadata(metadata)
+        drop = mapped.get(source_type, set())
+        return encode_metadata({k: v for k, v in record.items() if k not in drop})
+
+    cursor.connection.create_function("compact_metadata", 2, compact, deterministic=True)
+    cursor.execute("""
+        UPDATE events SET metadata = compact_metadata(source_type, metadata)
+        WHERE metadata IS NOT NULL
+    """)
+
+
+def _add_case_stats_index(cursor):
+    """
+    Covering index for case-scoped /stats and report counts: every
+    per-case figure is answered from the index without reading events.
+    """
+    cursor.execute("""
+        CREATE INDEX IF NOT EXISTS idx_events_case_stats
+        ON events(case_id, source_type, language, deleted_flag, actor_id)
+    """)
+    cursor.execute("ANALYZE")
+
+
+def _add_stats_counters(cursor):
+    """
+    /stats figures per scope and the distinct actors behind them,
+    maintained by ingestion (see app.services.stats_service). They
+    replace the case stats index, which only served those queries.
+    """
+    # case_id '' is the scope of all events, unlike in the other aggregates
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_counters (
+            case_id TEXT NOT NULL,
+            dimension TEXT NOT NULL,
+            value TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (case_id, dimension, value)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS stats_actors (
+            case_id TEXT NOT NULL,
+            actor_id TEXT NOT NULL,
+            PRIMARY KEY (case_id, actor_id)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute("DROP INDEX IF EXISTS idx_events_case_stats")
+    return ["stats_counters"]
+
+
+def _add_event_rollups(cursor):
+    """
+    Hourly event and deleted counts for /timeline/histogram, maintained
+    by ingestion: per case and source, and per user (as actor or target).
+    """
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_hourly (
+            case_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            source_type TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (case_id, bucket, source_type)
+        ) WITHOUT ROWID
+    """)
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_rollup_hourly_bucket ON rollup_hourly (bucket)"
+    )
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS rollup_hourly_actor (
+            actor_id TEXT NOT NULL,
+            bucket INTEGER NOT NULL,
+            case_id TEXT NOT NULL,
+            source_type TEXT NOT NULL,
+            events INTEGER NOT NULL DEFAULT 0,
+            deleted INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (actor_id, bucket, case_id, source_type)
+        ) WITHOUT ROWID
+    """)
+    # rebuild_event_rollups fills both tables
+    return ["rollup_hourly"]
+
+
+def _drop_redundant_indexes(cursor):
+    """
+    Drops indexes that later migrations superseded, for databases whose
+    version was recorded against a shorter migration list that skipped
+    the drops: the timestamp-keyed ones replaced by epoch indexes, and
+    the case stats index replaced by stats_counters.
+    """
+    for index in (
+        "idx_events_case_timestamp",
+        "idx_events_source_timestamp",
+        "idx_events_deleted",
+        "idx_events_case_stats",
+    ):
+        cursor.execute(f"DROP INDEX IF EXISTS {index}")
+
+
+def _drop_jobs(cursor):
+    """
+    Job state moved to its own database (app.services.job_service), so the
+    jobs table from migration 6 is unused here.
+    """
+    cursor.execute("DROP TABLE IF EXISTS jobs")
+
+
+MIGRATIONS = [
+    _add_user_risk_stats,
+    _add_edge_weights,
+    _add_event_indexes,
+    _add_epoch_columns,
+    _add_events_fts,
+    _add_jobs,
+    _compact_metadata,
+    _add_case_stats_index,
+    _add_stats_counters,
+    _add_event_rollups,
+    _drop_redundant_indexes,
+    _drop_jobs,
+]
+
+
+def apply_migrations(conn, migrations=None) -> int:
+    """
+    Applies pending migrations and returns the resulting schema version.
+    migrations defaults to MIGRATIONS; other databases (the job state
+    database) pass their own list.
+    """
+    if migrations is None:
+        migrations = MIGRATIONS
+    cursor = conn.cursor()
+    version = cursor.execute("PRAGMA user_version").fetchone()[0]
+
+    if version >= len(migrations):
+        return version
+
+    rebuilds = []
+    cursor.execute("BEGIN")
+    try:
+        for number, migration in enumerate(migrations[version:], start=version + 1):
+            print(f"[migrations] Applying {number}: {migration.__name__}")
+            for table in migration(cursor) or []:
+                if table not in rebuilds:
+                    rebuilds.append(table)
+
+        for table in rebuilds:
+            print(f"[migrations] Rebuilding {table}")
+            REBUILDERS[table](cursor)
+
+        # PRAGMA does not accept bound parameters
+        cursor.execute(f"PRAGMA user_version = {len(migrations)}")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return len(migrations)
@@ -1,7 +1,9 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.database import create_tables
+from app.core.database import create_tables, close_pools
+from app.core.executors import shutdown_executors
+from app.services.job_service import recover_jobs
 
 # Routers
 from app.routers import (
@@ -10,7 +12,8 @@ from app.routers import (
     timeline,
     graph,
     stats,
-    report
+    report,
+    jobs
 )
 
 app = FastAPI(
@@ -34,11 +37,20 @@ app.add_middleware(
 @app.on_event("startup")
 def startup():
     create_tables()
+    recover_jobs()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    shutdown_executors()
+    close_pools()
 
 
 # ---- Root Health Check ----
+# async and free of blocking work: answered on the event loop even when
+# every executor thread is busy
 @app.get("/")
-def root():
+async def root():
     return {
         "status": "running",
         "service": "SentinelX AI Backend",
@@ -53,3 +65,4 @@ app.include_router(timeline.router)
 app.include_router(graph.router)
 app.include_router(stats.router)
 app.include_router(report.router)
+app.include_router(jobs.router)
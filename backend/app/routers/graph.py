@@ -1,12 +1,16 @@
-from fastapi import APIRouter, Query
+import sqlite3
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
-from app.services.graph_engine import build_graph
+from app.core.database import get_case_db
+from app.core.executors import run_io
+from app.services.graph_engine import build_graph, iter_graph_records, CENTRALITY_MODES
+from app.utils.helpers import RESPONSE_FORMATS, ndjson_response
 
 router = APIRouter(prefix="/graph", tags=["Graph Intelligence"])
 
 
 @router.get("/")
-def get_graph(
+async def get_graph(
     focus_user: Optional[str] = Query(
         None,
         description="Build graph around a specific user"
@@ -19,16 +23,59 @@ def get_graph(
         1,
         ge=1,
         description="Minimum edge weight threshold"
-    )
+    ),
+    centrality_mode: str = Query(
+        "auto",
+        description="Betweenness: exact, sampled (k pivots, fixed seed) "
+                    "or auto (sampled only above the configured graph size)"
+    ),
+    sample_size: Optional[int] = Query(
+        None,
+        ge=2,
+        description="Pivot count for sampled betweenness (at least 2)"
+    ),
+    case_id: Optional[str] = Query(
+        None,
+        description="Only communication within this case"
+    ),
+    output_format: str = Query(
+        "json",
+        alias="format",
+        description="json, or ndjson (summary line, then one line per node and per edge)"
+    ),
+    conn: sqlite3.Connection = Depends(get_case_db)
 ):
     """
     Returns communication network graph with centrality metrics.
+    The 'centrality' block reports which betweenness mode was used.
     """
 
-    graph_data = build_graph(
+    if centrality_mode not in CENTRALITY_MODES:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unsupported centrality_mode: {centrality_mode!r}. "
+                   f"Must be one of: {list(CENTRALITY_MODES)}"
+        )
+
+    if output_format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unsupported format: {output_format!r}. "
+                   f"Must be one of: {list(RESPONSE_FORMATS)}"
+        )
+
+    graph_data = await run_io(
+        build_graph,
+        conn,
         focus_user=focus_user,
         suspicious_only=suspicious_only,
-        min_edge_weight=min_edge_weight
+        min_edge_weight=min_edge_weight,
+        centrality_mode=centrality_mode,
+        sample_size=sample_size,
+        case_id=case_id
     )
 
+    if output_format == "ndjson":
+        return ndjson_response(iter_graph_records(graph_data))
+
     return graph_data
@@ -0,0 +1,21 @@
+from fastapi import APIRouter, HTTPException
+from app.core.executors import run_io
+from app.services.job_service import get_job
+
+router = APIRouter(prefix="/jobs", tags=["Background Jobs"])
+
+
+@router.get("/{job_id}")
+async def job_status(job_id: str):
+    """
+    Returns status, phase, rows processed and result of a background job.
+    """
+    job = await run_io(get_job, job_id)
+
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Unknown job: {job_id}"
+        )
+
+    return job
@@ -1,17 +1,40 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Query
+from typing import Optional
+from app.core.database import case_connection
+from app.core.executors import run_io
 from app.services.report_service import generate_report
+from app.services.job_service import submit_job
 
 router = APIRouter(prefix="/report", tags=["Forensic Report"])
 
 
 @router.get("/")
-def create_report():
+async def create_report(
+    case_id: Optional[str] = Query(None, description="Report on this case only"),
+    background: bool = Query(
+        False,
+        description="Queue the report as a background job and return its id"
+    )
+):
     """
     Generates forensic intelligence PDF report.
+    With background=true, returns a job id to poll at /jobs/{job_id}.
     """
+    if background:
+        job_id = await run_io(submit_job, "report", {"case_id": case_id})
+        return {
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
+        }
+
+    # Only the synchronous report checks out a connection
+    def report():
+        with case_connection(case_id) as conn:
+            return generate_report(conn, case_id=case_id)
 
     try:
-        file_path = generate_report()
+        file_path = await run_io(report)
 
         return {
             "status": "success",
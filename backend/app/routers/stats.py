@@ -1,51 +1,39 @@
-from fastapi import APIRouter
-from app.core.database import get_connection
+import sqlite3
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
+from app.core.cache import cache_stats, get_cache
+from app.core.database import current_generation, get_case_db
+from app.core.executors import run_io
+from app.services.stats_service import collect_stats
 
 router = APIRouter(prefix="/stats", tags=["System Statistics"])
 
+# Summaries by (case_id, generation); see app.core.cache
+_stats_cache = get_cache("stats")
+
 
 @router.get("/")
-def get_stats():
+async def get_stats(
+    case_id: Optional[str] = Query(None, description="Only events of this case"),
+    conn: sqlite3.Connection = Depends(get_case_db)
+):
+    """
+    Returns high-level analytics summary, read from the counters kept
+    up to date by ingestion and served from memory until new data lands.
+    """
+    return await run_io(_cached_stats, conn, case_id)
+
+
+@router.get("/cache")
+async def get_cache_stats():
     """
-    Returns high-level analytics summary.
+    Hit / miss counters of the in-process result caches.
     """
+    return {"caches": cache_stats()}
+
 
-    conn = get_connection()
-    cursor = conn.cursor()
-
-    total_events = cursor.execute(
-        "SELECT COUNT(*) FROM events"
-    ).fetchone()[0]
-
-    deleted_messages = cursor.execute(
-        "SELECT COUNT(*) FROM events WHERE deleted_flag = 1"
-    ).fetchone()[0]
-
-    unique_users = cursor.execute(
-        "SELECT COUNT(DISTINCT actor_id) FROM events WHERE actor_id IS NOT NULL"
-    ).fetchone()[0]
-
-    language_breakdown = cursor.execute("""
-        SELECT language, COUNT(*) as count
-        FROM events
-        WHERE language IS NOT NULL
-        GROUP BY language
-        ORDER BY count DESC
-    """).fetchall()
-
-    source_breakdown = cursor.execute("""
-        SELECT source_type, COUNT(*) as count
-        FROM events
-        GROUP BY source_type
-        ORDER BY count DESC
-    """).fetchall()
-
-    conn.close()
-
-    return {
-        "total_events": total_events,
-        "deleted_messages": deleted_messages,
-        "unique_users": unique_users,
-        "language_distribution": [dict(row) for row in language_breakdown],
-        "source_distribution": [dict(row) for row in source_breakdown]
-    }
+def _cached_stats(conn: sqlite3.Connection, case_id: Optional[str] = None):
+    cache_key = (case_id, current_generation(conn, case_id))
+    return _stats_cache.get_or_compute(
+        cache_key, lambda: collect_stats(conn, case_id)
+    )
@@ -1,25 +1,34 @@
-from fastapi import APIRouter, Query
+import sqlite3
+from fastapi import APIRouter, Depends, Query
+from typing import Optional
 from app.services.risk_engine import compute_suspicious_users
 from app.core.config import settings
+from app.core.database import get_case_db
+from app.core.executors import run_io
 
 router = APIRouter(prefix="/suspicious-users", tags=["Risk Analysis"])
 
 
 @router.get("/")
-def get_suspicious_users(
+async def get_suspicious_users(
     min_messages: int = Query(
         settings.MIN_MESSAGES_THRESHOLD,
         ge=1,
         description="Minimum number of messages required for risk evaluation"
-    )
+    ),
+    case_id: Optional[str] = Query(None, description="Only activity within this case"),
+    conn: sqlite3.Connection = Depends(get_case_db)
 ):
     """
     Returns ranked suspicious users based on behavioral density scoring.
     """
 
-    suspicious_list = compute_suspicious_users(min_messages=min_messages)
+    suspicious_list = await run_io(
+        compute_suspicious_users, conn, min_messages=min_messages, case_id=case_id
+    )
 
     return {
+        "case_id": case_id,
         "total_suspicious_users": len(suspicious_list),
         "users": suspicious_list
     }
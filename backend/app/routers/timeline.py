@@ -1,23 +1,55 @@
-from fastapi import APIRouter, Query
+import sqlite3
+from fastapi import APIRouter, Depends, HTTPException, Query
 from typing import Optional
-from app.services.timeline_service import get_timeline
+from app.core.database import case_connection, get_case_db
+from app.core.executors import run_io
+from app.services.timeline_service import (
+    HISTOGRAM_INTERVALS, get_histogram, get_timeline, iter_timeline
+)
+from app.utils.helpers import RESPONSE_FORMATS, ndjson_response
 
 router = APIRouter(prefix="/timeline", tags=["Timeline"])
 
 
 @router.get("/")
-def fetch_timeline(
+async def fetch_timeline(
     case_id: Optional[str] = Query(None, description="Filter by case ID"),
     actor_id: Optional[str] = Query(None, description="Filter by actor or target ID"),
     source_type: Optional[str] = Query(None, description="Filter by source type e.g. whatsapp, calls"),
     deleted_only: bool = Query(False, description="Show only deleted messages"),
     late_night: bool = Query(False, description="Show only events between 00:00 and 04:59"),
-    keyword: Optional[str] = Query(None, description="Search keyword in message_text"),
+    keyword: Optional[str] = Query(
+        None,
+        description='Full-text search in message_text: terms, prefix (pay*), '
+                    '"exact phrase", AND / OR / NOT; other input (+91..., a@b) '
+                    'is matched as literal terms'
+    ),
     start_date: Optional[str] = Query(None, description="Start datetime e.g. 2024-01-01 00:00:00"),
     end_date: Optional[str] = Query(None, description="End datetime e.g. 2024-12-31 23:59:59"),
-    limit: int = Query(500, ge=1, le=5000, description="Max number of results"),
+    limit: Optional[int] = Query(
+        None,
+        ge=1,
+        description="Page size (json: default 500, max 5000; ndjson: all rows if omitted)"
+    ),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page"),
+    include_metadata: bool = Query(
+        False,
+        description="Include source fields that have no column of their own"
+    ),
+    output_format: str = Query(
+        "json",
+        alias="format",
+        description="json (paged) or ndjson (streamed export, one event per line)"
+    ),
 ):
-    return get_timeline(
+    if output_format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unsupported format: {output_format!r}. "
+                   f"Must be one of: {list(RESPONSE_FORMATS)}"
+        )
+
+    filters = dict(
         case_id=case_id,
         actor_id=actor_id,
         source_type=source_type,
@@ -26,5 +58,55 @@ def fetch_timeline(
         keyword=keyword,
         start_date=start_date,
         end_date=end_date,
-        limit=limit,
-    )
\ No newline at end of file
+        cursor=cursor,
+        include_metadata=include_metadata,
+    )
+
+    # No request-scoped connection: the export stream checks out its own
+    # and holds it until the response is sent, so the page takes one only
+    # for as long as its query runs
+    def page():
+        with case_connection(case_id) as conn:
+            return get_timeline(conn, limit=limit or 500, **filters)
+
+    try:
+        if output_format == "ndjson":
+            stream = await run_io(iter_timeline, limit=limit, **filters)
+            return ndjson_response(stream, on_close=stream.close)
+
+        return await run_io(page)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+
+@router.get("/histogram")
+async def fetch_histogram(
+    interval: str = Query("day", description="Bucket size: hour, day or week (from Monday)"),
+    case_id: Optional[str] = Query(None, description="Filter by case ID"),
+    actor_id: Optional[str] = Query(None, description="Filter by actor or target ID"),
+    source_type: Optional[str] = Query(None, description="Filter by source type e.g. whatsapp, calls"),
+    start_date: Optional[str] = Query(None, description="Start datetime e.g. 2024-01-01 00:00:00"),
+    end_date: Optional[str] = Query(None, description="End datetime e.g. 2024-12-31 23:59:59"),
+    conn: sqlite3.Connection = Depends(get_case_db),
+):
+    """
+    Events and deleted events per interval, from the hourly rollups
+    maintained at ingestion. Date bounds apply to whole hours.
+    """
+    if interval not in HISTOGRAM_INTERVALS:
+        raise HTTPException(
+            status_code=422,
+            detail=f"Unsupported interval: {interval!r}. "
+                   f"Must be one of: {list(HISTOGRAM_INTERVALS)}"
+        )
+
+    return await run_io(
+        get_histogram,
+        conn,
+        interval=interval,
+        case_id=case_id,
+        actor_id=actor_id,
+        source_type=source_type,
+        start_date=start_date,
+        end_date=end_date,
+    )
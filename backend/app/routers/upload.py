@@ -1,6 +1,9 @@
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
 from typing import List
+from app.core.database import pooled_connection
+from app.core.executors import run_io
 from app.services.ingestion_service import ingest_multiple_files, SUPPORTED_SOURCES
+from app.services.job_service import submit_ingest_job
 
 router = APIRouter(prefix="/upload", tags=["Upload"])
 
@@ -8,11 +11,20 @@ router = APIRouter(prefix="/upload", tags=["Upload"])
 @router.post("/multiple")
 async def upload_multiple_files(
     source_types: List[str] = Form(...),
-    files: List[UploadFile] = File(...)
+    files: List[UploadFile] = File(...),
+    stream: bool = Query(
+        False,
+        description="Ingest in bounded chunks, committing each chunk (for very large files)"
+    ),
+    background: bool = Query(
+        False,
+        description="Queue the ingestion as a background job and return its id"
+    )
 ):
     """
     Upload multiple files, each with its own source_type.
     source_types and files must be in the same order.
+    With background=true, returns a job id to poll at /jobs/{job_id}.
     """
     # Swagger sends all source_types as one comma-separated string — fix that
     normalized: List[str] = []
@@ -35,7 +47,26 @@ async def upload_multiple_files(
             detail=f"Mismatch: {len(files)} file(s) but {len(normalized)} source_type(s) provided."
         )
 
-    inserted, skipped = ingest_multiple_files(list(zip(files, normalized)))
+    if background:
+        job_id = await run_io(
+            submit_ingest_job,
+            list(zip(files, normalized)),
+            stream=stream
+        )
+        return {
+            "status": "queued",
+            "job_id": job_id,
+            "status_url": f"/jobs/{job_id}"
+        }
+
+    # No request-scoped connection: a queued job never needs one, so
+    # only the synchronous ingest checks one out
+    def ingest():
+        with pooled_connection() as conn:
+            return ingest_multiple_files(conn, list(zip(files, normalized)), stream=stream)
+
+    # Blocking parse + insert runs on the I/O pool, off the event loop
+    inserted, skipped = await run_io(ingest)
 
     return {
         "status": "success",
@@ -0,0 +1,306 @@
+"""
+Array-backed /graph backend (settings.GRAPH_BACKEND = "csr"), for cases
+with millions of call and UPI edges.
+
+Node ids are interned to integers 0..n-1 in id order and the undirected
+adjacency is a symmetric scipy.sparse CSR matrix of edge weights: a few
+bytes per edge instead of networkx's nested dicts. Degree, connected
+components and betweenness run on the arrays, and build_graph returns
+the same JSON as with the networkx backend. There is no incremental
+snapshot: the arrays are rebuilt from edge_weights on each new generation,
+which is a vectorized pass over the pairs.
+
+Requires scipy, which the networkx backend does not.
+"""
+import random
+import sqlite3
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.sparse.csgraph import connected_components
+
+from app.core.config import settings
+from app.core.database import map_shards, spans_shards
+from app.core.executors import run_cpu
+from app.services.graph_engine import _resolve_mode, edges_query
+
+
+class CSRGraph:
+    """
+    Undirected weighted graph over nodes 0..n-1. ids[i] is the id of node
+    i, in ascending order; adjacency holds each pair in both rows and a
+    self-loop once, on the diagonal. Every node has at least one edge.
+    """
+
+    def __init__(self, ids: np.ndarray, adjacency: sp.csr_array):
+        self.ids = ids
+        self.adjacency = adjacency
+
+    @classmethod
+    def from_edges(
+        cls,
+        node_a: np.ndarray,
+        node_b: np.ndarray,
+        weight: np.ndarray,
+        min_edge_weight: int = 1
+    ) -> "CSRGraph":
+        """
+        Graph of the pairs (node_a <= node_b, as in edge_weights). Pairs
+        listed more than once (one row per shard) are summed before sums
+        below min_edge_weight are dropped.
+        """
+        ids, inverse = np.unique(np.concatenate([node_a, node_b]), return_inverse=True)
+        n = len(ids)
+        rows, cols = inverse[:len(node_a)], inverse[len(node_a):]
+        # Converting to CSR sums duplicate pairs
+        upper = sp.coo_array((weight, (rows, cols)), shape=(n, n)).tocsr()
+        upper.data[upper.data < min_edge_weight] = 0
+        upper.eliminate_zeros()
+        return cls._from_upper(ids, upper)
+
+    @classmethod
+    def _from_upper(cls, ids: np.ndarray, upper: sp.csr_array) -> "CSRGraph":
+        """Graph of an upper-triangular weight matrix, without its isolates."""
+        rows = np.repeat(np.arange(upper.shape[0]), np.diff(upper.indptr))
+        keep = np.flatnonzero(
+            np.bincount(np.concatenate([rows, upper.indices]), minlength=len(ids))
+        )
+        upper = upper[keep][:, keep]
+        adjacency = (upper + sp.triu(upper, k=1).T).tocsr()
+        adjacency.sort_indices()
+        return cls(ids[keep], adjacency)
+
+    def number_of_nodes(self) -> int:
+        return len(self.ids)
+
+    def number_of_edges(self) -> int:
+        loops = np.count_nonzero(self.adjacency.diagonal())
+        return (self.adjacency.nnz + loops) // 2
+
+    def degree(self) -> np.ndarray:
+        """Neighbours per node, a self-loop counting twice as in networkx."""
+        return np.diff(self.adjacency.indptr) + (self.adjacency.diagonal() != 0)
+
+    def subgraph(self, node_ids: List[str]) -> "CSRGraph":
+        """The graph induced by node_ids, without the nodes left isolated."""
+        keep = np.flatnonzero(np.isin(self.ids, np.array(node_ids, dtype=object)))
+        upper = sp.triu(self.adjacency, format="csr")[keep][:, keep]
+        return self._from_upper(self.ids[keep], upper.tocsr())
+
+    def edges(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(source ids, target ids, weights) with source <= target, in id order."""
+        upper = sp.triu(self.adjacency, format="csr")
+        upper.sort_indices()
+        rows = np.repeat(np.arange(upper.shape[0]), np.diff(upper.indptr))
+        return self.ids[rows], self.ids[upper.indices], upper.data
+
+
+def _edge_frame(conn: sqlite3.Connection, *query) -> pd.DataFrame:
+    sql, params = query
+    return pd.DataFrame(
+        conn.execute(sql, params).fetchall(),
+        columns=["node_a", "node_b", "weight"]
+    )
+
+
+def load_csr_graph(
+    conn: sqlite3.Connection,
+    min_edge_weight: int = 1,
+    focus_user: Optional[str] = None,
+    case_id: Optional[str] = None
+) -> CSRGraph:
+    """
+    The graph of edges_query's pairs; without a case_id in sharded mode,
+    pairs are summed across every shard before thresholding.
+    """
+    if spans_shards(case_id):
+        frame = pd.concat(map_shards(
+            lambda shard_conn, _: _edge_frame(shard_conn, *edges_query(1, focus_user)),
+            conn
+        ))
+    else:
+        frame = _edge_frame(conn, *edges_query(min_edge_weight, focus_user, case_id))
+
+    return CSRGraph.from_edges(
+        frame["node_a"].to_numpy(dtype=object),
+        frame["node_b"].to_numpy(dtype=object),
+        frame["weight"].to_numpy(dtype=np.int64),
+        min_edge_weight
+    )
+
+
+# ---- Betweenness ----
+
+def _dependencies(pattern: sp.csr_array, sources: np.ndarray) -> np.ndarray:
+    """
+    Brandes' dependency of every node on a batch of sources at once, one
+    column per source: a breadth-first pass counting shortest paths
+    (sigma) level by level, then accumulation back from the farthest
+    level. Returns the per-node sum over the batch, sources excluded.
+    """
+    m, b = pattern.shape[0], len(sources)
+    columns = np.arange(b)
+    sigma = np.zeros((m, b))
+    dist = np.full((m, b), -1, dtype=np.int32)
+    sigma[sources, columns] = 1.0
+    dist[sources, columns] = 0
+
+    frontier = sigma.copy()
+    level = 0
+    while True:
+        paths = pattern @ frontier
+        reached = (paths > 0) & (dist < 0)
+        if not reached.any():
+            break
+        level += 1
+        sigma[reached] = paths[reached]
+        dist[reached] = level
+        frontier = np.where(reached, sigma, 0.0)
+
+    delta = np.zeros((m, b))
+    safe_sigma = np.where(sigma > 0, sigma, 1.0)
+    for d in range(level, 0, -1):
+        coeff = np.where(dist == d, (1.0 + delta) / safe_sigma, 0.0)
+        delta += np.where(dist == d - 1, sigma * (pattern @ coeff), 0.0)
+
+    delta[sources, columns] = 0.0
+    return delta.sum(axis=1)
+
+
+def _raw_betweenness(pattern: sp.csr_array, sources: np.ndarray) -> np.ndarray:
+    """
+    Unnormalized betweenness from the given sources. Sources are grouped
+    by connected component; small components are packed into one block
+    and large ones split into batches, so each block's dense
+    nodes x sources arrays stay within settings.CSR_BATCH_CELLS.
+    """
+    n = pattern.shape[0]
+    centrality = np.zeros(n)
+    count, labels = connected_components(pattern, directed=False)
+    sizes = np.bincount(labels, minlength=count)
+    source_counts = np.bincount(labels[sources], minlength=count)
+    members = np.argsort(labels, kind="stable")
+    starts = np.concatenate([[0], np.cumsum(sizes)])
+
+    # Components of one or two nodes have no node between two others
+    blocks: List[List[int]] = []
+    block_nodes = block_sources = 0
+    for component in np.flatnonzero((source_counts > 0) & (sizes > 2)):
+        nodes, sourced = sizes[component], source_counts[component]
+        if blocks and (block_nodes + nodes) * (block_sources + sourced) <= settings.CSR_BATCH_CELLS:
+            blocks[-1].append(component)
+            block_nodes += nodes
+            block_sources += sourced
+        else:
+            blocks.append([component])
+            block_nodes, block_sources = nodes, sourced
+
+    local = np.empty(n, dtype=np.int64)
+    for block in blocks:
+        nodes = np.concatenate([members[starts[c]:starts[c + 1]] for c in block])
+        local[nodes] = np.arange(len(nodes))
+        block_sources = local[sources[np.isin(labels[sources], block)]]
+        sub = pattern[nodes][:, nodes].tocsr()
+
+        batch = max(1, settings.CSR_BATCH_CELLS // len(nodes))
+        for start in range(0, len(block_sources), batch):
+            centrality[nodes] += _dependencies(sub, block_sources[start:start + batch])
+
+    return centrality
+
+
+def _csr_centrality(
+    adjacency: sp.csr_array,
+    mode: str,
+    sample_size: Optional[int] = None
+) -> Tuple[np.ndarray, np.ndarray, str, Optional[int]]:
+    """
+    Degree centrality and betweenness as graph_engine._compute_centrality
+    computes them with networkx, including the pivots a sampled run
+    draws and its rescaling. Runs in the CPU process pool.
+    Returns (degree centrality, betweenness, mode used, sample size).
+    """
+    n = adjacency.shape[0]
+    if not n:
+        return np.zeros(0), np.zeros(0), "exact", None
+
+    graph = CSRGraph(np.arange(n), adjacency)
+    degree_centrality = (
+        graph.degree() * (1.0 / (n - 1)) if n > 1 else np.ones(n)
+    )
+
+    mode_used, k = _resolve_mode(n, graph.number_of_edges(), mode, sample_size)
+    if mode_used == "sampled":
+        # networkx samples positions in node order, which is id order
+        sources = np.array(random.Random(settings.BETWEENNESS_SEED).sample(range(n), k))
+    else:
+        sources = np.arange(n)
+
+    pattern = sp.csr_array(
+        (np.ones(adjacency.nnz), adjacency.indices, adjacency.indptr), shape=(n, n)
+    )
+    betweenness = _raw_betweenness(pattern, sources)
+
+    # Normalized like nx.betweenness_centrality, endpoints excluded
+    N = n - 1
+    if N < 2:
+        return degree_centrality, betweenness, mode_used, k
+    if mode_used == "exact":
+        return degree_centrality, betweenness / (N * (N - 1)), mode_used, None
+
+    # _resolve_mode guarantees k >= 2
+    scale = np.full(n, 1 / (k * (N - 1)))
+    scale[sources] = 1 / ((k - 1) * (N - 1))
+    return degree_centrality, betweenness * scale, mode_used, k
+
+
+def csr_graph_elements(
+    conn: sqlite3.Connection,
+    focus_user: Optional[str] = None,
+    suspicious_users: Optional[List[str]] = None,
+    min_edge_weight: int = 1,
+    centrality_mode: str = "auto",
+    sample_size: Optional[int] = None,
+    case_id: Optional[str] = None
+) -> Tuple[List[Dict], List[Dict], str, Optional[int]]:
+    """
+    build_graph's nodes and edges, in the same id order, from the array
+    backend. suspicious_users, when given, restricts the graph to them.
+    Returns (nodes, edges, mode used, sample size).
+    """
+    graph = load_csr_graph(conn, min_edge_weight, focus_user, case_id)
+    if suspicious_users is not None:
+        graph = graph.subgraph(suspicious_users)
+
+    # ---- Centrality Metrics (CPU-bound: off to the process pool) ----
+    degree_centrality, betweenness, mode_used, pivots = run_cpu(
+        _csr_centrality, graph.adjacency, centrality_mode, sample_size
+    )
+
+    nodes = [
+        {
+            "id": node,
+            "degree": degree,
+            "degree_centrality": round(dc, 4),
+            "betweenness_centrality": round(bc, 4),
+        }
+        for node, degree, dc, bc in zip(
+            graph.ids.tolist(),
+            graph.degree().tolist(),
+            degree_centrality.tolist(),
+            betweenness.tolist()
+        )
+    ]
+
+    sources, targets, weights = graph.edges()
+    edges = [
+        {
+            "source": source,
+            "target": target,
+            "weight": weight
+        }
+        for source, target, weight in zip(sources.tolist(), targets.tolist(), weights.tolist())
+    ]
+    return nodes, edges, mode_used, pivots
@@ -1,97 +1,621 @@
 import networkx as nx
-from typing import Dict, Optional
-from app.core.database import get_connection
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+from app.core.config import settings
+from app.core.cache import get_cache
+from app.core.database import case_connection, current_generation, map_shards, spans_shards
+from app.core.executors import job_executor, run_cpu
 from app.services.risk_engine import compute_suspicious_users
 
 
-def build_graph(
-    focus_user: Optional[str] = None,
-    suspicious_only: bool = False,
-    min_edge_weight: int = 1
-) -> Dict:
+REFRESH_EDGE_WEIGHTS_SQL = """
+    INSERT INTO edge_weights (case_id, node_a, node_b, weight)
+    SELECT
+        COALESCE(case_id, ''),
+        MIN(actor_id, target_id),
+        MAX(actor_id, target_id),
+        COUNT(*)
+    FROM events
+    WHERE id > ?
+      AND actor_id IS NOT NULL AND actor_id != ''
+      AND target_id IS NOT NULL AND target_id != ''
+    GROUP BY COALESCE(case_id, ''), MIN(actor_id, target_id), MAX(actor_id, target_id)
+    ON CONFLICT (case_id, node_a, node_b) DO UPDATE SET
+        weight = weight + excluded.weight
+"""
+
+
+def refresh_edge_weights(cursor, since_id: int = 0) -> None:
     """
-    Builds communication graph from events table.
+    Folds events with id > since_id into the edge_weights pair counts.
+    Called by ingestion inside its transaction, like refresh_user_risk_stats.
+    """
+    cursor.execute(REFRESH_EDGE_WEIGHTS_SQL, (since_id,))
 
-    Parameters:
-        focus_user: Optional filter to build graph around a specific user
-        suspicious_only: Build graph only around high-risk users
-        min_edge_weight: Filter edges below weight threshold
 
-    Returns:
-        Dictionary with nodes and edges.
+def rebuild_edge_weights(cursor) -> None:
     """
+    Recomputes edge_weights from scratch from the events table.
+    """
+    cursor.execute("DELETE FROM edge_weights")
+    refresh_edge_weights(cursor, since_id=0)
 
-    conn = get_connection()
-    cursor = conn.cursor()
 
-    if focus_user:
-        rows = cursor.execute(
-            "SELECT * FROM events WHERE actor_id = ? OR target_id = ?",
-            (focus_user, focus_user)
-        ).fetchall()
-    else:
-        rows = cursor.execute("SELECT * FROM events").fetchall()
+CENTRALITY_MODES = ("exact", "sampled", "auto")
 
-    conn.close()
 
-    G = nx.Graph()
+def _resolve_mode(
+    nodes: int,
+    edges: int,
+    mode: str,
+    sample_size: Optional[int] = None
+) -> Tuple[str, Optional[int]]:
+    """
+    The betweenness computation a graph of this size gets in the requested
+    mode (see _betweenness): ("sampled", k) or ("exact", None).
+    """
+    if mode == "auto":
+        too_large = (
+            nodes > settings.BETWEENNESS_EXACT_MAX_NODES
+            or edges > settings.BETWEENNESS_EXACT_MAX_EDGES
+        )
+        mode = "sampled" if too_large else "exact"
 
-    # ---- Build edges ----
-    for row in rows:
-        sender = row["actor_id"]
-        receiver = row["target_id"]
+    if mode == "sampled":
+        # Pivot sources are rescaled by 1 / (k - 1), undefined for k = 1
+        k = max(2, min(sample_size or settings.BETWEENNESS_SAMPLE_SIZE, nodes))
+        # Sampling every node is the exact computation
+        if k < nodes:
+            return "sampled", k
 
-        if sender and receiver:
-            if G.has_edge(sender, receiver):
-                G[sender][receiver]["weight"] += 1
-            else:
-                G.add_edge(sender, receiver, weight=1)
+    return "exact", None
 
-    # ---- Suspicious subgraph filtering ----
-    suspicious_users = []
-    if suspicious_only:
-        suspicious_list = compute_suspicious_users()
-        suspicious_users = [user["user"] for user in suspicious_list]
 
-        G = G.subgraph(suspicious_users).copy()
+def _betweenness(
+    G: nx.Graph,
+    mode: str,
+    sample_size: Optional[int] = None
+) -> Tuple[Dict, str, Optional[int]]:
+    """
+    Betweenness centrality in the requested mode:
+        exact   : all-pairs Brandes, O(V·E)
+        sampled : k-pivot estimate with a fixed seed, O(k·E)
+        auto    : exact unless the graph exceeds the configured node/edge
+                  limits, in which case it falls back to sampled
 
-    # ---- Edge weight filtering ----
-    edges_to_remove = [
-        (u, v)
-        for u, v, d in G.edges(data=True)
-        if d["weight"] < min_edge_weight
-    ]
-    G.remove_edges_from(edges_to_remove)
+    Returns (centrality, mode used, sample size or None when exact).
+    """
+    n = G.number_of_nodes()
+    if not n:
+        return {}, "exact", None
 
-    # Remove isolated nodes
-    G.remove_nodes_from(list(nx.isolates(G)))
+    mode, k = _resolve_mode(n, G.number_of_edges(), mode, sample_size)
+    if mode == "sampled":
+        # Pivots are drawn from the node order, which depends on how G was
+        # assembled (incrementally or not); sample from id order instead
+        ordered = nx.Graph()
+        ordered.add_nodes_from(sorted(G.nodes()))
+        ordered.add_edges_from(G.edges())
+        centrality = nx.betweenness_centrality(
+            ordered, k=k, seed=settings.BETWEENNESS_SEED
+        )
+        return centrality, "sampled", k
 
-    # ---- Centrality Metrics ----
+    return nx.betweenness_centrality(G), "exact", None
+
+
+def _component_betweenness(components: List[nx.Graph]) -> Dict:
+    """
+    Exact, unnormalized betweenness of the nodes of each connected
+    component. Runs in the CPU process pool.
+    """
+    centrality = {}
+    for component in components:
+        centrality.update(nx.betweenness_centrality(component, normalized=False))
+    return centrality
+
+
+def _compute_centrality(
+    G: nx.Graph,
+    mode: str,
+    sample_size: Optional[int] = None
+) -> Tuple[Dict, Dict, str, Optional[int]]:
+    """
+    Degree and betweenness centrality for G. Runs in the CPU process pool.
+    Returns (degree centrality, betweenness, mode used, sample size).
+    """
     degree_centrality = nx.degree_centrality(G) if G.nodes else {}
-    betweenness = nx.betweenness_centrality(G) if G.nodes else {}
+    betweenness, mode_used, pivots = _betweenness(G, mode, sample_size)
+    return degree_centrality, betweenness, mode_used, pivots
+
+
+def edges_query(
+    min_edge_weight: int = 1,
+    focus_user: Optional[str] = None,
+    case_id: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Aggregated edges, summed across cases or scoped to one case (a prefix
+    of the edge_weights primary key); focus_user uses the node indexes.
+    Returns (sql, params).
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+
+    if case_id:
+        conditions.append("case_id = ?")
+        params.append(case_id)
+
+    if focus_user:
+        conditions.append("(node_a = ? OR node_b = ?)")
+        params.extend([focus_user, focus_user])
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(min_edge_weight)
+
+    query = f"""
+        SELECT node_a, node_b, SUM(weight) AS weight
+        FROM edge_weights
+        {where}
+        GROUP BY node_a, node_b
+        HAVING SUM(weight) >= ?
+    """
+    return query, params
+
+
+def edge_deltas_query(
+    since_id: int,
+    max_id: int,
+    case_id: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Pair counts of the events with since_id < id <= max_id, grouped like
+    REFRESH_EDGE_WEIGHTS_SQL: a rowid range of events. Returns (sql, params).
+    """
+    params: List[Any] = [since_id, max_id]
+    case_filter = ""
+    if case_id:
+        # Unary + keeps the case index out: the new rows are a short id range
+        case_filter = "AND +case_id = ?"
+        params.append(case_id)
+
+    query = f"""
+        SELECT
+            MIN(actor_id, target_id) AS node_a,
+            MAX(actor_id, target_id) AS node_b,
+            COUNT(*) AS weight
+        FROM events
+        WHERE id > ? AND id <= ?
+          AND actor_id IS NOT NULL AND actor_id != ''
+          AND target_id IS NOT NULL AND target_id != ''
+          {case_filter}
+        GROUP BY 1, 2
+    """
+    return query, params
+
+
+def _database_file(conn: sqlite3.Connection) -> str:
+    return conn.execute("PRAGMA database_list").fetchone()[2]
+
+
+class GraphSnapshot:
+    """
+    The communication graph of one scope (all cases or one case, edges of
+    at least min_edge_weight), kept in memory between requests. Instead
+    of being rebuilt, it is brought up to date by applying the pair
+    counts of the events inserted since its high-water mark (the largest
+    events.id it has seen, per database file).
+
+    Degree metrics are derived from the graph as it stands, so they are
+    always exact. Exact betweenness is kept unnormalized per connected
+    component: a batch only has the components it added edges to
+    recomputed, and normalizing by the node count when the graph is read
+    gives the same values as a full computation. Weight changes alone
+    leave betweenness untouched, since it counts hops. Sampled
+    betweenness does not decompose by component; once computed, it is
+    refreshed in the background and the previous values are served,
+    marked stale, meanwhile.
+
+    Events are only deleted by split-cases, before a restart in sharded
+    mode. A database that disappears or whose largest id goes backwards
+    (archive-case, a replaced file) reloads the snapshot from edge_weights.
+    """
+
+    def __init__(self, case_id: Optional[str], min_edge_weight: int):
+        self.case_id = case_id
+        self.min_edge_weight = min_edge_weight
+        # Held while the graph is read or changed; not while sampled
+        # betweenness is recomputed in the background
+        self.lock = threading.RLock()
+        # centrality_mode and sample_size of the last request, which a
+        # background refresh precomputes
+        self.last_mode: Tuple[str, Optional[int]] = ("auto", None)
+        # Bumped whenever edges are added, and by reloads, so background
+        # results computed before a reload are never taken as current
+        self._version = 0
+        self._reset()
+
+    def _reset(self) -> None:
+        self.weights: Dict[Tuple[str, str], int] = {}   # every pair, any weight
+        self.graph = nx.Graph()                         # pairs >= min_edge_weight
+        self.high_water: Dict[str, int] = {}            # database file -> max events.id
+        self._raw_betweenness: Dict[str, float] = {}
+        self._dirty: Set[str] = set()   # nodes whose component gained edges
+        self._version += 1
+        self._sampled: Dict[int, Tuple[int, Dict]] = {}     # k -> (version, betweenness)
+        self._refreshing: Set[int] = set()
+
+    # ---- Edge deltas ----
+
+    def _read(self, conn: sqlite3.Connection) -> Tuple[str, bool, int, List]:
+        """
+        One database's changes since the high-water mark, read in a single
+        transaction so they match the id they run up to. A database not
+        seen yet (or rewound) is read whole from edge_weights.
+        Returns (database file, whole, max events.id, pair rows).
+        """
+        path = _database_file(conn)
+        since = self.high_water.get(path)
+        conn.execute("BEGIN")
+        try:
+            max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+            if since is None or max_id < since:
+                return path, True, max_id, conn.execute(
+                    *edges_query(1, None, self.case_id)
+                ).fetchall()
+            if max_id == since:
+                return path, False, max_id, []
+            return path, False, max_id, conn.execute(
+                *edge_deltas_query(since, max_id, self.case_id)
+            ).fetchall()
+        finally:
+            conn.execute("COMMIT")
+
+    def _read_all(self, conn: sqlite3.Connection) -> List[Tuple[str, bool, int, List]]:
+        if spans_shards(self.case_id):
+            return map_shards(lambda shard_conn, _: self._read(shard_conn), conn)
+        return [self._read(conn)]
+
+    def refresh(self, conn: sqlite3.Connection) -> None:
+        """
+        Applies the events committed since the last refresh. In sharded
+        mode conn must be the case's shard; without a case_id every shard
+        is read.
+        """
+        with self.lock:
+            batches = self._read_all(conn)
+            paths = {path for path, _, _, _ in batches}
+            rewound = any(whole and path in self.high_water for path, whole, _, _ in batches)
+            if rewound or not paths >= set(self.high_water):
+                self._reset()
+                batches = self._read_all(conn)
+
+            added = False
+            for path, _, max_id, rows in batches:
+                for node_a, node_b, delta in rows:
+                    added = self._apply(node_a, node_b, delta) or added
+                self.high_water[path] = max_id
+            if added:
+                self._version += 1
+
+    def _apply(self, node_a: str, node_b: str, delta: int) -> bool:
+        """Adds delta to a pair's weight; True if that adds an edge."""
+        old = self.weights.get((node_a, node_b), 0)
+        new = old + delta
+        self.weights[node_a, node_b] = new
+        if new < self.min_edge_weight:
+            return False
+        if old >= self.min_edge_weight:
+            self.graph[node_a][node_b]["weight"] = new
+            return False
+        self.graph.add_edge(node_a, node_b, weight=new)
+        self._dirty.update((node_a, node_b))
+        return True
 
-    nodes = []
-    for node in G.nodes():
-        nodes.append({
+    # ---- Centrality ----
+
+    def _exact_betweenness(self) -> Dict:
+        """
+        Recomputes the components with new edges, then normalizes the
+        kept values like nx.betweenness_centrality over the whole graph.
+        """
+        if self._dirty:
+            seen: Set[str] = set()
+            components = []
+            for node in self._dirty:
+                if node in seen:
+                    continue
+                component = nx.node_connected_component(self.graph, node)
+                seen |= component
+                if len(component) > 2:
+                    components.append(self.graph.subgraph(component).copy())
+                else:
+                    # No node lies between two others
+                    self._raw_betweenness.update(dict.fromkeys(component, 0.0))
+            if components:
+                self._raw_betweenness.update(run_cpu(_component_betweenness, components))
+            self._dirty.clear()
+
+        n = self.graph.number_of_nodes()
+        # Undirected: unnormalized values are already halved
+        scale = 2 / ((n - 1) * (n - 2)) if n > 2 else 1
+        return {node: value * scale for node, value in self._raw_betweenness.items()}
+
+    def _sampled_betweenness(self, k: int, wait: bool) -> Tuple[Dict, bool]:
+        """
+        Sampled betweenness with k pivots and whether it predates the
+        latest edges. Computed here the first time (or with wait),
+        afterwards in the background. Returns (centrality, stale).
+        """
+        version, centrality = self._sampled.get(k, (None, None))
+        if version == self._version:
+            return centrality, False
+        if centrality is None or wait:
+            centrality, _, _ = run_cpu(_betweenness, self.graph, "sampled", k)
+            self._sampled[k] = (self._version, centrality)
+            return centrality, False
+
+        if k not in self._refreshing:
+            self._refreshing.add(k)
+            job_executor().submit(
+                self._recompute_sampled, self.graph.copy(), self._version, k
+            )
+        return centrality, True
+
+    def _recompute_sampled(self, G: nx.Graph, version: int, k: int) -> None:
+        try:
+            centrality, _, _ = run_cpu(_betweenness, G, "sampled", k)
+            with self.lock:
+                if self._sampled.get(k, (-1, None))[0] < version:
+                    self._sampled[k] = (version, centrality)
+        except Exception as e:
+            print(f"[graph] Sampled betweenness refresh failed: {e}")
+        finally:
+            with self.lock:
+                self._refreshing.discard(k)
+
+    def centrality(
+        self,
+        mode: str,
+        sample_size: Optional[int] = None,
+        wait: bool = False
+    ) -> Tuple[Dict, Dict, str, Optional[int], bool]:
+        """
+        Centrality of the snapshot as _compute_centrality would return it,
+        plus whether betweenness is stale.
+        Returns (degree centrality, betweenness, mode used, sample size, stale).
+        """
+        with self.lock:
+            self.last_mode = (mode, sample_size)
+            G = self.graph
+            if not G.number_of_nodes():
+                return {}, {}, "exact", None, False
+
+            degree_centrality = nx.degree_centrality(G)
+            mode_used, k = _resolve_mode(
+                G.number_of_nodes(), G.number_of_edges(), mode, sample_size
+            )
+            if mode_used == "sampled":
+                betweenness, stale = self._sampled_betweenness(k, wait)
+                return degree_centrality, betweenness, mode_used, k, stale
+            return degree_centrality, self._exact_betweenness(), mode_used, None, False
+
+
+_snapshots: "OrderedDict[Tuple[Optional[str], int], GraphSnapshot]" = OrderedDict()
+_snapshots_lock = threading.Lock()
+
+
+def graph_snapshot(
+    conn: sqlite3.Connection,
+    case_id: Optional[str] = None,
+    min_edge_weight: int = 1
+) -> GraphSnapshot:
+    """
+    The up-to-date snapshot of a scope, created on first use. At most
+    settings.GRAPH_SNAPSHOTS are kept, least recently used dropped first.
+    """
+    key = (case_id, min_edge_weight)
+    with _snapshots_lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is None:
+            snapshot = GraphSnapshot(case_id, min_edge_weight)
+            _snapshots[key] = snapshot
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > settings.GRAPH_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+
+    snapshot.refresh(conn)
+    return snapshot
+
+
+def refresh_graph_snapshots() -> None:
+    """
+    Brings every kept snapshot up to date, and its centrality for the
+    mode last requested, so /graph after an ingestion is served without
+    waiting. Runs on the job executor; see schedule_graph_refresh.
+    """
+    with _snapshots_lock:
+        snapshots = list(_snapshots.values())
+
+    for snapshot in snapshots:
+        try:
+            with case_connection(snapshot.case_id) as conn:
+                snapshot.refresh(conn)
+            snapshot.centrality(*snapshot.last_mode, wait=True)
+        except Exception as e:
+            print(f"[graph] Snapshot refresh failed for case {snapshot.case_id!r}: {e}")
+
+
+def schedule_graph_refresh() -> None:
+    """Refreshes the kept snapshots in the background, if there are any."""
+    if _snapshots:
+        job_executor().submit(refresh_graph_snapshots)
+
+
+def _graph_elements(
+    G: nx.Graph,
+    degree_centrality: Dict,
+    betweenness: Dict
+) -> Tuple[List[Dict], List[Dict]]:
+    """
+    Node and edge records of G, in id order so that results compare equal
+    however the graph was assembled. Returns (nodes, edges).
+    """
+    nodes = [
+        {
             "id": node,
             "degree": G.degree(node),
             "degree_centrality": round(degree_centrality.get(node, 0), 4),
             "betweenness_centrality": round(betweenness.get(node, 0), 4),
-        })
+        }
+        for node in sorted(G.nodes())
+    ]
 
     edges = [
         {
-            "source": u,
-            "target": v,
-            "weight": d["weight"]
+            "source": source,
+            "target": target,
+            "weight": weight
         }
-        for u, v, d in G.edges(data=True)
+        for source, target, weight in sorted(
+            (min(u, v), max(u, v), d["weight"]) for u, v, d in G.edges(data=True)
+        )
     ]
+    return nodes, edges
+
+
+def _csr_backend():
+    """app.services.csr_graph, imported on first use: it needs scipy."""
+    try:
+        from app.services import csr_graph
+    except ImportError as e:
+        raise RuntimeError(f"GRAPH_BACKEND = 'csr' requires scipy: {e}") from e
+    return csr_graph
+
+
+# ---- Graph result cache ----
+# Keyed by the ingestion generation plus every build_graph parameter
+# (see app.core.cache); case-scoped graphs use their case's own
+# generation, so ingesting one case leaves other cases' entries valid.
+_graph_cache = get_cache("graph", settings.GRAPH_CACHE_SIZE)
 
-    return {
+
+def build_graph(
+    conn: sqlite3.Connection,
+    focus_user: Optional[str] = None,
+    suspicious_only: bool = False,
+    min_edge_weight: int = 1,
+    centrality_mode: str = "auto",
+    sample_size: Optional[int] = None,
+    case_id: Optional[str] = None
+) -> Dict:
+    """
+    Builds communication graph from the scope's GraphSnapshot.
+
+    Parameters:
+        focus_user: Optional filter to build graph around a specific user
+        suspicious_only: Build graph only around high-risk users
+        min_edge_weight: Filter edges below weight threshold
+        centrality_mode: "exact", "sampled" or "auto" betweenness (see _betweenness)
+        sample_size: Pivot count for sampled betweenness
+        case_id: Only edges (and suspicious users) of this case; in
+                 sharded mode conn must be its shard, and without a
+                 case_id edges are summed across every shard
+
+    The whole graph is served from the snapshot's incrementally
+    maintained centrality. Focused and suspicious-only graphs are
+    subgraphs whose centrality is computed for them alone. With
+    settings.GRAPH_BACKEND = "csr" the array backend builds the same
+    result instead (see app.services.csr_graph).
+
+    Returns:
+        Dictionary with nodes, edges and the centrality mode actually used.
+    """
+
+    cache_key = (
+        case_id, current_generation(conn, case_id), focus_user, suspicious_only,
+        min_edge_weight, centrality_mode, sample_size
+    )
+    cached = _graph_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # ---- Suspicious users (before the snapshot lock is taken) ----
+    suspicious_users = []
+    if suspicious_only:
+        suspicious_list = compute_suspicious_users(conn, case_id=case_id)
+        suspicious_users = [user["user"] for user in suspicious_list]
+
+    stale = False
+    if settings.GRAPH_BACKEND == "csr":
+        nodes, edges, mode_used, pivots = _csr_backend().csr_graph_elements(
+            conn, focus_user, suspicious_users if suspicious_only else None,
+            min_edge_weight, centrality_mode, sample_size, case_id
+        )
+    elif not (focus_user or suspicious_only):
+        snapshot = graph_snapshot(conn, case_id, min_edge_weight)
+        with snapshot.lock:
+            degree_centrality, betweenness, mode_used, pivots, stale = snapshot.centrality(
+                centrality_mode, sample_size
+            )
+            nodes, edges = _graph_elements(snapshot.graph, degree_centrality, betweenness)
+    else:
+        snapshot = graph_snapshot(conn, case_id, min_edge_weight)
+        with snapshot.lock:
+            if focus_user:
+                G = nx.Graph()
+                if focus_user in snapshot.graph:
+                    G.add_edges_from(snapshot.graph.edges(focus_user, data=True))
+                if suspicious_only:
+                    G = G.subgraph(suspicious_users).copy()
+            else:
+                G = snapshot.graph.subgraph(suspicious_users).copy()
+
+        # Remove isolated nodes
+        G.remove_nodes_from(list(nx.isolates(G)))
+
+        # ---- Centrality Metrics (CPU-bound: off to the process pool) ----
+        degree_centrality, betweenness, mode_used, pivots = run_cpu(
+            _compute_centrality, G, centrality_mode, sample_size
+        )
+        nodes, edges = _graph_elements(G, degree_centrality, betweenness)
+
+    result = {
         "total_nodes": len(nodes),
         "total_edges": len(edges),
+        "case_id": case_id,
         "suspicious_users": suspicious_users if suspicious_only else None,
+        "centrality": {
+            "requested_mode": centrality_mode,
+            "mode": mode_used,
+            "sample_size": pivots,
+            "stale": stale,
+        },
         "nodes": nodes,
         "edges": edges
     }
+
+    # A stale result would outlive the background refresh
+    if not stale:
+        _graph_cache.put(cache_key, result)
+    return result
+
+
+def iter_graph_records(graph_data: Dict) -> Iterator[Dict]:
+    """
+    Flattens a build_graph result into records for line-oriented export:
+    one "graph" summary record, then one record per node and per edge.
+    """
+    yield {
+        "type": "graph",
+        **{
+            key: value for key, value in graph_data.items()
+            if key not in ("nodes", "edges")
+        }
+    }
+    for node in graph_data["nodes"]:
+        yield {"type": "node", **node}
+    for edge in graph_data["edges"]:
+        yield {"type": "edge", **edge}
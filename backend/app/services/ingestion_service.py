@@ -1,10 +1,19 @@
 import pandas as pd
 import sqlite3
-import json
+import shutil
+import tempfile
 import uuid
-from contextlib import contextmanager
-from typing import List, Tuple
-from app.core.database import get_connection
+from collections import deque
+from pathlib import Path
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+from app.core.config import settings
+from app.core.database import bump_ingestion_generation, get_pool, resolve_case_db
+from app.core.executors import cpu_executor
+from app.utils.helpers import encode_metadata
+from app.services.risk_engine import refresh_user_risk_stats
+from app.services.graph_engine import refresh_edge_weights, schedule_graph_refresh
+from app.services.timeline_service import refresh_event_rollups, refresh_events_fts
+from app.services.stats_service import refresh_stats_counters
 
 
 SUPPORTED_SOURCES = {
@@ -17,223 +26,723 @@ SUPPORTED_SOURCES = {
 }
 
 
-@contextmanager
-def managed_connection():
-    conn = get_connection()
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
-
-
-def _parse_timestamps(df: pd.DataFrame, filename: str, skip_reasons: list) -> pd.DataFrame:
-    """Try multiple common formats before falling back to slow parse."""
-    FORMATS_TO_TRY = [
-        "%Y-%m-%d %H:%M:%S",
-        "%d/%m/%Y %H:%M:%S",
-        "%m/%d/%Y %H:%M:%S",
-        "%d-%m-%Y %H:%M:%S",
-        "%Y/%m/%d %H:%M:%S",
-        "%d/%m/%Y %H:%M",
-        "%m/%d/%Y %H:%M",
-        "%d-%m-%Y %H:%M",
-        "%Y-%m-%dT%H:%M:%S",
-        "%Y-%m-%dT%H:%M:%SZ",
-        "%m/%d/%Y %I:%M %p",
-        "%d/%m/%Y %I:%M %p",
-    ]
-
-    for fmt in FORMATS_TO_TRY:
-        parsed = pd.to_datetime(df["timestamp"], format=fmt, errors="coerce")
-        if parsed.notna().mean() > 0.9:
-            df["timestamp"] = parsed
-            bad = df["timestamp"].isna().sum()
-            if bad:
-                skip_reasons.append(
-                    f"[{filename}] Dropped {bad} rows with unparseable timestamps (format: {fmt})"
-                )
-            return df.dropna(subset=["timestamp"])
+class _Writers:
+    """
+    Write transactions of one ingestion. Events go to the given connection,
+    except in sharded mode, where each case's events go to a connection
+    to its shard, checked out on first use. All transactions commit or
+    roll back together, though not atomically across files.
+    """
 
-    # Last resort
-    skip_reasons.append(
-        f"[{filename}] WARNING: Could not detect timestamp format, falling back to slow parse."
-    )
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+        self._main = conn.cursor()
+        self._shards = {}   # path -> (pool, conn, cursor)
+
+    def cursor(self, case_id: Optional[str] = None) -> sqlite3.Cursor:
+        if not settings.CASE_SHARDS or not case_id:
+            return self._main
+        path = resolve_case_db(case_id, create=True)
+        if path not in self._shards:
+            pool = get_pool(path)
+            shard = pool.acquire()
+            self._shards[path] = (pool, shard, shard.cursor())
+        return self._shards[path][2]
+
+    def commit(self) -> None:
+        for _, shard, _ in self._shards.values():
+            shard.commit()
+        self.conn.commit()
+
+    def __enter__(self) -> "_Writers":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.conn.rollback()
+        finally:
+            # release() rolls back whatever a failure left uncommitted
+            for pool, shard, _ in self._shards.values():
+                pool.release(shard)
+
+
+class PreparedFrame(NamedTuple):
+    """A parsed and normalized frame, ready for the writer."""
+    events: Optional[pd.DataFrame]  # normalized events, None if nothing to insert
+    skipped: int                    # rows rejected before insertion
+    rows: int                       # raw rows read
+    fmt: Optional[str]              # detected timestamp format
+    skip_reasons: list
+
+
+TIMESTAMP_FORMATS = [
+    "%Y-%m-%d %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%d-%m-%Y %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%d/%m/%Y %H:%M",
+    "%m/%d/%Y %H:%M",
+    "%d-%m-%Y %H:%M",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%dT%H:%M:%SZ",
+    "%m/%d/%Y %I:%M %p",
+    "%d/%m/%Y %I:%M %p",
+]
+
+
+def _sample(values: pd.Series, size: int) -> pd.Series:
+    """Up to `size` non-null values spread evenly over the column."""
+    values = values.dropna()
+    step = max(1, len(values) // size)
+    return values.iloc[::step].head(size)
+
+
+def _rank_formats(values: pd.Series, preferred_format: Optional[str] = None) -> List[str]:
+    """
+    Formats ranked by match rate on a sample of the column, best first,
+    with ties in TIMESTAMP_FORMATS order and preferred_format ahead of all.
+    The first format matching more than 90% of the sample is returned
+    alone without trying the rest: it is the one the whole column gets.
+    """
+    formats = list(TIMESTAMP_FORMATS)
+    if preferred_format:
+        formats = [preferred_format] + [fmt for fmt in formats if fmt != preferred_format]
+
+    sample = _sample(values, settings.TIMESTAMP_SAMPLE_SIZE)
+    if sample.empty:
+        return []
+
+    rates = []
+    for fmt in formats:
+        rate = pd.to_datetime(sample, format=fmt, errors="coerce").notna().mean()
+        if rate > 0.9:
+            return [fmt]
+        if rate > 0:
+            rates.append((fmt, rate))
+    return [fmt for fmt, _ in sorted(rates, key=lambda r: -r[1])]
+
+
+def _parse_timestamps(
+    df: pd.DataFrame,
+    filename: str,
+    skip_reasons: list,
+    preferred_format: Optional[str] = None,
+) -> Tuple[pd.DataFrame, Optional[str]]:
+    """
+    Detect the timestamp format on a bounded sample of the column
+    (settings.TIMESTAMP_SAMPLE_SIZE rows), then parse the full column once
+    with it. Rows it does not match are parsed in groups with the next
+    formats in sample order, each pass only over the rows still unparsed,
+    so mixed-format columns cost one pass per format present. Only rows no
+    known format matches fall back to slow, per-value parsing. A column
+    whose sample matches no known format gets just that slow pass (after
+    preferred_format, if given) instead of one pass per known format.
+    preferred_format (the format detected on a previous chunk of the same
+    file) wins ties so that every chunk of a file parses alike. Other ties
+    go to TIMESTAMP_FORMATS order, so values valid as both dd/mm and mm/dd
+    parse day first however much of the column they make up (the old
+    parser only did above 90%, and otherwise let pandas guess month
+    first). Timestamps with a UTC offset are converted to naive UTC.
+    Returns (parsed frame, detected format or None).
+    """
+    values = df["timestamp"]
+    formats = _rank_formats(values, preferred_format)
+    if formats:
+        # Rows not in the sample may use formats it missed: try those last
+        formats += [fmt for fmt in TIMESTAMP_FORMATS if fmt not in formats]
+    elif preferred_format:
+        formats = [preferred_format]
+
+    parsed  = None
+    pending = values.notna()
+    counts  = {}
+
+    for fmt in formats:
+        if parsed is None:
+            parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+            matched = parsed.notna()
+        else:
+            part = pd.to_datetime(values[pending], format=fmt, errors="coerce").dropna()
+            parsed.loc[part.index] = part
+            matched = pd.Series(False, index=values.index)
+            matched.loc[part.index] = True
+
+        counts[fmt] = int((matched & pending).sum())
+        pending &= ~matched
+        if not pending.any():
+            break
+
+    counts = {fmt: n for fmt, n in counts.items() if n}
+    fmt = max(counts, key=counts.get) if counts else None
+    if len(counts) > 1:
+        skip_reasons.append(
+            f"[{filename}] Mixed timestamp formats: "
+            + ", ".join(f"{f} ({n} rows)" for f, n in counts.items())
+        )
+
+    if parsed is None:
+        parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+
+    # Last resort, for the rows no known format matched
+    if pending.any():
+        skip_reasons.append(
+            f"[{filename}] WARNING: {int(pending.sum())} timestamps match no known "
+            f"format, falling back to slow parse."
+        )
+        # Values with a UTC offset become naive UTC, like the Z format
+        slow = pd.to_datetime(values[pending], format="mixed", errors="coerce", utc=True)
+        slow = slow.dropna().dt.tz_convert(None)
+        parsed.loc[slow.index] = slow.astype(parsed.dtype)
+
+    df["timestamp"] = parsed
     bad = df["timestamp"].isna().sum()
     if bad:
-        skip_reasons.append(f"[{filename}] Dropped {bad} rows with unparseable timestamps.")
-    return df.dropna(subset=["timestamp"])
-
-
-def _normalize_row(row: dict, source_type: str) -> dict:
-    """Map raw row fields to unified events schema based on source_type."""
-    event_id     = str(uuid.uuid4())
-    actor        = None
-    target       = None
-    event_type   = None
-    message_text = None
-    deleted_flag = 0
-
-    if source_type == "whatsapp":
-        event_id     = row.get("message_id") or event_id
-        actor        = row.get("sender")
-        target       = row.get("receiver")
-        event_type   = "message"
-        message_text = row.get("message_text")
-        deleted_flag = int(row.get("deleted_flag") or 0)
-
-    elif source_type == "app_usage":
-        event_type   = "app_activity"
-        actor        = row.get("user_id")
-        message_text = f"{row.get('app_name')} - {row.get('action_type')}"
-
-    elif source_type == "locations":
-        event_type   = "location"
-        actor        = row.get("user_id")
-        message_text = f"Lat:{row.get('latitude')} Lon:{row.get('longitude')}"
-
-    elif source_type == "calls":
-        event_id     = row.get("call_id") or event_id
-        actor        = row.get("caller")
-        target       = row.get("receiver")
-        event_type   = "call"
-        message_text = f"{row.get('call_type')} - {row.get('duration_seconds')} sec"
-
-    elif source_type == "whatsapp_calls":
-        event_id     = row.get("call_id") or event_id
-        actor        = row.get("caller")
-        target       = row.get("receiver")
-        event_type   = "whatsapp_call"
-        message_text = f"{row.get('call_type')} - {row.get('duration_seconds')} sec"
-        deleted_flag = int(row.get("deleted_flag") or 0)
-
-    elif source_type == "upi_transactions":
-        event_id     = row.get("transaction_id") or event_id
-        actor        = row.get("sender_number")
-        target       = row.get("receiver_number")
-        event_type   = "upi_transaction"
-        message_text = f"₹{row.get('amount')} | {row.get('status')}"
-
-    return {
-        "event_id":     event_id,
-        "case_id":      row.get("case_id"),
-        "source_type":  source_type,
-        "event_type":   event_type,
-        "timestamp":    row.get("timestamp"),
-        "actor_id":     actor,
-        "target_id":    target,
-        "message_text": message_text,
-        "deleted_flag": deleted_flag,
-        "language":     row.get("language"),
-        "device_id":    row.get("device_id"),
-        "ip_address":   row.get("ip_address"),
-        "metadata":     json.dumps(row),
-    }
-
-
-INSERT_SQL = """
-    INSERT OR IGNORE INTO events (
-        event_id, case_id, source_type, event_type,
-        timestamp, actor_id, target_id, message_text,
-        deleted_flag, language, device_id, ip_address, metadata
-    ) VALUES (
-        :event_id, :case_id, :source_type, :event_type,
-        :timestamp, :actor_id, :target_id, :message_text,
-        :deleted_flag, :language, :device_id, :ip_address, :metadata
-    )
+        suffix = f" (format: {fmt})" if fmt else ""
+        skip_reasons.append(
+            f"[{filename}] Dropped {bad} rows with unparseable timestamps{suffix}"
+        )
+    return df.dropna(subset=["timestamp"]), fmt
+
+
+# Per-source mapping onto the unified events schema.
+#   id      : raw column used as event_id (falls back to a generated UUID)
+#   actor   : raw column mapped to actor_id
+#   target  : raw column mapped to target_id
+#   text    : (template, columns) rendered into message_text
+#   deleted : whether the source carries a deleted_flag column
+SOURCE_MAPPINGS = {
+    "whatsapp": {
+        "event_type": "message",
+        "id": "message_id",
+        "actor": "sender",
+        "target": "receiver",
+        "text": None,
+        "deleted": True,
+    },
+    "app_usage": {
+        "event_type": "app_activity",
+        "id": None,
+        "actor": "user_id",
+        "target": None,
+        "text": ("{} - {}", ["app_name", "action_type"]),
+        "deleted": False,
+    },
+    "locations": {
+        "event_type": "location",
+        "id": None,
+        "actor": "user_id",
+        "target": None,
+        "text": ("Lat:{} Lon:{}", ["latitude", "longitude"]),
+        "deleted": False,
+    },
+    "calls": {
+        "event_type": "call",
+        "id": "call_id",
+        "actor": "caller",
+        "target": "receiver",
+        "text": ("{} - {} sec", ["call_type", "duration_seconds"]),
+        "deleted": False,
+    },
+    "whatsapp_calls": {
+        "event_type": "whatsapp_call",
+        "id": "call_id",
+        "actor": "caller",
+        "target": "receiver",
+        "text": ("{} - {} sec", ["call_type", "duration_seconds"]),
+        "deleted": True,
+    },
+    "upi_transactions": {
+        "event_type": "upi_transaction",
+        "id": "transaction_id",
+        "actor": "sender_number",
+        "target": "receiver_number",
+        "text": ("₹{} | {}", ["amount", "status"]),
+        "deleted": False,
+    },
+}
+
+EVENT_COLUMNS = [
+    "event_id", "case_id", "source_type", "event_type",
+    "timestamp", "ts_epoch", "hour", "actor_id", "target_id", "message_text",
+    "deleted_flag", "language", "device_id", "ip_address", "metadata",
+]
+
+
+def mapped_fields(source_type: str) -> set:
+    """
+    Raw fields of a source that are stored in their own events columns and
+    so are left out of metadata. Fields rendered into a message_text
+    template are kept: the template does not preserve their values.
+    """
+    mapping = SOURCE_MAPPINGS[source_type]
+    fields = {"timestamp", "case_id", "language", "device_id", "ip_address"}
+    fields.update(mapping[key] for key in ("id", "actor", "target") if mapping[key])
+    if mapping["text"] is None:
+        fields.add("message_text")
+    if mapping["deleted"]:
+        fields.add("deleted_flag")
+    return fields
+
+
+def _column(df: pd.DataFrame, name: Optional[str]) -> pd.Series:
+    """Raw column as Python objects with NaN replaced by None (all None if absent)."""
+    if name is None or name not in df.columns:
+        return pd.Series([None] * len(df), index=df.index, dtype=object)
+    col = df[name].astype(object)
+    return col.where(col.notna(), None)
+
+
+def _normalize_frame(df: pd.DataFrame, source_type: str) -> pd.DataFrame:
+    """
+    Map a raw source frame (with parsed datetime timestamps) to the unified
+    events columns, column by column.
+    """
+    mapping = SOURCE_MAPPINGS[source_type]
+    out = pd.DataFrame(index=df.index)
+
+    # Naive timestamps are stored as text plus epoch seconds (wall time as UTC)
+    # and hour of day, so range filters and ordering can use plain indexes
+    stamps = df["timestamp"]
+    df = df.assign(timestamp=stamps.dt.strftime("%Y-%m-%d %H:%M:%S"))
+
+    # event_id: source id where truthy, otherwise a fresh UUID
+    ids = _column(df, mapping["id"])
+    missing = ids.isna() | (ids == "") | (ids == 0)
+    ids = ids.map(str, na_action="ignore")
+    if missing.any():
+        ids[missing] = [str(uuid.uuid4()) for _ in range(int(missing.sum()))]
+    out["event_id"] = ids
+
+    out["case_id"]     = _column(df, "case_id")
+    out["source_type"] = source_type
+    out["event_type"]  = mapping["event_type"]
+    out["timestamp"]   = df["timestamp"]
+    out["ts_epoch"]    = (stamps - pd.Timestamp("1970-01-01")) // pd.Timedelta(seconds=1)
+    out["hour"]        = stamps.dt.hour
+    out["actor_id"]    = _column(df, mapping["actor"])
+    out["target_id"]   = _column(df, mapping["target"])
+
+    if mapping["text"] is None:
+        out["message_text"] = _column(df, "message_text")
+    else:
+        template, fields = mapping["text"]
+        parts = [_column(df, field).map(str) for field in fields]
+        out["message_text"] = [template.format(*values) for values in zip(*parts)]
+
+    if mapping["deleted"] and "deleted_flag" in df.columns:
+        flags = pd.to_numeric(df["deleted_flag"], errors="coerce").fillna(0)
+        out["deleted_flag"] = flags.astype(int).astype(object)
+    else:
+        out["deleted_flag"] = 0
+
+    out["language"]   = _column(df, "language")
+    out["device_id"]  = _column(df, "device_id")
+    out["ip_address"] = _column(df, "ip_address")
+
+    # Metadata keeps only the raw fields that have no column of their own
+    extra = [column for column in df.columns if column not in mapped_fields(source_type)]
+    if extra:
+        raw = df[extra].astype(object)
+        raw = raw.where(raw.notna(), None)
+        out["metadata"] = [encode_metadata(record) for record in raw.to_dict("records")]
+    else:
+        out["metadata"] = None
+
+    return out[EVENT_COLUMNS]
+
+
+INSERT_SQL = f"""
+    INSERT OR IGNORE INTO events ({", ".join(EVENT_COLUMNS)})
+    VALUES ({", ".join("?" for _ in EVENT_COLUMNS)})
 """
 
 
+def _existing_event_ids(cursor: sqlite3.Cursor, event_ids: List[str]) -> set:
+    """Return the subset of event_ids already present in the events table."""
+    found = set()
+    step = settings.LOOKUP_BATCH_SIZE
+    for i in range(0, len(event_ids), step):
+        batch = event_ids[i:i + step]
+        placeholders = ", ".join("?" for _ in batch)
+        found.update(
+            r[0] for r in cursor.execute(
+                f"SELECT event_id FROM events WHERE event_id IN ({placeholders})",
+                batch,
+            )
+        )
+    return found
+
+
+def _insert_events(
+    cursor: sqlite3.Cursor,
+    events: pd.DataFrame,
+    source_type: str,
+    skip_reasons: list,
+) -> Tuple[int, int]:
+    """
+    Insert normalized events with executemany in bounded batches.
+    Duplicates (within the frame or already stored) are filtered up front so
+    that every skip is reported with its event_id.
+    Returns (inserted, skipped).
+    """
+    inserted = 0
+    skipped  = 0
+    step = settings.INSERT_BATCH_SIZE
+
+    for start in range(0, len(events), step):
+        batch = events.iloc[start:start + step]
+        ids = batch["event_id"]
+
+        existing = _existing_event_ids(cursor, ids.drop_duplicates().tolist())
+        duplicate = ids.isin(existing) | ids.duplicated()
+        for event_id in ids[duplicate]:
+            skip_reasons.append(
+                f"[{source_type}] Duplicate skipped: event_id={event_id!r}"
+            )
+        skipped += int(duplicate.sum())
+
+        records = list(batch[~duplicate].itertuples(index=False, name=None))
+        if not records:
+            continue
+
+        cursor.execute("SAVEPOINT insert_batch")
+        try:
+            cursor.executemany(INSERT_SQL, records)
+            count = cursor.rowcount
+            cursor.execute("RELEASE SAVEPOINT insert_batch")
+            inserted += count
+            skipped  += len(records) - count
+            continue
+        except Exception:
+            cursor.execute("ROLLBACK TO SAVEPOINT insert_batch")
+            cursor.execute("RELEASE SAVEPOINT insert_batch")
+
+        # Batch failed: retry row by row to isolate the offending records
+        for record in records:
+            try:
+                cursor.execute(INSERT_SQL, record)
+                if cursor.rowcount == 1:
+                    inserted += 1
+                else:
+                    skipped += 1
+                    skip_reasons.append(
+                        f"[{source_type}] Duplicate skipped: event_id={record[0]!r}"
+                    )
+            except Exception as e:
+                skip_reasons.append(
+                    f"[{source_type}] Unexpected error: {e} | event_id={record[0]!r}"
+                )
+                skipped += 1
+
+    return inserted, skipped
+
+
+def _max_event_id(cursor: sqlite3.Cursor) -> int:
+    return cursor.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()[0]
+
+
+def _update_aggregates(cursor: sqlite3.Cursor, since_id: int) -> None:
+    """
+    Fold events inserted after since_id into the derived aggregate tables
+    and bump the ingestion generation, globally and for every case the
+    new events belong to. Runs in the ingestion transaction, so
+    aggregates and generations commit together with the events.
+    """
+    refresh_user_risk_stats(cursor, since_id)
+    refresh_edge_weights(cursor, since_id)
+    refresh_events_fts(cursor, since_id)
+    refresh_event_rollups(cursor, since_id)
+    refresh_stats_counters(cursor, since_id)
+
+    cases = cursor.execute(
+        "SELECT DISTINCT case_id FROM events WHERE id > ? AND case_id IS NOT NULL",
+        (since_id,)
+    )
+    bump_ingestion_generation(cursor, [row[0] for row in cases.fetchall()])
+
+
+def _is_json_lines(fh) -> bool:
+    """Peek at the first non-blank character: JSON Lines start with an object."""
+    pos = fh.tell()
+    head = fh.read(1024)
+    fh.seek(pos)
+    if isinstance(head, bytes):
+        head = head.decode("utf-8", errors="ignore")
+    return head.lstrip().startswith("{")
+
+
 def _load_dataframe(file) -> pd.DataFrame:
     name = (file.filename or "").lower()
     if name.endswith(".csv"):
         return pd.read_csv(file.file)
-    elif name.endswith(".json"):
-        return pd.read_json(file.file)
+    elif name.endswith((".json", ".jsonl", ".ndjson")):
+        return pd.read_json(file.file, lines=_is_json_lines(file.file))
     raise ValueError(f"Unsupported format: {file.filename!r}")
 
 
+def _iter_dataframes(file, chunksize: Optional[int] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yield the file as a single DataFrame, or as successive chunks of at most
+    `chunksize` rows. CSV and JSON Lines are read incrementally; a plain JSON
+    array cannot be, so it is yielded whole.
+    """
+    name = (file.filename or "").lower()
+    if chunksize is None:
+        yield _load_dataframe(file)
+    elif name.endswith(".csv"):
+        with pd.read_csv(file.file, chunksize=chunksize) as reader:
+            yield from reader
+    elif name.endswith((".json", ".jsonl", ".ndjson")) and _is_json_lines(file.file):
+        with pd.read_json(file.file, lines=True, chunksize=chunksize) as reader:
+            yield from reader
+    else:
+        yield _load_dataframe(file)
+
+
+class StoredUpload:
+    """A file on disk, shaped like the UploadFile objects ingestion reads."""
+
+    def __init__(self, path, filename: Optional[str] = None):
+        self.path = Path(path)
+        self.filename = filename or self.path.name
+        self.file = open(self.path, "rb")
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class FileLoadError(Exception):
+    """The file could not be read into a DataFrame."""
+
+
+def _prepare_frame(
+    df: pd.DataFrame,
+    filename: str,
+    source_type: str,
+    preferred_format: Optional[str] = None,
+) -> PreparedFrame:
+    """
+    Parse and normalize one frame (a whole file or one chunk of it) without
+    touching the database. Runs in the CPU process pool.
+    """
+    skip_reasons = []
+    rows = len(df)
+
+    # --- Normalize columns ---
+    df.columns = df.columns.str.strip().str.lower()
+
+    print(f"\n[{source_type}] File: {filename}")
+    print(f"[{source_type}] Columns: {list(df.columns)}")
+    print(f"[{source_type}] Row count: {rows}")
+
+    if "timestamp" not in df.columns:
+        skip_reasons.append(
+            f"[{filename}] Missing 'timestamp' column. "
+            f"Found: {list(df.columns)}"
+        )
+        return PreparedFrame(None, rows, rows, preferred_format, skip_reasons)
+
+    # --- Parse timestamps ---
+    df, fmt = _parse_timestamps(df, filename, skip_reasons, preferred_format)
+
+    if df.empty:
+        skip_reasons.append(f"[{filename}] No valid rows after timestamp parsing.")
+        return PreparedFrame(None, 0, rows, fmt, skip_reasons)
+
+    return PreparedFrame(_normalize_frame(df, source_type), 0, rows, fmt, skip_reasons)
+
+
+def _prepare_file(path: str, filename: str, source_type: str) -> Optional[PreparedFrame]:
+    """
+    Load a whole spooled file and prepare it. Runs in the CPU process pool.
+    Returns None for an empty file.
+    """
+    upload = StoredUpload(path, filename)
+    try:
+        df = _load_dataframe(upload)
+    except Exception as e:
+        raise FileLoadError(str(e)) from None
+    finally:
+        upload.close()
+
+    if df.empty:
+        return None
+    return _prepare_frame(df, filename, source_type)
+
+
+def _split_by_case(events: pd.DataFrame) -> Iterator[Tuple[Optional[str], pd.DataFrame]]:
+    """
+    (case_id, events) groups in order of first appearance in sharded mode;
+    otherwise the whole frame as one group.
+    """
+    if not settings.CASE_SHARDS:
+        yield None, events
+        return
+    for case_id, group in events.groupby("case_id", sort=False, dropna=False):
+        yield (None if pd.isna(case_id) else str(case_id)), group
+
+
+def _write_frame(
+    writers: _Writers,
+    prepared: PreparedFrame,
+    source_type: str,
+    skip_reasons: list,
+) -> Tuple[int, int]:
+    """
+    Insert a prepared frame and fold it into the aggregates of each
+    database it was written to. Runs on the single writer thread.
+    Returns (inserted, skipped).
+    """
+    skip_reasons.extend(prepared.skip_reasons)
+    if prepared.events is None:
+        return 0, prepared.skipped
+
+    inserted = 0
+    skipped  = prepared.skipped
+    for case_id, events in _split_by_case(prepared.events):
+        cursor = writers.cursor(case_id)
+        # Outside a transaction, _insert_events' savepoint would start one
+        # and its release would commit the events without their aggregates
+        if not cursor.connection.in_transaction:
+            cursor.execute("BEGIN")
+        since_id = _max_event_id(cursor)
+        count, rejected = _insert_events(cursor, events, source_type, skip_reasons)
+        if count:
+            _update_aggregates(cursor, since_id)
+        inserted += count
+        skipped  += rejected
+    return inserted, skipped
+
+
+def _spool(file, directory: Path, index: int) -> Path:
+    """
+    Path of the upload on disk, copying it into directory unless it already
+    is a file there. Worker processes cannot share UploadFile objects.
+    """
+    if isinstance(file, StoredUpload):
+        return file.path
+    path = directory / f"{index}_{Path(file.filename or 'upload').name}"
+    with open(path, "wb") as out:
+        shutil.copyfileobj(file.file, out)
+    return path
+
+
 def ingest_multiple_files(
+    conn: sqlite3.Connection,
     file_source_pairs: List[Tuple],
+    stream: bool = False,
+    progress: Optional[Callable[[str, int], None]] = None,
 ) -> Tuple[int, int]:
     """
     Ingest a list of (file, source_type) pairs into the events table.
+
+    Files are parsed and normalized in parallel on the CPU process pool,
+    at most settings.INGEST_MAX_IN_FLIGHT frames at a time. This thread is
+    the single writer: it inserts prepared frames in upload order, so the
+    result is the same as ingesting the files one after another.
+
+    With stream=True each file is read in chunks of settings.STREAM_CHUNK_SIZE
+    rows, and every chunk is prepared, inserted and committed on its own so
+    memory stays bounded by the chunk size. Counts are the same either way.
+
+    With settings.CASE_SHARDS, each case's events are written to its own
+    database (see app.core.database.case_db_path); conn then only receives
+    events without a case_id, and event_id uniqueness holds per case.
+
+    progress, if given, is called after every file or chunk with the
+    current phase and the number of raw rows processed so far.
+
     Returns (total_inserted, total_skipped).
     """
     total_inserted = 0
     total_skipped  = 0
+    total_rows     = 0
     skip_reasons   = []
+    chunksize = settings.STREAM_CHUNK_SIZE if stream else None
+
+    pool    = cpu_executor()
+    pending = deque()   # (future, file, source_type) in upload order
+    spool_dir = Path(tempfile.mkdtemp(prefix="sentinelx-ingest-"))
+
+    def write_next():
+        nonlocal total_inserted, total_skipped, total_rows
+        future, file, source_type = pending.popleft()
+        try:
+            prepared = future.result()
+        except FileLoadError as e:
+            skip_reasons.append(f"[{file.filename}] Failed to load: {e}")
+            total_skipped += 1
+            return
+        if prepared is None:
+            skip_reasons.append(f"[{file.filename}] File is empty.")
+            return
+
+        inserted, skipped = _write_frame(writers, prepared, source_type, skip_reasons)
+        total_inserted += inserted
+        total_skipped  += skipped
+        total_rows     += prepared.rows
+
+        if stream:
+            writers.commit()
+
+        if progress:
+            progress(f"ingesting {source_type}: {file.filename}", total_rows)
+
+    def submit(file, source_type, fn, *args):
+        while len(pending) >= settings.INGEST_MAX_IN_FLIGHT:
+            write_next()
+        future = pool.submit(fn, *args)
+        pending.append((future, file, source_type))
+        return future
 
-    with managed_connection() as conn:
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-
-        for file, source_type in file_source_pairs:
-
-            # --- Load file ---
-            try:
-                df = _load_dataframe(file)
-            except Exception as e:
-                skip_reasons.append(f"[{file.filename}] Failed to load: {e}")
-                total_skipped += 1
-                continue
-
-            if df.empty:
-                skip_reasons.append(f"[{file.filename}] File is empty.")
-                continue
+    try:
+        with _Writers(conn) as writers:
+            for index, (file, source_type) in enumerate(file_source_pairs):
+                if not stream:
+                    path = _spool(file, spool_dir, index)
+                    submit(file, source_type, _prepare_file, str(path), file.filename, source_type)
+                    continue
+
+                # Streaming: read chunks here, prepare them in the pool
+                first  = None
+                fmt    = None
+                failed = False
+                frames = _iter_dataframes(file, chunksize)
+
+                while True:
+                    # --- Load next chunk ---
+                    try:
+                        df = next(frames)
+                    except StopIteration:
+                        break
+                    except Exception as e:
+                        skip_reasons.append(f"[{file.filename}] Failed to load: {e}")
+                        total_skipped += 1
+                        failed = True
+                        break
 
-            # --- Normalize columns ---
-            df.columns = df.columns.str.strip().str.lower()
+                    if df.empty:
+                        continue
 
-            print(f"\n[{source_type}] File: {file.filename}")
-            print(f"[{source_type}] Columns: {list(df.columns)}")
-            print(f"[{source_type}] Row count: {len(df)}")
+                    # Later chunks reuse the timestamp format of the first
+                    if first is not None and fmt is None:
+                        fmt = first.result().fmt
+                    future = submit(file, source_type, _prepare_frame, df, file.filename, source_type, fmt)
+                    first = first or future
 
-            if "timestamp" not in df.columns:
-                skip_reasons.append(
-                    f"[{file.filename}] Missing 'timestamp' column. "
-                    f"Found: {list(df.columns)}"
-                )
-                total_skipped += len(df)
-                continue
-
-            # --- Parse timestamps ---
-            df = _parse_timestamps(df, file.filename, skip_reasons)
-
-            if df.empty:
-                skip_reasons.append(f"[{file.filename}] No valid rows after timestamp parsing.")
-                continue
-
-            df["timestamp"] = df["timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S")
-
-            # --- Insert rows ---
-            for _, row in df.iterrows():
-                clean_row = {
-                    k: (None if pd.isna(v) else v)
-                    for k, v in row.to_dict().items()
-                }
-                record = _normalize_row(clean_row, source_type)
-
-                try:
-                    cursor.execute(INSERT_SQL, record)
-                    # rowcount 0 = duplicate silently ignored by INSERT OR IGNORE
-                    if cursor.rowcount == 1:
-                        total_inserted += 1
-                    else:
-                        total_skipped += 1
-                        skip_reasons.append(
-                            f"[{source_type}] Duplicate skipped: event_id={record['event_id']!r}"
-                        )
+                if first is None and not failed:
+                    skip_reasons.append(f"[{file.filename}] File is empty.")
 
-                except Exception as e:
-                    skip_reasons.append(
-                        f"[{source_type}] Unexpected error: {e} | event_id={record['event_id']!r}"
-                    )
-                    total_skipped += 1
+            while pending:
+                write_next()
+    finally:
+        for future, _, _ in pending:
+            future.cancel()
+        shutil.rmtree(spool_dir, ignore_errors=True)
 
     if skip_reasons:
         print(f"\n===== SKIPPED REASONS ({len(skip_reasons)}) =====")
@@ -242,4 +751,8 @@ def ingest_multiple_files(
         print("=" * 40)
 
     print(f"\n✅ Inserted: {total_inserted} | ⏭ Skipped: {total_skipped}")
-    return total_inserted, total_skipped
\ No newline at end of file
+
+    # Apply the new edges to the in-memory graphs while nobody waits
+    if total_inserted:
+        schedule_graph_refresh()
+    return total_inserted, total_skipped
@@ -0,0 +1,313 @@
+"""
+Local background jobs for long-running work (report generation, large
+uploads).
+
+Jobs are rows in a jobs table of their own SQLite file
+(settings.JOBS_DATABASE_PATH), which ingestion never locks, and run on
+the dedicated job executor (app.core.executors.job_executor), so no
+external broker is needed. Uploaded files are spooled under
+settings.JOBS_DIR before the request returns. While a job runs, its
+phase and row count are tracked in memory and persisted when the job
+finishes. On startup, recover_jobs() resumes queued work and settles
+jobs interrupted by a restart.
+"""
+import json
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+from app.core.config import settings
+from app.core.database import case_connection, pooled_connection
+from app.core.executors import job_executor
+
+
+JOB_KINDS = ("report", "ingest")
+
+# Interrupted jobs of these kinds are safe to run again from the start;
+# an interrupted ingest may have committed chunks and is marked failed
+RESUMABLE_KINDS = ("report",)
+
+
+# ---- Live progress of jobs running in this process ----
+_progress: Dict[str, Dict[str, Any]] = {}
+_progress_lock = threading.Lock()
+
+
+# ---- Job state database ----
+_jobs_ready: Set[Path] = set()
+_jobs_lock = threading.Lock()
+
+
+def _create_jobs(cursor):
+    """Job status, progress and result, kept across restarts for polling."""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            kind TEXT NOT NULL,
+            status TEXT NOT NULL,
+            phase TEXT,
+            rows_processed INTEGER NOT NULL DEFAULT 0,
+            params TEXT,
+            result TEXT,
+            error TEXT,
+            created_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL
+        )
+    """)
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs(status)")
+
+
+# Schema migrations of the job state database, tracked by its own
+# user_version like the main database's (append only)
+JOBS_MIGRATIONS = [
+    _create_jobs,
+]
+
+
+@contextmanager
+def _jobs_db() -> Iterator[sqlite3.Connection]:
+    """
+    A pooled connection to the job state database, migrated the first time
+    this process opens it.
+    """
+    # Imported here: migrations use the engines, which import the database
+    from app.core.migrations import apply_migrations
+
+    path = Path(settings.JOBS_DATABASE_PATH)
+    with pooled_connection(path) as conn:
+        with _jobs_lock:
+            if path not in _jobs_ready:
+                apply_migrations(conn, JOBS_MIGRATIONS)
+                _jobs_ready.add(path)
+        yield conn
+
+
+def _write(sql: str, params: List[Any]) -> None:
+    """
+    Runs one job state write, retrying with backoff while the file is
+    locked (settings.JOB_WRITE_ATTEMPTS tries).
+    """
+    for attempt in range(settings.JOB_WRITE_ATTEMPTS):
+        try:
+            with _jobs_db() as conn:
+                try:
+                    conn.execute(sql, params)
+                    conn.commit()
+                except sqlite3.Error:
+                    conn.rollback()
+                    raise
+            return
+        except sqlite3.OperationalError as e:
+            if attempt == settings.JOB_WRITE_ATTEMPTS - 1:
+                raise
+            print(f"[jobs] Job state write failed ({e}), retrying")
+            time.sleep(0.1 * 2 ** attempt)
+
+
+def _now() -> str:
+    return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+
+def _set_progress(job_id: str, phase: str, rows_processed: int = 0) -> None:
+    with _progress_lock:
+        _progress[job_id] = {"phase": phase, "rows_processed": rows_processed}
+
+
+def _update_job(job_id: str, **fields) -> None:
+    fields["updated_at"] = _now()
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    _write(f"UPDATE jobs SET {assignments} WHERE id = ?", [*fields.values(), job_id])
+
+
+def _job_dir(job_id: str) -> Path:
+    return settings.JOBS_DIR / job_id
+
+
+# ---- Job handlers: run(job_id, params) -> result dict ----
+
+def _run_report(job_id: str, params: Dict) -> Dict:
+    from app.services.report_service import generate_report
+
+    case_id = params.get("case_id")
+    _set_progress(job_id, "generating report")
+    with case_connection(case_id) as conn:
+        report_path = generate_report(conn, case_id=case_id)
+    return {"report_path": report_path}
+
+
+def _run_ingest(job_id: str, params: Dict) -> Dict:
+    from app.services.ingestion_service import ingest_multiple_files, StoredUpload
+
+    uploads = [
+        (StoredUpload(entry["path"], entry["filename"]), entry["source_type"])
+        for entry in params["files"]
+    ]
+    try:
+        _set_progress(job_id, "ingesting")
+        with pooled_connection() as conn:
+            inserted, skipped = ingest_multiple_files(
+                conn,
+                uploads,
+                stream=params.get("stream", False),
+                progress=lambda phase, rows: _set_progress(job_id, phase, rows),
+            )
+    finally:
+        for upload, _ in uploads:
+            upload.close()
+        shutil.rmtree(_job_dir(job_id), ignore_errors=True)
+
+    return {"records_inserted": inserted, "records_skipped": skipped}
+
+
+HANDLERS = {
+    "report": _run_report,
+    "ingest": _run_ingest,
+}
+
+
+def _fail_job(job_id: str, error: Exception) -> None:
+    live = _progress.get(job_id, {})
+    print(f"[jobs] {job_id} failed: {error}")
+    try:
+        _update_job(
+            job_id,
+            status="failed",
+            phase=live.get("phase"),
+            rows_processed=live.get("rows_processed", 0),
+            error=str(error),
+        )
+    except Exception as e:
+        # Left 'running': recover_jobs() settles it on the next startup
+        print(f"[jobs] Could not record failure of {job_id}: {e}")
+
+
+def _execute(job_id: str) -> None:
+    """
+    Runs a queued job. Every status write is inside the try, so a job
+    ends 'succeeded' or 'failed' whatever fails along the way.
+    """
+    try:
+        with _jobs_db() as conn:
+            row = conn.execute(
+                "SELECT kind, params FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return
+
+        _update_job(job_id, status="running", phase="started")
+        _set_progress(job_id, "started")
+        result = HANDLERS[row["kind"]](job_id, json.loads(row["params"] or "{}"))
+        _update_job(
+            job_id,
+            status="succeeded",
+            phase="done",
+            rows_processed=_progress.get(job_id, {}).get("rows_processed", 0),
+            result=json.dumps(result),
+        )
+    except Exception as e:
+        _fail_job(job_id, e)
+    finally:
+        with _progress_lock:
+            _progress.pop(job_id, None)
+
+
+def submit_job(kind: str, params: Optional[Dict] = None, job_id: Optional[str] = None) -> str:
+    """
+    Records a queued job and schedules it on the job executor.
+    Returns the job id.
+    """
+    if kind not in JOB_KINDS:
+        raise ValueError(f"Unknown job kind: {kind!r}")
+
+    job_id = job_id or uuid.uuid4().hex
+    now = _now()
+    _write("""
+        INSERT INTO jobs (id, kind, status, phase, params, created_at, updated_at)
+        VALUES (?, ?, 'queued', 'queued', ?, ?, ?)
+    """, [job_id, kind, json.dumps(params or {}), now, now])
+
+    job_executor().submit(_execute, job_id)
+    return job_id
+
+
+def _spool_uploads(job_id: str, file_source_pairs: List[Tuple], stream: bool) -> Dict:
+    """
+    Copies uploaded files to the job directory so the ingest job can read
+    them after the request has finished. Returns the ingest job params.
+    """
+    job_dir = _job_dir(job_id)
+    job_dir.mkdir(parents=True, exist_ok=True)
+
+    files = []
+    for index, (file, source_type) in enumerate(file_source_pairs):
+        path = job_dir / f"{index}_{Path(file.filename or 'upload').name}"
+        with open(path, "wb") as out:
+            shutil.copyfileobj(file.file, out)
+        files.append({
+            "path": str(path),
+            "filename": file.filename,
+            "source_type": source_type,
+        })
+
+    return {"files": files, "stream": stream}
+
+
+def submit_ingest_job(file_source_pairs: List[Tuple], stream: bool = False) -> str:
+    """
+    Spools the uploads to disk and queues an ingest job for them.
+    """
+    job_id = uuid.uuid4().hex
+    params = _spool_uploads(job_id, file_source_pairs, stream)
+    return submit_job("ingest", params, job_id=job_id)
+
+
+def get_job(job_id: str) -> Optional[Dict]:
+    """
+    Returns job status, progress and result, or None if unknown.
+    """
+    with _jobs_db() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+
+    job = dict(row)
+    job.pop("params")
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+
+    with _progress_lock:
+        live = _progress.get(job_id)
+    if job["status"] == "running" and live:
+        job.update(live)
+
+    return job
+
+
+def recover_jobs() -> None:
+    """
+    Called on startup. Jobs left 'running' by a previous process are either
+    re-queued (if safe to repeat) or marked failed; queued jobs are resumed.
+    """
+    with _jobs_db() as conn:
+        rows = conn.execute(
+            "SELECT id, kind, status FROM jobs WHERE status IN ('queued', 'running')"
+        ).fetchall()
+
+    for row in rows:
+        if row["status"] == "running" and row["kind"] not in RESUMABLE_KINDS:
+            _update_job(
+                row["id"],
+                status="failed",
+                error="Interrupted by server restart",
+            )
+            shutil.rmtree(_job_dir(row["id"]), ignore_errors=True)
+            continue
+
+        _update_job(row["id"], status="queued", phase="queued")
+        job_executor().submit(_execute, row["id"])
+        print(f"[jobs] Resumed {row['kind']} job {row['id']}")
@@ -0,0 +1,101 @@
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Pattern, Tuple
+from app.core.config import settings
+
+
+# Key in a keywords-by-language mapping whose terms apply to every language
+ALL_LANGUAGES = "*"
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """
+    Regex alternation of words with shared prefixes merged into a trie,
+    e.g. pay, payment, paytm -> pay(?:ment|tm)?. Each position of the text
+    is then tested against one branch per distinct next character rather
+    than against every keyword, so matching cost stays nearly flat as the
+    list grows.
+    """
+    trie: Dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def build(node: Dict) -> str:
+        branches = [
+            re.escape(char) + build(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ""
+        optional = "" in node
+        if len(branches) == 1 and not optional:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if optional else group
+
+    return build(trie)
+
+
+def _compile(words: Iterable[str], word_boundary: bool) -> Optional[Pattern]:
+    words = sorted({word.strip().lower() for word in words if word and word.strip()})
+    if not words:
+        return None
+    pattern = _trie_pattern(words)
+    if word_boundary:
+        pattern = rf"(?<!\w){pattern}(?!\w)"
+    # Case-sensitive over lowercased text: re.IGNORECASE disables the
+    # literal fast paths of the regex engine and is several times slower
+    return re.compile(pattern)
+
+
+class KeywordMatcher:
+    """
+    Precompiled case-insensitive multi-keyword matcher.
+
+    keywords maps a language (as stored in events.language, compared
+    case-insensitively) to its terms; terms under "*" apply to every
+    language. By default a keyword matches anywhere in the text, like
+    SQL LIKE '%keyword%'; with word_boundary=True only whole words match.
+    """
+
+    def __init__(self, keywords: Dict[str, Iterable[str]], word_boundary: bool = False):
+        common = list(keywords.get(ALL_LANGUAGES, []))
+        self._default = _compile(common, word_boundary)
+        self._by_language = {
+            language.lower(): _compile(common + list(terms), word_boundary)
+            for language, terms in keywords.items()
+            if language != ALL_LANGUAGES
+        }
+
+    def _pattern(self, language: Optional[str]) -> Optional[Pattern]:
+        if language:
+            return self._by_language.get(language.lower(), self._default)
+        return self._default
+
+    def matches(self, text: Optional[str], language: Optional[str] = None) -> bool:
+        if not text:
+            return False
+        pattern = self._pattern(language)
+        return pattern is not None and pattern.search(text.lower()) is not None
+
+
+@lru_cache(maxsize=8)
+def _cached_matcher(
+    keywords: Tuple[Tuple[str, Tuple[str, ...]], ...],
+    word_boundary: bool,
+) -> KeywordMatcher:
+    return KeywordMatcher(dict(keywords), word_boundary)
+
+
+def financial_matcher() -> KeywordMatcher:
+    """
+    Matcher for settings.FINANCIAL_KEYWORDS, compiled once per configuration.
+    """
+    keywords = tuple(
+        (language, tuple(terms))
+        for language, terms in sorted(settings.FINANCIAL_KEYWORDS.items())
+    )
+    return _cached_matcher(keywords, settings.FINANCIAL_KEYWORDS_WORD_BOUNDARY)
@@ -12,31 +12,33 @@ from reportlab.lib.styles import getSampleStyleSheet
 from reportlab.lib.units import inch
 from datetime import datetime
 from pathlib import Path
+from xml.sax.saxutils import escape
+import re
+import sqlite3
+from typing import Optional
 
 from app.core.config import settings
-from app.core.database import get_connection
 from app.services.risk_engine import compute_suspicious_users
+from app.services.stats_service import count_events
 
 
-def generate_report() -> str:
+def generate_report(conn: sqlite3.Connection, case_id: Optional[str] = None) -> str:
     """
-    Generates forensic intelligence PDF report.
+    Generates forensic intelligence PDF report, for all cases or only
+    for case_id (in sharded mode conn must then be its shard).
     Returns file path.
     """
 
     # Ensure reports directory exists
     settings.REPORTS_DIR.mkdir(exist_ok=True)
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    total_events = cursor.execute("SELECT COUNT(*) FROM events").fetchone()[0]
-    conn.close()
-
-    suspicious_users = compute_suspicious_users()
+    total_events = count_events(conn, case_id)
+    suspicious_users = compute_suspicious_users(conn, case_id=case_id)
 
     # ---- File Path ----
     timestamp_str = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_path = settings.REPORTS_DIR / f"sentinelx_report_{timestamp_str}.pdf"
+    case_suffix = "_" + re.sub(r"[^\w.-]", "_", case_id) if case_id else ""
+    file_path = settings.REPORTS_DIR / f"sentinelx_report{case_suffix}_{timestamp_str}.pdf"
 
     doc = SimpleDocTemplate(str(file_path))
     elements = []
@@ -52,6 +54,10 @@ def generate_report() -> str:
     elements.append(
         Paragraph(f"Generated On: {datetime.now()}", styles["Normal"])
     )
+    if case_id:
+        elements.append(
+            Paragraph(f"Case: {escape(case_id)}", styles["Normal"])
+        )
     elements.append(
         Paragraph(f"Total Events Analyzed: {total_events}", styles["Normal"])
     )
@@ -1,75 +1,174 @@
-from typing import List, Dict
-from app.core.database import get_connection
+import sqlite3
+from typing import Any, List, Dict, Optional, Tuple
+from app.core.cache import get_cache
 from app.core.config import settings
+from app.core.database import current_generation, iter_rows, map_shards, spans_shards
+from app.services.keyword_matcher import financial_matcher
 
 
-FINANCIAL_KEYWORDS = [
-    "transfer",
-    "amount",
-    "payment",
-    "cash",
-    "wire",
-    "deposit"
-]
+def _register_financial_match(conn: sqlite3.Connection) -> None:
+    """
+    Registers financial_match(text, language) on the connection: 1 if the
+    text contains a keyword from settings.FINANCIAL_KEYWORDS for that
+    language, using the precompiled matcher instead of a LIKE per keyword.
+    """
+    matcher = financial_matcher()
+    conn.create_function(
+        "financial_match",
+        2,
+        lambda text, language: int(matcher.matches(text, language)),
+        deterministic=True
+    )
 
 
-def compute_suspicious_users(min_messages: int = None) -> List[Dict]:
+# Late night = hour 00–04, from the hour column filled at ingestion
+REFRESH_RISK_STATS_SQL = """
+    INSERT INTO user_risk_stats (
+        case_id, actor_id, late_night, deleted, financial,
+        total_messages, first_event_id
+    )
+    SELECT
+        COALESCE(case_id, ''),
+        actor_id,
+        SUM(CASE WHEN hour BETWEEN 0 AND 4 THEN 1 ELSE 0 END),
+        SUM(CASE WHEN deleted_flag = 1 THEN 1 ELSE 0 END),
+        SUM(financial_match(message_text, language)),
+        COUNT(*),
+        MIN(id)
+    FROM events
+    WHERE id > ? AND actor_id IS NOT NULL AND actor_id != ''
+    GROUP BY COALESCE(case_id, ''), actor_id
+    ON CONFLICT (case_id, actor_id) DO UPDATE SET
+        late_night     = late_night + excluded.late_night,
+        deleted        = deleted + excluded.deleted,
+        financial      = financial + excluded.financial,
+        total_messages = total_messages + excluded.total_messages,
+        first_event_id = MIN(first_event_id, excluded.first_event_id)
+"""
+
+
+def refresh_user_risk_stats(cursor, since_id: int = 0) -> None:
+    """
+    Folds events with id > since_id into the user_risk_stats counters.
+    Ingestion calls this inside its own transaction with the id watermark
+    taken before the insert, so only newly inserted rows are counted.
+    """
+    _register_financial_match(cursor.connection)
+    cursor.execute(REFRESH_RISK_STATS_SQL, (since_id,))
+
+
+def rebuild_user_risk_stats(cursor) -> None:
+    """
+    Recomputes user_risk_stats from scratch from the events table.
+    """
+    cursor.execute("DELETE FROM user_risk_stats")
+    refresh_user_risk_stats(cursor, since_id=0)
+
+
+def risk_counters_query(
+    min_messages: int,
+    case_id: Optional[str] = None
+) -> Tuple[str, List[Any]]:
+    """
+    Per-actor counters, summed across cases or scoped to one case (a
+    prefix of the user_risk_stats primary key). Returns (sql, params).
+    """
+    where = "WHERE case_id = ?" if case_id else ""
+    params = [case_id] if case_id else []
+
+    query = f"""
+        SELECT
+            actor_id,
+            SUM(late_night) AS late_night,
+            SUM(deleted) AS deleted,
+            SUM(financial) AS financial,
+            SUM(total_messages) AS total_messages
+        FROM user_risk_stats
+        {where}
+        GROUP BY actor_id
+        HAVING SUM(total_messages) >= ?
+        ORDER BY MIN(first_event_id)
+    """
+    return query, params + [min_messages]
+
+
+COUNTER_FIELDS = ("late_night", "deleted", "financial", "total_messages")
+
+
+def _counters_across_shards(conn: sqlite3.Connection, min_messages: int) -> List[Dict]:
+    """
+    Per-actor counters summed over every shard, in order of first
+    appearance (by shard, then by first event within it). The threshold
+    applies to the sums, so each shard reports every actor.
+    """
+    def counters(shard_conn, _):
+        return [dict(row) for row in shard_conn.execute(*risk_counters_query(1))]
+
+    merged: Dict[str, Dict] = {}
+    for rows in map_shards(counters, conn):
+        for row in rows:
+            totals = merged.setdefault(row["actor_id"], dict.fromkeys(COUNTER_FIELDS, 0))
+            for field in COUNTER_FIELDS:
+                totals[field] += row[field]
+
+    return [
+        {"actor_id": actor, **totals}
+        for actor, totals in merged.items()
+        if totals["total_messages"] >= min_messages
+    ]
+
+
+# Scored lists by (case_id, generation, min_messages); see app.core.cache
+_suspicious_cache = get_cache("suspicious_users")
+
+
+def compute_suspicious_users(
+    conn: sqlite3.Connection,
+    min_messages: int = None,
+    case_id: Optional[str] = None
+) -> List[Dict]:
     """
     Computes suspicious users using weighted behavioral density scoring.
+    Reads the per-actor counters maintained in user_risk_stats, for all
+    cases or only for case_id. In sharded mode conn must be case_id's
+    shard, and counters for all cases are summed across every shard.
+    Results are cached until the next ingestion into their scope.
     """
 
     if min_messages is None:
         min_messages = settings.MIN_MESSAGES_THRESHOLD
 
-    conn = get_connection()
-    cursor = conn.cursor()
-    rows = cursor.execute("SELECT * FROM events").fetchall()
-    conn.close()
+    cache_key = (case_id, current_generation(conn, case_id), min_messages)
+    return _suspicious_cache.get_or_compute(
+        cache_key, lambda: _score_users(conn, min_messages, case_id)
+    )
 
-    user_stats = {}
 
-    for row in rows:
-        user = row["actor_id"]
-        if not user:
-            continue
-
-        if user not in user_stats:
-            user_stats[user] = {
-                "late_night": 0,
-                "deleted": 0,
-                "financial": 0,
-                "total_messages": 0
-            }
-
-        user_stats[user]["total_messages"] += 1
-
-        # ---- Late night detection (00:00–04:59) ----
-        ts = row["timestamp"] or ""
-        try:
-            hour = int(ts[11:13])
-            if 0 <= hour <= 4:
-                user_stats[user]["late_night"] += 1
-        except (ValueError, IndexError):
-            pass
-
-        # ---- Deleted messages ----
-        if row["deleted_flag"] == 1:
-            user_stats[user]["deleted"] += 1
-
-        # ---- Financial keyword detection ----
-        text = (row["message_text"] or "").lower()
-        if any(keyword in text for keyword in FINANCIAL_KEYWORDS):
-            user_stats[user]["financial"] += 1
+def _score_users(
+    conn: sqlite3.Connection,
+    min_messages: int,
+    case_id: Optional[str] = None
+) -> List[Dict]:
+    # Ordered by first appearance so equal scores rank as a full scan would;
+    # actors below min_messages are filtered out in SQL
+    if spans_shards(case_id):
+        rows = _counters_across_shards(conn, min_messages)
+    else:
+        rows = iter_rows(conn.execute(*risk_counters_query(min_messages, case_id)))
 
     suspicious_users = []
 
-    for user, stats in user_stats.items():
+    for row in rows:
 
+        user = row["actor_id"]
+        stats = {
+            "late_night": row["late_night"],
+            "deleted": row["deleted"],
+            "financial": row["financial"],
+            "total_messages": row["total_messages"]
+        }
         total = stats["total_messages"]
 
-        if total < min_messages:
-            continue
-
         late_ratio = stats["late_night"] / total
         delete_ratio = stats["deleted"] / total
         financial_ratio = stats["financial"] / total
@@ -0,0 +1,284 @@
+import sqlite3
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+from app.core.database import map_shards, spans_shards
+
+
+# stats_counters rows per scope: case_id '' holds the figures over all
+# events, any other case_id those of that case. Dimensions 'total',
+# 'deleted' and 'actors' use value ''; 'language' and 'source' hold one
+# row per language / source_type. The new events are grouped once and
+# every figure is derived from the groups.
+REFRESH_STATS_COUNTERS_SQL = """
+    WITH scoped AS (
+        SELECT '' AS scope, language, source_type, deleted_flag
+        FROM events WHERE id > ?1
+        UNION ALL
+        SELECT case_id, language, source_type, deleted_flag
+        FROM events WHERE id > ?1 AND case_id IS NOT NULL AND case_id != ''
+    ),
+    grouped AS (
+        SELECT scope, language, source_type, deleted_flag = 1 AS deleted, COUNT(*) AS n
+        FROM scoped
+        GROUP BY scope, language, source_type, deleted
+    )
+    INSERT INTO stats_counters (case_id, dimension, value, count)
+    SELECT scope, 'total', '', SUM(n) FROM grouped
+    GROUP BY scope
+    UNION ALL
+    SELECT scope, 'deleted', '', SUM(n) FROM grouped WHERE deleted
+    GROUP BY scope
+    UNION ALL
+    SELECT scope, 'language', language, SUM(n) FROM grouped WHERE language IS NOT NULL
+    GROUP BY scope, language
+    UNION ALL
+    SELECT scope, 'source', source_type, SUM(n) FROM grouped WHERE source_type IS NOT NULL
+    GROUP BY scope, source_type
+    ON CONFLICT (case_id, dimension, value) DO UPDATE SET
+        count = count + excluded.count
+"""
+
+# Distinct (scope, actor) pairs among the new events
+_NEW_ACTORS_SQL = """
+    SELECT '' AS scope, actor_id
+    FROM events WHERE id > ?1 AND actor_id IS NOT NULL
+    UNION
+    SELECT case_id, actor_id
+    FROM events
+    WHERE id > ?1 AND actor_id IS NOT NULL
+      AND case_id IS NOT NULL AND case_id != ''
+"""
+
+# Counted before the pairs are recorded in stats_actors: only actors not
+# seen before in a scope add to its distinct count
+REFRESH_ACTOR_COUNTS_SQL = f"""
+    INSERT INTO stats_counters (case_id, dimension, value, count)
+    SELECT scope, 'actors', '', COUNT(*)
+    FROM ({_NEW_ACTORS_SQL}) AS new
+    WHERE NOT EXISTS (
+        SELECT 1 FROM stats_actors seen
+        WHERE seen.case_id = new.scope AND seen.actor_id = new.actor_id
+    )
+    GROUP BY scope
+    ON CONFLICT (case_id, dimension, value) DO UPDATE SET
+        count = count + excluded.count
+"""
+
+RECORD_ACTORS_SQL = f"""
+    INSERT OR IGNORE INTO stats_actors (case_id, actor_id)
+    {_NEW_ACTORS_SQL}
+"""
+
+
+def refresh_stats_counters(cursor, since_id: int = 0) -> None:
+    """
+    Folds events with id > since_id into stats_counters and stats_actors.
+    Called by ingestion inside its transaction, like the other aggregates.
+    """
+    cursor.execute(REFRESH_STATS_COUNTERS_SQL, (since_id,))
+    cursor.execute(REFRESH_ACTOR_COUNTS_SQL, (since_id,))
+    cursor.execute(RECORD_ACTORS_SQL, (since_id,))
+
+
+def rebuild_stats_counters(cursor) -> None:
+    """
+    Recomputes stats_counters and stats_actors from the events table.
+    """
+    cursor.execute("DELETE FROM stats_counters")
+    cursor.execute("DELETE FROM stats_actors")
+    refresh_stats_counters(cursor, since_id=0)
+
+
+def counters_query(case_id: Optional[str] = None) -> Tuple[str, List[Any]]:
+    """
+    Every maintained figure of one scope: a primary key range of
+    stats_counters. Returns (sql, params).
+    """
+    query = """
+        SELECT dimension, value, count
+        FROM stats_counters
+        WHERE case_id = ?
+        ORDER BY dimension, count DESC, value
+    """
+    return query, [case_id or ""]
+
+
+def _summary(
+    case_id: Optional[str],
+    total: int,
+    deleted: int,
+    actors: int,
+    languages: List[Tuple[str, int]],
+    sources: List[Tuple[str, int]],
+) -> Dict[str, Any]:
+    return {
+        "case_id": case_id,
+        "total_events": total,
+        "deleted_messages": deleted,
+        "unique_users": actors,
+        "language_distribution": [
+            {"language": language, "count": count} for language, count in languages
+        ],
+        "source_distribution": [
+            {"source_type": source, "count": count} for source, count in sources
+        ]
+    }
+
+
+def _read_counters(conn: sqlite3.Connection, case_id: Optional[str] = None) -> Dict:
+    figures: Dict[str, Any] = {"total": 0, "deleted": 0, "actors": 0}
+    breakdowns: Dict[str, List[Tuple[str, int]]] = {"language": [], "source": []}
+    for dimension, value, count in conn.execute(*counters_query(case_id)):
+        if dimension in breakdowns:
+            breakdowns[dimension].append((value, count))
+        else:
+            figures[dimension] = count
+    return {**figures, **breakdowns}
+
+
+def stats_from_counters(conn: sqlite3.Connection, case_id: Optional[str] = None) -> Dict:
+    """
+    The /stats summary of one database, read from stats_counters.
+    """
+    counters = _read_counters(conn, case_id)
+    return _summary(
+        case_id,
+        counters["total"],
+        counters["deleted"],
+        counters["actors"],
+        counters["language"],
+        counters["source"],
+    )
+
+
+def _shard_counters(conn: sqlite3.Connection, _) -> Dict:
+    """
+    One shard's figures over all its events, plus its distinct actors,
+    since distinct counts do not add up across shards.
+    """
+    counters = _read_counters(conn)
+    counters["actor_ids"] = {
+        row[0] for row in conn.execute(
+            "SELECT actor_id FROM stats_actors WHERE case_id = ''"
+        )
+    }
+    return counters
+
+
+def _stats_across_shards(conn: sqlite3.Connection) -> Dict:
+    shards = map_shards(_shard_counters, conn)
+
+    actors = set()
+    languages: Counter = Counter()
+    sources: Counter = Counter()
+    for counters in shards:
+        actors |= counters["actor_ids"]
+        languages.update(dict(counters["language"]))
+        sources.update(dict(counters["source"]))
+
+    def ranked(counts: Counter) -> List[Tuple[str, int]]:
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))
+
+    return _summary(
+        None,
+        sum(counters["total"] for counters in shards),
+        sum(counters["deleted"] for counters in shards),
+        len(actors),
+        ranked(languages),
+        ranked(sources),
+    )
+
+
+def collect_stats(conn: sqlite3.Connection, case_id: Optional[str] = None) -> Dict:
+    """
+    High-level summary over all events or one case, read from the
+    counters maintained at ingestion: the cost depends on the number of
+    languages and sources, not on the number of events. In sharded mode
+    conn must be case_id's shard; without a case_id every shard's
+    counters are read in parallel and merged.
+    """
+    if spans_shards(case_id):
+        return _stats_across_shards(conn)
+    return stats_from_counters(conn, case_id)
+
+
+def count_events(conn: sqlite3.Connection, case_id: Optional[str] = None) -> int:
+    """
+    Number of events over all cases or in one case, from the counters.
+    """
+    if spans_shards(case_id):
+        return sum(map_shards(lambda shard, _: _read_counters(shard)["total"], conn))
+    return _read_counters(conn, case_id)["total"]
+
+
+# ---- Full recount, for checking the counters ----
+
+def stats_queries(case_id: Optional[str] = None) -> Dict[str, Tuple[str, List[Any]]]:
+    """
+    SQL and params recounting each figure from events, over all events
+    or one case.
+    """
+    scope = ["case_id = ?"] if case_id else []
+    params = [case_id] if case_id else []
+
+    def where(*conditions: str) -> str:
+        conditions = tuple(scope) + conditions
+        return f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    return {
+        "total_events": (
+            f"SELECT COUNT(*) FROM events {where()}",
+            params,
+        ),
+        "deleted_messages": (
+            f"SELECT COUNT(*) FROM events {where('deleted_flag = 1')}",
+            params,
+        ),
+        "unique_users": (
+            f"SELECT COUNT(DISTINCT actor_id) FROM events {where('actor_id IS NOT NULL')}",
+            params,
+        ),
+        "language_distribution": (
+            f"""
+            SELECT language, COUNT(*) as count
+            FROM events
+            {where('language IS NOT NULL')}
+            GROUP BY language
+            ORDER BY count DESC, language
+            """,
+            params,
+        ),
+        "source_distribution": (
+            f"""
+            SELECT source_type, COUNT(*) as count
+            FROM events
+            {where('source_type IS NOT NULL')}
+            GROUP BY source_type
+            ORDER BY count DESC, source_type
+            """,
+            params,
+        ),
+    }
+
+
+def recount_stats(conn: sqlite3.Connection, case_id: Optional[str] = None) -> Dict:
+    """
+    The /stats summary of one database recounted from the events table.
+    """
+    cursor = conn.cursor()
+    queries = stats_queries(case_id)
+
+    def scalar(name: str) -> int:
+        return cursor.execute(*queries[name]).fetchone()[0]
+
+    def breakdown(name: str) -> List[Tuple[str, int]]:
+        return [tuple(row) for row in cursor.execute(*queries[name]).fetchall()]
+
+    return _summary(
+        case_id,
+        scalar("total_events"),
+        scalar("deleted_messages"),
+        scalar("unique_users"),
+        breakdown("language_distribution"),
+        breakdown("source_distribution"),
+    )
@@ -1,9 +1,311 @@
+import base64
+import heapq
+import json
+import re
 import sqlite3
-from typing import Optional, Dict, List, Any
-from app.core.database import get_connection
+import threading
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Optional, Dict, Iterator, List, Any, Tuple
+from app.core.database import (
+    ensure_schema, get_pool, iter_rows, map_shards, resolve_case_db, shard_paths,
+    spans_shards
+)
+from app.utils.helpers import decode_metadata
 
 
-def get_timeline(
+# Naive timestamps are stored as epoch seconds of their wall time as UTC
+EPOCH = datetime(1970, 1, 1)
+
+# Event columns returned by the timeline; metadata only on request
+TIMELINE_COLUMNS = [
+    "id", "event_id", "case_id", "source_type", "event_type",
+    "timestamp", "ts_epoch", "hour", "actor_id", "target_id", "message_text",
+    "deleted_flag", "language", "device_id", "ip_address",
+]
+
+# Largest page get_timeline returns
+MAX_PAGE_SIZE = 5000
+
+# A keyword containing any of these is taken as FTS5 query syntax
+FTS_OPERATORS = re.compile(r'["*():^]|\b(?:AND|OR|NOT|NEAR)\b')
+
+# Per-thread in-memory FTS5 table for checking keyword syntax
+_fts_scratch = threading.local()
+
+
+def refresh_events_fts(cursor, since_id: int = 0) -> None:
+    """
+    Indexes message_text of events with id > since_id in events_fts.
+    Called by ingestion inside its transaction, like the aggregate refreshes.
+    """
+    cursor.execute("""
+        INSERT INTO events_fts (rowid, message_text)
+        SELECT id, message_text FROM events
+        WHERE id > ? AND message_text IS NOT NULL
+    """, (since_id,))
+
+
+def rebuild_events_fts(cursor) -> None:
+    """
+    Rebuilds the full-text index from the events table.
+    """
+    cursor.execute("INSERT INTO events_fts (events_fts) VALUES ('rebuild')")
+
+
+# ---- Hourly rollups for histograms ----
+# Bucket lengths in seconds, and the offset of the first bucket boundary
+# from the epoch: weeks start on Monday (1970-01-05)
+HISTOGRAM_INTERVALS = {
+    "hour": (3600, 0),
+    "day": (86400, 0),
+    "week": (604800, 345600),
+}
+
+
+def _floor(column: str, interval: str) -> str:
+    """SQL for the start of the interval containing epoch column (also before 1970)."""
+    size, offset = HISTOGRAM_INTERVALS[interval]
+    return f"({column} - ((({column} - {offset}) % {size}) + {size}) % {size})"
+
+
+# One row per case, hour and source; case_id and source_type '' when unset
+REFRESH_ROLLUP_HOURLY_SQL = f"""
+    INSERT INTO rollup_hourly (case_id, bucket, source_type, events, deleted)
+    SELECT
+        COALESCE(case_id, ''),
+        {_floor("ts_epoch", "hour")},
+        COALESCE(source_type, ''),
+        COUNT(*),
+        SUM(deleted_flag = 1)
+    FROM events
+    WHERE id > ? AND ts_epoch IS NOT NULL
+    GROUP BY 1, 2, 3
+    ON CONFLICT (case_id, bucket, source_type) DO UPDATE SET
+        events  = events + excluded.events,
+        deleted = deleted + excluded.deleted
+"""
+
+# Events count for both their actor and their target, like the /timeline
+# actor_id filter, and once when the two are the same user
+REFRESH_ROLLUP_HOURLY_ACTOR_SQL = f"""
+    INSERT INTO rollup_hourly_actor (actor_id, bucket, case_id, source_type, events, deleted)
+    SELECT user_id, {_floor("ts_epoch", "hour")}, case_id, source_type, COUNT(*), SUM(deleted)
+    FROM (
+        SELECT actor_id AS user_id, ts_epoch, COALESCE(case_id, '') AS case_id,
+               COALESCE(source_type, '') AS source_type, deleted_flag = 1 AS deleted
+        FROM events
+        WHERE id > ?1 AND ts_epoch IS NOT NULL
+          AND actor_id IS NOT NULL AND actor_id != ''
+        UNION ALL
+        SELECT target_id, ts_epoch, COALESCE(case_id, ''),
+               COALESCE(source_type, ''), deleted_flag = 1
+        FROM events
+        WHERE id > ?1 AND ts_epoch IS NOT NULL
+          AND target_id IS NOT NULL AND target_id != ''
+          AND target_id IS NOT actor_id
+    )
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (actor_id, bucket, case_id, source_type) DO UPDATE SET
+        events  = events + excluded.events,
+        deleted = deleted + excluded.deleted
+"""
+
+
+def refresh_event_rollups(cursor, since_id: int = 0) -> None:
+    """
+    Folds events with id > since_id into the hourly rollup tables.
+    Called by ingestion inside its transaction, like the other aggregates.
+    """
+    cursor.execute(REFRESH_ROLLUP_HOURLY_SQL, (since_id,))
+    cursor.execute(REFRESH_ROLLUP_HOURLY_ACTOR_SQL, (since_id,))
+
+
+def rebuild_event_rollups(cursor) -> None:
+    """
+    Recomputes the hourly rollup tables from the events table.
+    """
+    cursor.execute("DELETE FROM rollup_hourly")
+    cursor.execute("DELETE FROM rollup_hourly_actor")
+    refresh_event_rollups(cursor, since_id=0)
+
+
+def histogram_query(
+    interval: str = "day",
+    case_id: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    source_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> Tuple[str, List[Any]]:
+    """
+    Event counts per interval, summed from the hourly rollups: the actor
+    table when filtering by actor_id, otherwise the per-case one. Date
+    bounds select whole hours, those overlapping the range.
+    Returns (sql, params).
+    """
+    table = "rollup_hourly_actor" if actor_id else "rollup_hourly"
+    conditions: List[str] = []
+    params: List[Any] = []
+
+    if actor_id:
+        conditions.append("actor_id = ?")
+        params.append(actor_id)
+
+    if case_id:
+        conditions.append("case_id = ?")
+        params.append(case_id)
+
+    if source_type:
+        conditions.append("source_type = ?")
+        params.append(source_type)
+
+    if start_date:
+        conditions.append("bucket > CAST(strftime('%s', ?) AS INTEGER) - 3600")
+        params.append(start_date)
+
+    if end_date:
+        conditions.append("bucket <= CAST(strftime('%s', ?) AS INTEGER)")
+        params.append(end_date)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+    query = f"""
+        SELECT {_floor("bucket", interval)} AS bucket,
+               SUM(events) AS events,
+               SUM(deleted) AS deleted
+        FROM {table}
+        {where}
+        GROUP BY 1
+        ORDER BY 1
+    """
+    return query, params
+
+
+def get_histogram(
+    conn: sqlite3.Connection,
+    interval: str = "day",
+    case_id: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    source_type: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Activity over time: events and deleted events per hour, day or week
+    (ISO weeks, starting Monday), read from the hourly rollups kept by
+    ingestion rather than from events. Intervals without events are
+    omitted. In sharded mode conn must be case_id's shard; without a
+    case_id every shard's counts are summed.
+    Raises ValueError for an unknown interval.
+    """
+    if interval not in HISTOGRAM_INTERVALS:
+        raise ValueError(
+            f"Unsupported interval: {interval!r}. "
+            f"Must be one of: {list(HISTOGRAM_INTERVALS)}"
+        )
+
+    query, params = histogram_query(
+        interval, case_id, actor_id, source_type, start_date, end_date
+    )
+
+    if spans_shards(case_id):
+        counts: Dict[int, List[int]] = {}
+        for rows in map_shards(lambda shard, _: shard.execute(query, params).fetchall(), conn):
+            for bucket, events, deleted in rows:
+                totals = counts.setdefault(bucket, [0, 0])
+                totals[0] += events
+                totals[1] += deleted
+        rows = [(bucket, *counts[bucket]) for bucket in sorted(counts)]
+    else:
+        rows = conn.execute(query, params).fetchall()
+
+    buckets = [
+        {
+            "start": (EPOCH + timedelta(seconds=bucket)).strftime("%Y-%m-%d %H:%M:%S"),
+            "ts_epoch": bucket,
+            "events": events,
+            "deleted": deleted,
+        }
+        for bucket, events, deleted in rows
+    ]
+
+    return {
+        "interval": interval,
+        "case_id": case_id,
+        "actor_id": actor_id,
+        "source_type": source_type,
+        "total_events": sum(bucket["events"] for bucket in buckets),
+        "buckets": buckets,
+    }
+
+
+def _is_fts_syntax(keyword: str) -> bool:
+    """
+    Whether keyword parses as an FTS5 query, checked against an empty
+    in-memory table with events_fts's column (one per thread).
+    """
+    conn = getattr(_fts_scratch, "conn", None)
+    if conn is None:
+        conn = _fts_scratch.conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE VIRTUAL TABLE events_fts USING fts5(message_text)")
+    try:
+        conn.execute(
+            "SELECT rowid FROM events_fts WHERE events_fts MATCH ?", (keyword,)
+        ).fetchall()
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+
+def fts_match_query(keyword: str) -> str:
+    """
+    The FTS5 MATCH expression for a timeline keyword. Input written with
+    operators (AND / OR / NOT / NEAR, "phrases", prefix*, parentheses,
+    column filters) is used as is when it parses. Anything else, such as
+    +91 numbers or a@b handles, is matched token by token: each
+    whitespace-separated token is quoted as a phrase and all must occur.
+    Returns "" when keyword has no tokens.
+    """
+    if FTS_OPERATORS.search(keyword) and _is_fts_syntax(keyword):
+        return keyword
+    return " ".join('"' + token.replace('"', '""') + '"' for token in keyword.split())
+
+
+def _event(row: sqlite3.Row, include_metadata: bool = False) -> Dict[str, Any]:
+    event = dict(row)
+    if include_metadata:
+        event["metadata"] = decode_metadata(event["metadata"])
+    return event
+
+
+def encode_cursor(ts_epoch: int, event_row_id: int, shard: Optional[str] = None) -> str:
+    """
+    Opaque pagination cursor pointing just past the (ts_epoch, id) given.
+    Pages merged across shards also record the shard of that event, since
+    row ids are only unique within one database.
+    """
+    position = [ts_epoch, event_row_id] + ([shard] if shard is not None else [])
+    raw = json.dumps(position).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[int, int, str]:
+    """
+    Inverse of encode_cursor, returning (ts_epoch, id, shard) with shard
+    "" (the main database) if none was recorded.
+    Raises ValueError for malformed cursors.
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        ts_epoch, event_row_id, *shard = json.loads(base64.urlsafe_b64decode(padded))
+        return int(ts_epoch), int(event_row_id), str(shard[0]) if shard else ""
+    except Exception as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def build_timeline_query(
     case_id: Optional[str] = None,
     actor_id: Optional[str] = None,
     source_type: Optional[str] = None,
@@ -13,13 +315,23 @@ def get_timeline(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
     limit: int = 500,
-) -> Dict[str, Any]:
+    cursor: Optional[str] = None,
+    include_metadata: bool = False,
+    shard: Optional[str] = None,
+) -> Tuple[str, List[Any]]:
     """
-    Reconstruct a unified chronological timeline of events.
+    Builds the timeline SELECT for the given filters.
+    Rows are ordered by (ts_epoch, id); a cursor from a previous page
+    becomes a seek predicate on that key, so every page costs the same.
+    shard names the database queried when merging across shards, where
+    the order is (ts_epoch, id, shard): shards after the cursor's also
+    include rows at the cursor's exact (ts_epoch, id).
+    Returns (sql, params).
     """
-    limit = max(1, min(limit, 5000))
 
-    conditions: List[str] = ["timestamp IS NOT NULL"]
+    # Plain predicates on ts_epoch / hour so the epoch indexes can serve
+    # both the filter and the ORDER BY, stopping early at LIMIT
+    conditions: List[str] = ["ts_epoch IS NOT NULL"]
     params: List[Any] = []
 
     if case_id:
@@ -38,37 +350,252 @@ def get_timeline(
         conditions.append("deleted_flag = 1")
 
     if late_night:
-        conditions.append("CAST(strftime('%H', timestamp) AS INTEGER) BETWEEN 0 AND 4")
+        conditions.append("hour BETWEEN 0 AND 4")
 
-    if keyword:
-        conditions.append("LOWER(message_text) LIKE ?")
-        params.append(f"%{keyword.lower()}%")
+    # FTS5 query syntax: terms, prefix (pay*), "phrases", AND / OR / NOT
+    match = fts_match_query(keyword) if keyword else ""
+    if match:
+        conditions.append(
+            "id IN (SELECT rowid FROM events_fts WHERE events_fts MATCH ?)"
+        )
+        params.append(match)
 
     if start_date:
-        conditions.append("datetime(timestamp) >= datetime(?)")
+        conditions.append("ts_epoch >= CAST(strftime('%s', ?) AS INTEGER)")
         params.append(start_date)
 
     if end_date:
-        conditions.append("datetime(timestamp) <= datetime(?)")
+        conditions.append("ts_epoch <= CAST(strftime('%s', ?) AS INTEGER)")
         params.append(end_date)
 
+    if cursor:
+        ts_epoch, event_row_id, cursor_shard = decode_cursor(cursor)
+        seek = ">=" if shard is not None and shard > cursor_shard else ">"
+        conditions.append(f"(ts_epoch, id) {seek} (?, ?)")
+        params.extend([ts_epoch, event_row_id])
+
     params.append(limit)
 
+    columns = TIMELINE_COLUMNS + (["metadata"] if include_metadata else [])
+
     query = f"""
-        SELECT * FROM events
+        SELECT {", ".join(columns)} FROM events
         WHERE {" AND ".join(conditions)}
-        ORDER BY datetime(timestamp) ASC
+        ORDER BY ts_epoch ASC, id ASC
         LIMIT ?
     """
+    return query, params
 
-    conn = get_connection()
-    conn.row_factory = sqlite3.Row
-    try:
-        rows = conn.execute(query, params).fetchall()
-    finally:
-        conn.close()
+
+def _merge_key(shard: str, event) -> Tuple[int, int, str]:
+    return event["ts_epoch"], event["id"], shard
+
+
+def get_timeline(
+    conn: sqlite3.Connection,
+    case_id: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    source_type: Optional[str] = None,
+    deleted_only: bool = False,
+    late_night: bool = False,
+    keyword: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 500,
+    cursor: Optional[str] = None,
+    include_metadata: bool = False,
+) -> Dict[str, Any]:
+    """
+    Reconstruct a unified chronological timeline of events, one page at a
+    time. Pass the returned next_cursor back to fetch the following page;
+    it is None on the last page. Source fields without a column of their
+    own are decoded into each event's metadata only if include_metadata.
+    In sharded mode conn must be case_id's shard; without a case_id each
+    shard returns its own page in parallel and the pages are merged.
+    Raises ValueError for an invalid cursor, or a limit outside
+    1..MAX_PAGE_SIZE (larger exports go through iter_timeline).
+    """
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(
+            f"limit must be between 1 and {MAX_PAGE_SIZE} for paged results; "
+            f"use format=ndjson for larger exports"
+        )
+
+    # One extra row tells whether another page follows
+    filters = dict(
+        case_id=case_id,
+        actor_id=actor_id,
+        source_type=source_type,
+        deleted_only=deleted_only,
+        late_night=late_night,
+        keyword=keyword,
+        start_date=start_date,
+        end_date=end_date,
+        limit=limit + 1,
+        cursor=cursor,
+        include_metadata=include_metadata,
+    )
+
+    if spans_shards(case_id):
+        def page(shard_conn, shard):
+            query, params = build_timeline_query(**filters, shard=shard)
+            return [(shard, row) for row in shard_conn.execute(query, params)]
+
+        pages = map_shards(page, conn)
+        rows = list(islice(
+            heapq.merge(*pages, key=lambda item: _merge_key(*item)), limit + 1
+        ))
+    else:
+        query, params = build_timeline_query(**filters)
+        rows = [(None, row) for row in conn.execute(query, params).fetchall()]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        shard, last = rows[-1]
+        next_cursor = encode_cursor(last["ts_epoch"], last["id"], shard)
 
     return {
         "total_events": len(rows),
-        "events": [dict(r) for r in rows],
-    }
\ No newline at end of file
+        "events": [_event(row, include_metadata) for _, row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def _stream_rows(
+    rows: sqlite3.Cursor,
+    include_metadata: bool = False,
+) -> Iterator[Dict[str, Any]]:
+    """Yields rows as dicts in fetchmany batches."""
+    for row in iter_rows(rows):
+        yield _event(row, include_metadata)
+
+
+def _execute(
+    path: Path,
+    query: str,
+    params: List[Any],
+) -> Tuple[Any, sqlite3.Connection, sqlite3.Cursor]:
+    """
+    Runs the query on its own pooled connection to path.
+    Returns (pool, conn, rows) for a TimelineStream.
+    """
+    pool = get_pool(path)
+    conn = pool.acquire()
+    try:
+        return pool, conn, conn.execute(query, params)
+    except Exception:
+        pool.release(conn)
+        raise
+
+
+def _merge_streams(
+    streams: Dict[str, Iterator[Dict[str, Any]]],
+    limit: Optional[int] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Merges per-shard streams, each already in (ts_epoch, id) order, into
+    one ordered stream.
+    """
+    def tagged(shard, stream):
+        return ((shard, event) for event in stream)
+
+    merged = heapq.merge(
+        *(tagged(shard, stream) for shard, stream in streams.items()),
+        key=lambda item: _merge_key(*item)
+    )
+    for _, event in islice(merged, limit):
+        yield event
+
+
+class TimelineStream:
+    """
+    Events of an iter_timeline export, holding one pooled connection per
+    database read. close() returns them to their pools whether or not the
+    events were consumed, and may be called more than once; the owner
+    calls it when done (ndjson_response runs it after the response).
+    A failure while iterating closes the stream as well.
+    """
+
+    def __init__(self, opened: List[Tuple[Any, sqlite3.Connection, sqlite3.Cursor]], events):
+        self._opened = opened
+        self._events = events
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        try:
+            yield from self._events
+        except Exception:
+            self.close()
+            raise
+
+    def close(self) -> None:
+        with self._lock:
+            opened, self._opened = self._opened, []
+        for pool, conn, rows in opened:
+            rows.close()
+            pool.release(conn)
+
+
+def iter_timeline(
+    case_id: Optional[str] = None,
+    actor_id: Optional[str] = None,
+    source_type: Optional[str] = None,
+    deleted_only: bool = False,
+    late_night: bool = False,
+    keyword: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    include_metadata: bool = False,
+) -> TimelineStream:
+    """
+    Streaming variant of get_timeline for exports: same filters and order,
+    no page cap (limit=None returns every matching event). The query runs
+    before this returns, so invalid input raises ValueError up front; rows
+    are then read lazily, so memory stays flat regardless of result size.
+
+    The stream outlives the request handler, so it checks out its own
+    pooled connection, returned by the stream's close(); the caller must
+    close it even if it never iterates. Across shards it holds one
+    connection per shard and merges their streams.
+    """
+    filters = dict(
+        case_id=case_id,
+        actor_id=actor_id,
+        source_type=source_type,
+        deleted_only=deleted_only,
+        late_night=late_night,
+        keyword=keyword,
+        start_date=start_date,
+        end_date=end_date,
+        limit=limit if limit else -1,   # LIMIT -1 = no limit in SQLite
+        cursor=cursor,
+        include_metadata=include_metadata,
+    )
+
+    if not spans_shards(case_id):
+        query, params = build_timeline_query(**filters)
+        opened = _execute(resolve_case_db(case_id), query, params)
+        return TimelineStream([opened], _stream_rows(opened[2], include_metadata))
+
+    opened = {}
+    try:
+        for shard, path in shard_paths().items():
+            ensure_schema(path)
+            query, params = build_timeline_query(**filters, shard=shard)
+            opened[shard] = _execute(path, query, params)
+    except Exception:
+        for pool, conn, rows in opened.values():
+            rows.close()
+            pool.release(conn)
+        raise
+
+    return TimelineStream(
+        list(opened.values()),
+        _merge_streams(
+            {shard: _stream_rows(rows, include_metadata) for shard, (_, _, rows) in opened.items()},
+            limit
+        )
+    )
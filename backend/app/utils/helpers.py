@@ -0,0 +1,58 @@
+import json
+import zlib
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+
+RESPONSE_FORMATS = ("json", "ndjson")
+
+# Encoded metadata longer than this is zlib-compressed
+METADATA_COMPRESS_MIN_BYTES = 96
+
+
+def ndjson_response(
+    items: Iterable[Any],
+    on_close: Optional[Callable[[], None]] = None
+) -> StreamingResponse:
+    """
+    Streams items as newline-delimited JSON, one serialized item per line,
+    without materializing the whole payload. on_close runs once the
+    response has been sent or the client has disconnected.
+    """
+    lines = (json.dumps(item, default=str) + "\n" for item in items)
+    background = BackgroundTask(on_close) if on_close else None
+    return StreamingResponse(lines, media_type="application/x-ndjson", background=background)
+
+
+def encode_metadata(record: Dict[str, Any]) -> Optional[bytes]:
+    """
+    Encodes an event metadata dict as compact JSON bytes, zlib-compressed
+    when long enough to benefit. None values are dropped; an empty record
+    encodes to None.
+    """
+    record = {key: value for key, value in record.items() if value is not None}
+    if not record:
+        return None
+
+    data = json.dumps(record, separators=(",", ":"), ensure_ascii=False, default=str).encode()
+    if len(data) >= METADATA_COMPRESS_MIN_BYTES:
+        compressed = zlib.compress(data)
+        if len(compressed) < len(data):
+            return compressed
+    return data
+
+
+def decode_metadata(value: Optional[bytes]) -> Dict[str, Any]:
+    """
+    Decodes metadata stored by encode_metadata. Plain JSON starts with "{",
+    zlib streams never do, so the encoding needs no marker.
+    """
+    if not value:
+        return {}
+    if isinstance(value, str):
+        return json.loads(value)
+    if not value.startswith(b"{"):
+        value = zlib.decompress(value)
+    return json.loads(value)
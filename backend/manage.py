@@ -0,0 +1,744 @@
+"""
+SentinelX maintenance commands.
+
+Usage:
+    python manage.py rebuild-risk-stats
+    python manage.py rebuild-stats
+    python manage.py check-stats
+    python manage.py check-query-plans
+    python manage.py split-cases
+    python manage.py archive-case <case_id>
+    python manage.py restore-case <case_id>
+    python manage.py bench-timestamps [--rows N]
+    python manage.py bench-keywords [--rows N]
+    python manage.py bench-fts [--rows N]
+    python manage.py bench-metadata [--rows N]
+    python manage.py bench-graph [--rows N]
+"""
+import argparse
+import json
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List
+
+import pandas as pd
+
+from app.core.config import settings
+from app.core.database import (
+    archive_case as archive_case_file,
+    bump_ingestion_generation,
+    close_pool,
+    create_tables,
+    ensure_schema,
+    pooled_connection,
+    resolve_case_db,
+    restore_case as restore_case_file,
+    shard_paths,
+)
+from app.core.migrations import REBUILDERS
+from app.services.graph_engine import (
+    _compute_centrality, _graph_elements, edge_deltas_query, edges_query
+)
+from app.services.risk_engine import risk_counters_query
+from app.services.ingestion_service import (
+    SOURCE_MAPPINGS, TIMESTAMP_FORMATS, _max_event_id, _parse_timestamps, _update_aggregates,
+    mapped_fields
+)
+from app.services.keyword_matcher import KeywordMatcher
+from app.services.risk_engine import rebuild_user_risk_stats
+from app.services.stats_service import (
+    counters_query, rebuild_stats_counters, recount_stats, stats_from_counters, stats_queries
+)
+from app.utils.helpers import decode_metadata, encode_metadata
+from app.services.timeline_service import (
+    build_timeline_query, encode_cursor, fts_match_query, histogram_query, rebuild_events_fts
+)
+
+
+def rebuild_risk_stats():
+    """
+    Recomputes the user_risk_stats aggregate table from the events table,
+    in the main database and every case shard.
+    """
+    actors = 0
+    for path in shard_paths().values():
+        ensure_schema(path)
+        with pooled_connection(path) as conn:
+            rebuild_user_risk_stats(conn.cursor())
+            conn.commit()
+            actors += conn.execute("SELECT COUNT(*) FROM user_risk_stats").fetchone()[0]
+
+    print(f"✅ Rebuilt user_risk_stats: {actors} actor rows")
+
+
+def rebuild_stats():
+    """
+    Recomputes stats_counters from the events table, in the main
+    database and every case shard.
+    """
+    for path in shard_paths().values():
+        ensure_schema(path)
+        with pooled_connection(path) as conn:
+            rebuild_stats_counters(conn.cursor())
+            conn.commit()
+
+    print("✅ Rebuilt stats_counters")
+
+
+def check_stats():
+    """
+    Compares the stats_counters figures of every scope (all events and
+    each case, in the main database and every case shard) against a full
+    recount from the events table. Exits non-zero on any difference.
+    """
+    failures = 0
+
+    for shard, path in shard_paths().items():
+        ensure_schema(path)
+        with pooled_connection(path) as conn:
+            cases = sorted({
+                row[0] for row in conn.execute("""
+                    SELECT DISTINCT case_id FROM events
+                    WHERE case_id IS NOT NULL AND case_id != ''
+                    UNION
+                    SELECT DISTINCT case_id FROM stats_counters WHERE case_id != ''
+                """)
+            })
+            for case_id in [None, *cases]:
+                counted = stats_from_counters(conn, case_id)
+                recounted = recount_stats(conn, case_id)
+                differences = [
+                    key for key in recounted if counted[key] != recounted[key]
+                ]
+                scope = f"case {case_id!r}" if case_id else "all events"
+                where = f"{scope} in shard {shard!r}" if shard else scope
+                if differences:
+                    failures += 1
+                    print(f"[FAIL] {where}:")
+                    for key in differences:
+                        print(f"    {key}: counters {counted[key]} != recount {recounted[key]}")
+                else:
+                    print(f"[ok] {where}: {recounted['total_events']} events")
+
+    if failures:
+        print(f"\n❌ {failures} scope(s) differ; run `python manage.py rebuild-stats`")
+        sys.exit(1)
+    print("\n✅ stats_counters match a full recount")
+
+
+def _require_sharding():
+    if not settings.CASE_SHARDS:
+        print("❌ Per-case storage is disabled (settings.CASE_SHARDS)")
+        sys.exit(1)
+
+
+def split_cases():
+    """
+    Moves the events of every case out of the main database into the
+    case's own shard, then rebuilds the aggregates on both sides. Events
+    already in a shard are skipped by event_id, so an interrupted run can
+    simply be repeated.
+    """
+    _require_sharding()
+
+    with pooled_connection() as conn:
+        cases = [row[0] for row in conn.execute(
+            "SELECT DISTINCT case_id FROM events WHERE case_id IS NOT NULL AND case_id != ''"
+        )]
+        columns = ", ".join(
+            row["name"] for row in conn.execute("PRAGMA table_info(events)")
+            if row["name"] != "id"
+        )
+
+    for case_id in cases:
+        path = resolve_case_db(case_id, create=True)
+
+        with pooled_connection(path) as shard:
+            since_id = _max_event_id(shard.cursor())
+
+        # One transaction over both files: atomic per file in WAL mode, so
+        # events already copied by an interrupted run are ignored by event_id
+        with pooled_connection() as conn:
+            conn.execute("ATTACH DATABASE ? AS shard", (str(path),))
+            try:
+                moved = conn.execute(f"""
+                    INSERT OR IGNORE INTO shard.events ({columns})
+                    SELECT {columns} FROM main.events
+                    WHERE case_id = ?
+                    ORDER BY id
+                """, (case_id,)).rowcount
+                conn.execute("DELETE FROM main.events WHERE case_id = ?", (case_id,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.execute("DETACH DATABASE shard")
+
+        with pooled_connection(path) as shard:
+            _update_aggregates(shard.cursor(), since_id)
+            shard.commit()
+
+        print(f"  {case_id}: {moved} events -> {path}")
+
+    with pooled_connection() as conn:
+        cursor = conn.cursor()
+        for rebuild in REBUILDERS.values():
+            rebuild(cursor)
+        bump_ingestion_generation(cursor, cases)
+        conn.commit()
+
+    print(f"✅ Split {len(cases)} case(s) into {settings.CASES_DIR}")
+
+
+def archive_case(case_id: str):
+    """
+    Moves a closed case's shard to the archive directory.
+    """
+    _require_sharding()
+    try:
+        path = archive_case_file(case_id)
+    except (FileNotFoundError, FileExistsError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Archived case {case_id!r} to {path}")
+
+
+def restore_case(case_id: str):
+    """
+    Moves an archived case back into the active case directory.
+    """
+    _require_sharding()
+    try:
+        path = restore_case_file(case_id)
+    except (FileNotFoundError, FileExistsError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    print(f"✅ Restored case {case_id!r} to {path}")
+
+
+def _index(name: str) -> str:
+    """Plan fragment showing that the named index is used."""
+    return f"INDEX {name} "
+
+
+# (description, (sql, params), fragments the query plan must contain)
+QUERY_PLAN_CHECKS = [
+    (
+        "timeline: case_id filter",
+        build_timeline_query(case_id="case"),
+        [_index("idx_events_case_epoch")],
+    ),
+    (
+        "timeline: actor_id filter",
+        build_timeline_query(actor_id="actor"),
+        [_index("idx_events_actor"), _index("idx_events_target")],
+    ),
+    (
+        "timeline: source_type filter",
+        build_timeline_query(source_type="whatsapp"),
+        [_index("idx_events_source_epoch")],
+    ),
+    (
+        "timeline: deleted_only filter",
+        build_timeline_query(deleted_only=True),
+        [_index("idx_events_deleted_epoch")],
+    ),
+    (
+        "timeline: unfiltered, date range",
+        build_timeline_query(start_date="2024-01-01", end_date="2024-12-31"),
+        [_index("idx_events_epoch")],
+    ),
+    (
+        "timeline: late night",
+        build_timeline_query(late_night=True),
+        [_index("idx_events_epoch")],
+    ),
+    (
+        "timeline: next page via cursor",
+        build_timeline_query(cursor=encode_cursor(1700000000, 42)),
+        [_index("idx_events_epoch")],
+    ),
+    (
+        "timeline: case_id page via cursor",
+        build_timeline_query(case_id="case", cursor=encode_cursor(1700000000, 42)),
+        [_index("idx_events_case_epoch")],
+    ),
+    (
+        "timeline: keyword search",
+        build_timeline_query(keyword="payment"),
+        ["SCAN events_fts VIRTUAL TABLE", "USING INTEGER PRIMARY KEY"],
+    ),
+    (
+        "histogram: case",
+        histogram_query("day", case_id="case", start_date="2024-01-01"),
+        ["SEARCH rollup_hourly USING PRIMARY KEY (case_id=? AND bucket>?)"],
+    ),
+    (
+        "histogram: date range",
+        histogram_query("week", start_date="2024-01-01", end_date="2024-12-31"),
+        [_index("idx_rollup_hourly_bucket")],
+    ),
+    (
+        "histogram: actor",
+        histogram_query("hour", actor_id="actor", start_date="2024-01-01"),
+        ["SEARCH rollup_hourly_actor USING PRIMARY KEY (actor_id=? AND bucket>?)"],
+    ),
+    (
+        "stats: counters",
+        counters_query(),
+        ["SEARCH stats_counters USING PRIMARY KEY (case_id=?)"],
+    ),
+    (
+        "stats: case counters",
+        counters_query(case_id="case"),
+        ["SEARCH stats_counters USING PRIMARY KEY (case_id=?)"],
+    ),
+    (
+        "stats recount: deleted messages",
+        stats_queries()["deleted_messages"],
+        [_index("idx_events_deleted_epoch")],
+    ),
+    (
+        "stats recount: unique users",
+        stats_queries()["unique_users"],
+        [_index("idx_events_actor")],
+    ),
+    (
+        "stats recount: source breakdown",
+        stats_queries()["source_distribution"],
+        [_index("idx_events_source_epoch")],
+    ),
+    (
+        "risk: case counters",
+        risk_counters_query(20, case_id="case"),
+        [_index("sqlite_autoindex_user_risk_stats_1")],
+    ),
+    (
+        "graph: focus_user edges",
+        edges_query(focus_user="actor"),
+        [_index("idx_edge_weights_node_a"), _index("idx_edge_weights_node_b")],
+    ),
+    (
+        "graph: case edges",
+        edges_query(case_id="case"),
+        [_index("sqlite_autoindex_edge_weights_1")],
+    ),
+    (
+        "graph: edge deltas",
+        edge_deltas_query(1000, 2000, case_id="case"),
+        ["SEARCH events USING INTEGER PRIMARY KEY (rowid>? AND rowid<?)"],
+    ),
+]
+
+
+def query_plan(conn: sqlite3.Connection, sql: str, params) -> str:
+    """EXPLAIN QUERY PLAN of sql as one line, steps separated by " | "."""
+    plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    return " | ".join(row["detail"] for row in plan)
+
+
+def missing_plan_fragments(details: str, fragments: List[str]) -> List[str]:
+    return [fragment for fragment in fragments if fragment not in details + " "]
+
+
+@contextmanager
+def _scratch_database() -> Iterator[sqlite3.Connection]:
+    """
+    A connection to a freshly migrated database in a temporary directory,
+    deleted on exit, for commands that must not touch the real one.
+    """
+    with tempfile.TemporaryDirectory(prefix="sentinelx-") as directory:
+        path = Path(directory) / "scratch.db"
+        create_tables(path)
+        try:
+            with pooled_connection(path) as conn:
+                yield conn
+        finally:
+            close_pool(path)
+
+
+def check_query_plans():
+    """
+    Runs EXPLAIN QUERY PLAN for each router query shape and verifies
+    that the planner uses the expected indexes. Exits non-zero otherwise.
+    Plans are taken on an empty, freshly migrated scratch database: what
+    is checked is the schema, and the real database is left untouched.
+    """
+    failures = 0
+
+    with _scratch_database() as conn:
+        for description, (sql, params), fragments in QUERY_PLAN_CHECKS:
+            details = query_plan(conn, sql, params)
+            missing = missing_plan_fragments(details, fragments)
+            status = "FAIL" if missing else "ok"
+            print(f"[{status}] {description}: {details}")
+            failures += bool(missing)
+
+    if failures:
+        print(f"\n❌ {failures} query plan check(s) failed")
+        sys.exit(1)
+    print("\n✅ All query plans use their indexes")
+
+
+def _parse_full_column_trials(values: pd.Series) -> pd.Series:
+    """
+    Reference for bench-timestamps: try each format over the whole column
+    until one matches more than 90% of it.
+    """
+    for fmt in TIMESTAMP_FORMATS:
+        parsed = pd.to_datetime(values, format=fmt, errors="coerce")
+        if parsed.notna().mean() > 0.9:
+            return parsed
+    return pd.to_datetime(values, errors="coerce")
+
+
+def bench_timestamps(rows: int = 200000):
+    """
+    Times timestamp parsing for a column in each of the known formats, and
+    for a column mixing all of them, against trying every format over the
+    full column.
+    """
+    stamps = pd.Series(pd.date_range("2024-01-01", periods=rows, freq="37s"))
+    columns = [(fmt, stamps.dt.strftime(fmt)) for fmt in TIMESTAMP_FORMATS]
+    mixed = pd.concat(
+        [values.iloc[i::len(columns)] for i, (_, values) in enumerate(columns)]
+    ).sort_index()
+    columns.append(("mixed (all formats)", mixed))
+
+    print(f"{'format':<24}{'full-column trials':>20}{'sampled':>12}{'speedup':>10}")
+    for name, values in columns:
+        start = time.perf_counter()
+        _parse_full_column_trials(values)
+        baseline = time.perf_counter() - start
+
+        start = time.perf_counter()
+        _parse_timestamps(pd.DataFrame({"timestamp": values}), "bench", [])
+        sampled = time.perf_counter() - start
+
+        print(f"{name:<24}{baseline:>19.2f}s{sampled:>11.2f}s{baseline / sampled:>9.1f}x")
+
+
+BENCH_MESSAGES = [
+    "Let us discuss the plan.",
+    "Payment received successfully.",
+    "raat ko transfer kar",
+    "Meeting tomorrow at 10 AM.",
+    "amount bhej fast",
+    "Please call me when free.",
+    "Check and confirm.",
+    "kaam ho gaya kya",
+]
+
+
+def bench_keywords(rows: int = 200000):
+    """
+    Times financial keyword counting over message texts as the keyword
+    list grows: one SQL LIKE per keyword versus the precompiled matcher
+    registered as a SQLite function.
+    """
+    rng = random.Random(0)
+    base = ["transfer", "amount", "payment", "cash", "wire", "deposit"]
+    extra = [
+        "".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10)))
+        for _ in range(1000)
+    ]
+
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE TABLE messages (message_text TEXT, language TEXT)")
+    conn.executemany(
+        "INSERT INTO messages VALUES (?, 'English')",
+        ((rng.choice(BENCH_MESSAGES),) for _ in range(rows))
+    )
+
+    print(f"{'keywords':>9}{'LIKE per keyword':>18}{'matcher':>10}{'speedup':>10}")
+    for size in (6, 50, 200, 500, 1000):
+        keywords = base + extra[:size - len(base)]
+
+        like = " OR ".join("message_text LIKE ?" for _ in keywords)
+        start = time.perf_counter()
+        try:
+            expected = conn.execute(
+                f"SELECT SUM(CASE WHEN {like} THEN 1 ELSE 0 END) FROM messages",
+                [f"%{keyword}%" for keyword in keywords]
+            ).fetchone()[0]
+            baseline = time.perf_counter() - start
+        except sqlite3.OperationalError:
+            # SQLite caps expression depth at 1000 terms
+            expected = baseline = None
+
+        matcher = KeywordMatcher({"*": keywords})
+        conn.create_function(
+            "financial_match", 2,
+            lambda text, language: int(matcher.matches(text, language)),
+            deterministic=True
+        )
+        start = time.perf_counter()
+        counted = conn.execute(
+            "SELECT SUM(financial_match(message_text, language)) FROM messages"
+        ).fetchone()[0]
+        compiled = time.perf_counter() - start
+
+        if baseline is None:
+            print(f"{size:>9}{'too deep':>18}{compiled:>9.2f}s{'-':>10}")
+            continue
+        assert counted == expected, (size, counted, expected)
+        print(f"{size:>9}{baseline:>17.2f}s{compiled:>9.2f}s{baseline / compiled:>9.1f}x")
+
+
+# (description, keyword, equivalent LIKE pattern on LOWER(message_text))
+BENCH_FTS_QUERIES = [
+    ("rare term", "zyxwire", "%zyxwire%"),
+    ("phrase", '"payment received"', "%payment received%"),
+    ("common term", "transfer", "%transfer%"),
+]
+
+
+def bench_fts(rows: int = 1000000):
+    """
+    Times the timeline keyword filter on `rows` synthetic events in a
+    scratch database: the FTS5 MATCH query the timeline runs versus the
+    LOWER(message_text) LIKE '%...%' scan it replaced, both for the first
+    page (LIMIT 500) in timeline order. Matches are counted separately:
+    FTS matches whole tokens, so LIKE also counts substrings.
+    """
+    rng = random.Random(0)
+    messages = BENCH_MESSAGES + ["send via zyxwire now"]
+    # The rare message makes up about 0.1% of rows
+    weights = [999 / len(BENCH_MESSAGES)] * len(BENCH_MESSAGES) + [1]
+
+    with _scratch_database() as conn:
+        start = time.perf_counter()
+        conn.executemany(
+            "INSERT INTO events (event_id, source_type, timestamp, ts_epoch, hour, message_text) "
+            "VALUES (?, 'whatsapp', '', ?, ?, ?)",
+            (
+                (f"b{i}", epoch, epoch // 3600 % 24, text)
+                for i, (epoch, text) in enumerate(zip(
+                    (1700000000 + rng.randrange(10 ** 7) for _ in range(rows)),
+                    rng.choices(messages, weights, k=rows)
+                ))
+            )
+        )
+        inserted = time.perf_counter() - start
+
+        start = time.perf_counter()
+        rebuild_events_fts(conn.cursor())
+        conn.commit()
+        print(f"{rows} events inserted in {inserted:.2f}s, FTS index built in "
+              f"{time.perf_counter() - start:.2f}s")
+
+        like_sql = (
+            "SELECT id FROM events WHERE ts_epoch IS NOT NULL "
+            "AND LOWER(message_text) LIKE ? ORDER BY ts_epoch, id LIMIT 500"
+        )
+        print(f"{'query':<14}{'LIKE':>9}{'FTS':>9}{'speedup':>9}{'LIKE rows':>11}{'FTS rows':>10}")
+        for description, keyword, pattern in BENCH_FTS_QUERIES:
+            fts_sql, params = build_timeline_query(keyword=keyword, limit=500)
+
+            start = time.perf_counter()
+            conn.execute(like_sql, (pattern,)).fetchall()
+            like = time.perf_counter() - start
+
+            start = time.perf_counter()
+            conn.execute(fts_sql, params).fetchall()
+            fts = time.perf_counter() - start
+
+            like_rows = conn.execute(
+                "SELECT COUNT(*) FROM events WHERE LOWER(message_text) LIKE ?", (pattern,)
+            ).fetchone()[0]
+            fts_rows = conn.execute(
+                "SELECT COUNT(*) FROM events_fts WHERE events_fts MATCH ?",
+                (fts_match_query(keyword),)
+            ).fetchone()[0]
+            print(f"{description:<14}{like * 1000:>7.0f}ms{fts * 1000:>7.0f}ms"
+                  f"{like / fts:>8.1f}x{like_rows:>11}{fts_rows:>10}")
+
+
+# Sample case shipped with the repo, one CSV per source
+SAMPLE_CASE_DIR = Path(__file__).resolve().parent / "case_001"
+
+
+def bench_metadata(rows: int = 100000):
+    """
+    Measures events.metadata size per source on the sample case, repeated
+    to `rows` rows per source: the full raw record as JSON text, as it was
+    stored before, versus encode_metadata of the unmapped fields only.
+    Every encoded record must decode back to those fields.
+    """
+    print(f"{'source':<18}{'full JSON':>12}{'compact':>12}{'ratio':>8}{'compressed':>12}")
+    before_total = after_total = 0
+    for source_type in SOURCE_MAPPINGS:
+        sample = pd.read_csv(SAMPLE_CASE_DIR / f"{source_type}.csv")
+        df = pd.concat([sample] * -(-rows // len(sample)), ignore_index=True).head(rows)
+        df.columns = df.columns.str.strip().str.lower()
+        records = df.astype(object).where(df.notna(), None).to_dict("records")
+
+        drop = mapped_fields(source_type)
+        before = after = compressed = 0
+        for record in records:
+            before += len(json.dumps(record, default=str).encode())
+            extra = {key: value for key, value in record.items() if key not in drop}
+            encoded = encode_metadata(extra)
+            if encoded is None:
+                continue
+            after += len(encoded)
+            compressed += not encoded.startswith(b"{")
+            expected = json.loads(json.dumps(
+                {key: value for key, value in extra.items() if value is not None}, default=str
+            ))
+            assert decode_metadata(encoded) == expected, (source_type, record)
+
+        before_total += before
+        after_total += after
+        # Sources whose fields all have columns store no metadata at all
+        ratio = f"{before / after:>7.1f}x" if after else f"{'-':>8}"
+        print(f"{source_type:<18}{before / 2 ** 20:>8.1f} MiB{after / 2 ** 20:>8.1f} MiB"
+              f"{ratio}{compressed:>12}")
+    print(f"{'total':<18}{before_total / 2 ** 20:>8.1f} MiB{after_total / 2 ** 20:>8.1f} MiB"
+          f"{before_total / max(after_total, 1):>7.1f}x")
+
+
+def _measure(fn, *args):
+    """Runs fn(*args); returns (result, seconds, MiB allocated and still held)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - start
+    held = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, elapsed, held / 2 ** 20
+
+
+def bench_graph(rows: int = 100000):
+    """
+    Builds a synthetic communication graph of `rows` weighted edges with
+    the networkx and the CSR backends, and times degree and betweenness
+    centrality ("auto" mode) on each. Memory is what the graph structure
+    holds once built. Both backends must produce the same nodes and edges.
+    """
+    import networkx as nx
+    import numpy as np
+    from app.services.csr_graph import CSRGraph, _csr_centrality
+
+    rng = random.Random(0)
+    numbers = [f"9{rng.randrange(10 ** 9):09d}" for _ in range(max(rows // 2, 2))]
+    weights = {}
+    while len(weights) < rows:
+        # A few heavy callers, as in real call and UPI records
+        a = numbers[min(int(rng.paretovariate(0.8)) - 1, len(numbers) - 1)]
+        b = rng.choice(numbers)
+        pair = (min(a, b), max(a, b))
+        weights[pair] = weights.get(pair, 0) + rng.randint(1, 5)
+    edges = [(a, b, w) for (a, b), w in sorted(weights.items())]
+
+    def build_networkx():
+        G = nx.Graph()
+        G.add_weighted_edges_from(edges)
+        return G
+
+    def build_csr():
+        node_a, node_b, weight = zip(*edges)
+        return CSRGraph.from_edges(
+            np.array(node_a, dtype=object),
+            np.array(node_b, dtype=object),
+            np.array(weight, dtype=np.int64)
+        )
+
+    G, nx_build, nx_memory = _measure(build_networkx)
+    graph, csr_build, csr_memory = _measure(build_csr)
+
+    start = time.perf_counter()
+    degree_centrality, betweenness, mode, k = _compute_centrality(G, "auto")
+    nx_centrality = time.perf_counter() - start
+    expected = _graph_elements(G, degree_centrality, betweenness)
+
+    start = time.perf_counter()
+    degree_centrality, betweenness, _, _ = _csr_centrality(graph.adjacency, "auto")
+    csr_centrality = time.perf_counter() - start
+    nodes = [
+        {
+            "id": node,
+            "degree": degree,
+            "degree_centrality": round(dc, 4),
+            "betweenness_centrality": round(bc, 4),
+        }
+        for node, degree, dc, bc in zip(
+            graph.ids.tolist(), graph.degree().tolist(),
+            degree_centrality.tolist(), betweenness.tolist()
+        )
+    ]
+    sources, targets, edge_weights = graph.edges()
+    same_edges = expected[1] == [
+        {"source": s, "target": t, "weight": w}
+        for s, t, w in zip(sources.tolist(), targets.tolist(), edge_weights.tolist())
+    ]
+
+    pivots = f", k={k}" if k else ""
+    print(f"{G.number_of_nodes()} nodes, {G.number_of_edges()} edges, {mode} betweenness{pivots}")
+    print(f"{'backend':<10}{'build':>9}{'memory':>12}{'centrality':>12}")
+    print(f"{'networkx':<10}{nx_build:>8.2f}s{nx_memory:>8.1f} MiB{nx_centrality:>11.2f}s")
+    print(f"{'csr':<10}{csr_build:>8.2f}s{csr_memory:>8.1f} MiB{csr_centrality:>11.2f}s")
+    print(
+        f"memory {nx_memory / csr_memory:.1f}x smaller, "
+        f"centrality {nx_centrality / csr_centrality:.1f}x faster"
+    )
+    print(f"same nodes: {nodes == expected[0]}, same edges: {same_edges}")
+
+
+COMMANDS = {
+    "rebuild-risk-stats": rebuild_risk_stats,
+    "rebuild-stats": rebuild_stats,
+    "check-stats": check_stats,
+    "check-query-plans": check_query_plans,
+    "split-cases": split_cases,
+    "archive-case": archive_case,
+    "restore-case": restore_case,
+    "bench-timestamps": bench_timestamps,
+    "bench-keywords": bench_keywords,
+    "bench-fts": bench_fts,
+    "bench-metadata": bench_metadata,
+    "bench-graph": bench_graph,
+}
+
+# Commands that take the --rows option
+ROW_COMMANDS = {
+    "bench-timestamps", "bench-keywords", "bench-fts", "bench-metadata", "bench-graph"
+}
+
+# Commands that take a case_id argument
+CASE_COMMANDS = {"archive-case", "restore-case"}
+
+# Commands that never open the configured database, so must not migrate it
+SCRATCH_COMMANDS = ROW_COMMANDS | {"check-query-plans"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SentinelX maintenance commands")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("case_id", nargs="?", help="case for archive-case / restore-case")
+    parser.add_argument("--rows", type=int, help="rows for the bench-* commands")
+    args = parser.parse_args()
+
+    if args.command in CASE_COMMANDS and not args.case_id:
+        parser.error(f"{args.command} requires a case_id")
+
+    if args.command not in SCRATCH_COMMANDS:
+        create_tables()
+    if args.command in CASE_COMMANDS:
+        COMMANDS[args.command](args.case_id)
+    elif args.command in ROW_COMMANDS and args.rows:
+        COMMANDS[args.command](rows=args.rows)
+    else:
+        COMMANDS[args.command]()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+Shared fixtures: every test runs against its own SQLite files in a
+temporary directory, never the database under backend/data.
+"""
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app.core import cache
+from app.core.config import settings
+from app.core.database import close_pools, create_tables, pooled_connection
+from app.services import graph_engine
+
+CASE_DIR = Path(__file__).resolve().parent.parent / "case_001"
+
+
+class Upload:
+    """Stand-in for FastAPI's UploadFile: a filename and a binary file."""
+
+    def __init__(self, filename: str, data: bytes):
+        self.filename = filename
+        self.file = io.BytesIO(data)
+
+
+def csv_upload(filename: str, text: str) -> Upload:
+    return Upload(filename, text.encode())
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Path of a fresh, migrated main database; settings point at tmp_path."""
+    monkeypatch.setattr(settings, "DATA_DIR", tmp_path)
+    monkeypatch.setattr(settings, "DATABASE_PATH", tmp_path / "sentinelx.db")
+    monkeypatch.setattr(settings, "JOBS_DATABASE_PATH", tmp_path / "jobs.db")
+    monkeypatch.setattr(settings, "JOBS_DIR", tmp_path / "jobs")
+    monkeypatch.setattr(settings, "CASES_DIR", tmp_path / "cases")
+    monkeypatch.setattr(settings, "ARCHIVE_DIR", tmp_path / "archive")
+    monkeypatch.setattr(settings, "REPORTS_DIR", tmp_path / "reports")
+    create_tables()
+    yield settings.DATABASE_PATH
+
+    close_pools()
+    for result_cache in cache._caches.values():
+        result_cache.clear()
+    graph_engine._snapshots.clear()
+
+
+@pytest.fixture
+def conn(database):
+    with pooled_connection() as connection:
+        yield connection
+
+
+@pytest.fixture
+def client(database):
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    with TestClient(app) as test_client:
+        yield test_client
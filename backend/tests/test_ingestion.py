@@ -0,0 +1,116 @@
+import pandas as pd
+import pytest
+
+from app.core.database import get_ingestion_generation
+from app.services import ingestion_service
+from app.services.ingestion_service import _parse_timestamps, ingest_multiple_files
+
+from conftest import CASE_DIR, Upload
+
+
+def _counts(conn):
+    return {
+        table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        for table in ("events", "user_risk_stats", "edge_weights", "stats_counters")
+    }
+
+
+def test_ingest_commits_events_with_aggregates(conn):
+    upload = Upload("whatsapp.csv", (CASE_DIR / "whatsapp.csv").read_bytes())
+    inserted, skipped = ingest_multiple_files(conn, [(upload, "whatsapp")])
+
+    counts = _counts(conn)
+    assert inserted == counts["events"] == 500
+    assert counts["user_risk_stats"] and counts["edge_weights"] and counts["stats_counters"]
+    assert get_ingestion_generation(conn.cursor()) == 1
+
+
+def test_failure_after_insert_rolls_back_events_and_aggregates(conn, monkeypatch):
+    def fail(cursor, since_id):
+        raise RuntimeError("aggregate refresh failed")
+
+    # Runs after the events and the other aggregates are written
+    monkeypatch.setattr(ingestion_service, "refresh_stats_counters", fail)
+
+    upload = Upload("whatsapp.csv", (CASE_DIR / "whatsapp.csv").read_bytes())
+    with pytest.raises(RuntimeError):
+        ingest_multiple_files(conn, [(upload, "whatsapp")])
+
+    assert _counts(conn) == dict.fromkeys(_counts(conn), 0)
+    assert get_ingestion_generation(conn.cursor()) == 0
+
+
+def test_failure_in_later_file_rolls_back_earlier_files(conn, monkeypatch):
+    calls = []
+    original = ingestion_service._update_aggregates
+
+    def fail_second(cursor, since_id):
+        calls.append(since_id)
+        if len(calls) == 2:
+            raise RuntimeError("second file failed")
+        original(cursor, since_id)
+
+    monkeypatch.setattr(ingestion_service, "_update_aggregates", fail_second)
+
+    pairs = [
+        (Upload("whatsapp.csv", (CASE_DIR / "whatsapp.csv").read_bytes()), "whatsapp"),
+        (Upload("calls.csv", (CASE_DIR / "calls.csv").read_bytes()), "calls"),
+    ]
+    with pytest.raises(RuntimeError):
+        ingest_multiple_files(conn, pairs)
+
+    assert _counts(conn)["events"] == 0
+    assert _counts(conn)["user_risk_stats"] == 0
+
+
+def _parse(values):
+    skip_reasons = []
+    df, fmt = _parse_timestamps(pd.DataFrame({"timestamp": values}), "f.csv", skip_reasons)
+    return df["timestamp"].tolist(), fmt
+
+
+def test_offset_timestamps_become_naive_utc():
+    stamps, _ = _parse(["2024-01-01T10:00:00+05:30"] * 5)
+    assert stamps == [pd.Timestamp("2024-01-01 04:30:00")] * 5
+
+
+def test_mixed_offsets_in_one_column():
+    stamps, _ = _parse(["2024-01-01T10:00:00+05:30", "2024-01-01T10:00:00-04:00"])
+    assert stamps == [pd.Timestamp("2024-01-01 04:30:00"), pd.Timestamp("2024-01-01 14:00:00")]
+
+
+def test_offset_row_in_plain_column():
+    stamps, fmt = _parse(["2024-01-01 10:00:00"] * 20 + ["2024-01-01T10:00:00+05:30"])
+    assert fmt == "%Y-%m-%d %H:%M:%S"
+    assert stamps[0] == pd.Timestamp("2024-01-01 10:00:00")
+    assert stamps[-1] == pd.Timestamp("2024-01-01 04:30:00")
+
+
+def test_ambiguous_day_month_parses_day_first():
+    # Valid as dd/mm and mm/dd: TIMESTAMP_FORMATS order decides, day first
+    stamps, fmt = _parse(["05/01/2024 10:00:00"] * 9 + ["2024-01-02 10:00:00"])
+    assert fmt == "%d/%m/%Y %H:%M:%S"
+    assert stamps[0] == pd.Timestamp("2024-01-05 10:00:00")
+    assert stamps[-1] == pd.Timestamp("2024-01-02 10:00:00")
+
+
+def test_upload_with_offset_timestamps(client):
+    offsets = (
+        "message_id,sender,receiver,timestamp,message_text,deleted_flag,language\n"
+        "o1,9000000001,9000000002,2024-01-01T10:00:00+05:30,cash,0,en\n"
+        "o2,9000000002,9000000001,2024-01-01T11:00:00+05:30,ok,0,en\n"
+    )
+    files = [
+        ("files", ("whatsapp.csv", (CASE_DIR / "whatsapp.csv").read_bytes())),
+        ("files", ("offsets.csv", offsets.encode())),
+    ]
+    response = client.post(
+        "/upload/multiple", files=files, data={"source_types": "whatsapp,whatsapp"}
+    )
+    assert response.status_code == 200, response.text
+
+    assert client.get("/stats/").json()["total_events"] == 502
+    events = client.get("/timeline/?actor_id=9000000001").json()["events"]
+    assert [event["timestamp"] for event in events] == [
+        "2024-01-01 04:30:00", "2024-01-01 05:30:00"
+    ]
@@ -0,0 +1,46 @@
+import time
+from contextlib import contextmanager
+
+import pytest
+
+from app.routers import report, upload
+
+from conftest import CASE_DIR
+
+
+@contextmanager
+def _no_connection(*args, **kwargs):
+    raise AssertionError("background request checked out a connection")
+    yield
+
+
+def _wait(client, job_id):
+    for _ in range(200):
+        job = client.get(f"/jobs/{job_id}").json()
+        if job["status"] not in ("queued", "running"):
+            return job
+        time.sleep(0.05)
+    pytest.fail(f"job {job_id} did not finish")
+
+
+def test_background_upload_takes_no_request_connection(client, monkeypatch):
+    monkeypatch.setattr(upload, "pooled_connection", _no_connection)
+    response = client.post(
+        "/upload/multiple",
+        params={"background": True},
+        files=[("files", ("whatsapp.csv", (CASE_DIR / "whatsapp.csv").read_bytes()))],
+        data={"source_types": "whatsapp"},
+    )
+    assert response.status_code == 200, response.text
+    assert response.json()["status"] == "queued"
+
+    assert _wait(client, response.json()["job_id"])["status"] == "succeeded"
+    assert client.get("/stats/").json()["total_events"] == 500
+
+
+def test_background_report_takes_no_request_connection(client, monkeypatch):
+    monkeypatch.setattr(report, "case_connection", _no_connection)
+    response = client.get("/report/", params={"background": True})
+    assert response.status_code == 200, response.text
+
+    assert _wait(client, response.json()["job_id"])["status"] == "succeeded"
@@ -0,0 +1,77 @@
+import json
+
+import pandas as pd
+import pytest
+
+from app.core.migrations import _compact_metadata
+from app.services.ingestion_service import (
+    SOURCE_MAPPINGS, _normalize_frame, _parse_timestamps, mapped_fields
+)
+from app.utils.helpers import (
+    METADATA_COMPRESS_MIN_BYTES, decode_metadata, encode_metadata
+)
+
+from conftest import CASE_DIR
+
+
+def _unmapped(record, source_type):
+    """The fields metadata should hold, as JSON would return them."""
+    drop = mapped_fields(source_type)
+    extra = {key: value for key, value in record.items() if key not in drop and value is not None}
+    return json.loads(json.dumps(extra, default=str))
+
+
+@pytest.mark.parametrize("source_type", list(SOURCE_MAPPINGS))
+def test_metadata_round_trips_per_source(source_type):
+    raw = pd.read_csv(CASE_DIR / f"{source_type}.csv")
+    records = raw.astype(object).where(raw.notna(), None).to_dict("records")
+
+    df, _ = _parse_timestamps(raw.copy(), f"{source_type}.csv", [])
+    events = _normalize_frame(df, source_type)
+
+    assert len(events) == len(records)
+    for record, metadata in zip(records, events["metadata"]):
+        expected = _unmapped(record, source_type)
+        if not expected:
+            assert metadata is None
+            continue
+        assert decode_metadata(metadata) == expected
+        assert not set(decode_metadata(metadata)) & mapped_fields(source_type)
+
+
+def test_short_record_is_plain_json():
+    encoded = encode_metadata({"app_name": "UPI", "empty": None})
+    assert encoded == b'{"app_name":"UPI"}'
+    assert decode_metadata(encoded) == {"app_name": "UPI"}
+
+
+def test_long_record_is_compressed():
+    record = {"note": "transfer " * 40, "amount": 1500, "status": "SUCCESS"}
+    encoded = encode_metadata(record)
+    assert len(json.dumps(record)) >= METADATA_COMPRESS_MIN_BYTES
+    assert not encoded.startswith(b"{")
+    assert len(encoded) < len(json.dumps(record))
+    assert decode_metadata(encoded) == record
+
+
+def test_empty_record_is_null():
+    assert encode_metadata({}) is None
+    assert encode_metadata({"a": None}) is None
+    assert decode_metadata(None) == {}
+
+
+def test_migration_compacts_full_records(conn):
+    record = {
+        "transaction_id": "t1", "upi_id": "a@upi", "sender_number": "9000000001",
+        "receiver_number": "9000000002", "amount": 250, "timestamp": "2024-01-01 10:00:00",
+        "status": "SUCCESS", "note": "rent " * 30,
+    }
+    conn.execute(
+        "INSERT INTO events (event_id, source_type, timestamp, metadata) VALUES (?, ?, ?, ?)",
+        ("t1", "upi_transactions", record["timestamp"], json.dumps(record))
+    )
+    _compact_metadata(conn.cursor())
+
+    stored = conn.execute("SELECT metadata FROM events WHERE event_id = 't1'").fetchone()[0]
+    assert decode_metadata(stored) == _unmapped(record, "upi_transactions")
+    assert not stored.startswith(b"{")
@@ -0,0 +1,72 @@
+import pytest
+
+from app.core import migrations
+from app.core.database import create_tables, pooled_connection
+from app.core.migrations import MIGRATIONS, _drop_redundant_indexes, apply_migrations
+from app.services import job_service
+from app.services.job_service import JOBS_MIGRATIONS, _jobs_db
+
+REDUNDANT = {
+    "idx_events_case_timestamp", "idx_events_source_timestamp",
+    "idx_events_deleted", "idx_events_case_stats",
+}
+
+
+def _indexes(conn):
+    return {
+        row[0] for row in
+        conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")
+    }
+
+
+def test_fresh_database_has_no_redundant_indexes(conn):
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(MIGRATIONS)
+    assert not _indexes(conn) & REDUNDANT
+
+
+# Rebuilds run today's code, which needs the epoch columns of migration 4
+@pytest.mark.parametrize("applied", [4, MIGRATIONS.index(_drop_redundant_indexes)])
+def test_upgrade_from_intermediate_version(database, monkeypatch, applied):
+    path = database.parent / "intermediate.db"
+    with monkeypatch.context() as patch:
+        patch.setattr(migrations, "MIGRATIONS", MIGRATIONS[:applied])
+        create_tables(path)
+
+    with pooled_connection(path) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == applied
+        # A database versioned against a list that skipped the drops
+        conn.execute("CREATE INDEX idx_events_case_timestamp ON events (case_id, timestamp)")
+        conn.execute("CREATE INDEX idx_events_case_stats ON events (case_id, source_type)")
+        conn.commit()
+
+        assert apply_migrations(conn) == len(MIGRATIONS)
+        assert not _indexes(conn) & REDUNDANT
+        assert {"idx_events_case_epoch", "idx_events_actor"} <= _indexes(conn)
+
+
+def test_main_database_has_no_jobs_table(conn):
+    assert not conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name = 'jobs'"
+    ).fetchone()
+
+
+def test_jobs_database_is_versioned(database):
+    with _jobs_db() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(JOBS_MIGRATIONS)
+        assert "idx_jobs_status" in _indexes(conn)
+
+
+def test_unversioned_jobs_database_keeps_its_jobs(database, monkeypatch):
+    # A jobs.db whose table was created before it had a user_version
+    with pooled_connection(database.parent / "jobs.db") as conn:
+        job_service._create_jobs(conn.cursor())
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, created_at, updated_at) "
+            "VALUES ('j1', 'report', 'done', '', '')"
+        )
+        conn.commit()
+    monkeypatch.setattr(job_service, "_jobs_ready", set())
+
+    with _jobs_db() as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == len(JOBS_MIGRATIONS)
+        assert [row[0] for row in conn.execute("SELECT id FROM jobs")] == ["j1"]
@@ -0,0 +1,13 @@
+import pytest
+
+from manage import QUERY_PLAN_CHECKS, missing_plan_fragments, query_plan
+
+
+@pytest.mark.parametrize(
+    "sql, params, fragments",
+    [(sql, params, fragments) for _, (sql, params), fragments in QUERY_PLAN_CHECKS],
+    ids=[description for description, _, _ in QUERY_PLAN_CHECKS],
+)
+def test_query_uses_its_index(conn, sql, params, fragments):
+    details = query_plan(conn, sql, params)
+    assert not missing_plan_fragments(details, fragments), details
@@ -0,0 +1,89 @@
+import pytest
+
+from app.services.timeline_service import MAX_PAGE_SIZE, fts_match_query
+
+MESSAGES = """message_id,sender,receiver,timestamp,message_text,deleted_flag,language
+m1,9000000001,9000000002,2024-01-01 10:00:00,send the cash now,0,en
+m2,9000000001,9000000002,2024-01-01 11:00:00,cashback offer,0,en
+m3,9000000002,9000000001,2024-01-01 12:00:00,call +919876543210 now,0,en
+m4,9000000002,9000000001,2024-01-01 13:00:00,mail a@b.com today,0,en
+m5,9000000001,9000000002,2024-01-01 14:00:00,payment and transfer,0,en
+m6,9000000002,9000000001,2024-01-01 15:00:00,"say ""hi"" AND bye",0,en
+"""
+
+
+@pytest.fixture
+def timeline(client):
+    response = client.post(
+        "/upload/multiple",
+        files=[("files", ("messages.csv", MESSAGES.encode()))],
+        data={"source_types": "whatsapp"},
+    )
+    assert response.status_code == 200, response.text
+
+    def search(keyword):
+        response = client.get("/timeline/", params={"keyword": keyword})
+        assert response.status_code == 200, response.text
+        return [event["event_id"] for event in response.json()["events"]]
+
+    return search
+
+
+@pytest.mark.parametrize("keyword, expected", [
+    # Operator syntax passes through when it parses
+    ("pay*", "pay*"),
+    ('"cash now"', '"cash now"'),
+    ("cash OR wire", "cash OR wire"),
+    ("message_text:cash", "message_text:cash"),
+    # Anything else is matched as quoted terms, all required
+    ("cash", '"cash"'),
+    ("cash now", '"cash" "now"'),
+    ("+919876543210", '"+919876543210"'),
+    ("a@b", '"a@b"'),
+    ("a AND", '"a" "AND"'),
+    ('"', '""""'),
+    ('say "hi', '"say" """hi"'),
+    ("   ", ""),
+])
+def test_fts_match_query(keyword, expected):
+    assert fts_match_query(keyword) == expected
+
+
+def test_keyword_matches_whole_tokens(timeline):
+    # Token matching: cash no longer matches cashback, cash* does
+    assert timeline("cash") == ["m1"]
+    assert timeline("cash*") == ["m1", "m2"]
+    assert timeline("cashback") == ["m2"]
+
+
+def test_keyword_operators(timeline):
+    assert timeline("cash OR payment") == ["m1", "m5"]
+    assert timeline('"payment and transfer"') == ["m5"]
+    assert timeline("now NOT cash") == ["m3"]
+
+
+def test_keyword_without_fts_syntax(timeline):
+    assert timeline("+919876543210") == ["m3"]
+    assert timeline("a@b.com") == ["m4"]
+    assert timeline("a AND") == []
+    assert timeline('"') == []
+    assert timeline('"hi" AND') == ["m6"]
+
+
+def test_blank_keyword_is_no_filter(timeline):
+    assert len(timeline("   ")) == 6
+
+
+def test_page_limit_above_max_is_rejected(client):
+    response = client.get("/timeline/", params={"limit": MAX_PAGE_SIZE + 1})
+    assert response.status_code == 422
+    assert "ndjson" in response.json()["detail"]
+
+    assert client.get("/timeline/", params={"limit": MAX_PAGE_SIZE}).status_code == 200
+    assert client.get("/timeline/", params={"limit": 0}).status_code == 422
+
+
+def test_export_limit_is_not_capped(timeline, client):
+    response = client.get("/timeline/", params={"format": "ndjson", "limit": MAX_PAGE_SIZE + 1})
+    assert response.status_code == 200
+    assert len(response.text.splitlines()) == 6